@@ -10,12 +10,13 @@
 # from __future__ import absolute_import, division, print_function, unicode_literals
 
 import argparse
+import collections
 import json
+import multiprocessing
 import os
 import sys
 import itertools
 
-import matplotlib.patches as patches
 import numpy as np
 from eppy.modeleditor import IDF
 from scipy.spatial import Delaunay
@@ -197,6 +198,244 @@ def rotate(origin, point, angle_rad):
     return q_x, q_y
 
 
+def points_in_polygon(points, polygon, edge_offset=0, chunk_size=10000):
+    """
+    Test which 2D points are inside a polygon and at least edge_offset away from its edges, for all the points at once
+    :type points: [[x, y], ...] array of points to test
+    :type polygon: [[x, y], ...] array of the polygon vertices in order, without repeating the first vertex
+    :type edge_offset: Minimum distance from the points to the edges of the polygon
+    :type chunk_size: Number of points to test at once, limiting the (points x edges) arrays held in memory
+    :return: Boolean array with True for the points inside the polygon
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    start = np.asarray(polygon, dtype=float)[:, :2]
+    end = np.roll(start, -1, axis=0)
+    edge = end - start
+    edge_length_sq = np.maximum((edge * edge).sum(axis=1), 1e-12)
+
+    inside = np.zeros(len(points), dtype=bool)
+    for n in range(0, len(points), chunk_size):
+        x = points[n:n + chunk_size, 0:1]
+        y = points[n:n + chunk_size, 1:2]
+
+        # Even-odd rule: count the edges crossed by a ray from each point towards +x
+        crosses = (start[:, 1] > y) != (end[:, 1] > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = start[:, 0] + (y - start[:, 1]) * edge[:, 0] / edge[:, 1]
+        chunk_inside = (crosses & (x < x_cross)).sum(axis=1) % 2 == 1
+
+        # Distance from each point to the closest point on each edge
+        if edge_offset > 0:
+            t = np.clip(((x - start[:, 0]) * edge[:, 0] + (y - start[:, 1]) * edge[:, 1]) / edge_length_sq, 0, 1)
+            dx = start[:, 0] + t * edge[:, 0] - x
+            dy = start[:, 1] + t * edge[:, 1] - y
+            chunk_inside &= ((dx * dx + dy * dy).min(axis=1) >= edge_offset ** 2)
+
+        inside[n:n + chunk_size] = chunk_inside
+    return inside
+
+
+def floor_grid_points(vertices, grid_size, edge_offset, surface_offset):
+    """
+    Generate analysis points over a floor surface, on a grid centred in the floor's bounding box
+    :type vertices: [[x, y, z], ...] array of the floor surface vertices
+    :type grid_size: Spacing between the analysis points
+    :type edge_offset: Minimum distance from the analysis points to the edges of the floor
+    :type surface_offset: Height of the analysis points above the floor
+    :return: (n, 3) array of analysis point coordinates, following the slope of non-horizontal floors
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    min_xy = vertices[:, :2].min(axis=0) + edge_offset
+    max_xy = vertices[:, :2].max(axis=0) - edge_offset
+    if np.any(max_xy < min_xy):
+        return np.empty((0, 3))
+
+    # Centre the grid in the bounding box so the spare space is split equally between opposite edges
+    counts = np.floor((max_xy - min_xy) / grid_size + 1e-9).astype(int) + 1
+    starts = min_xy + (max_xy - min_xy - (counts - 1) * grid_size) / 2
+    x, y = np.meshgrid(starts[0] + np.arange(counts[0]) * grid_size, starts[1] + np.arange(counts[1]) * grid_size)
+    xy = np.column_stack([x.ravel(), y.ravel()])
+    xy = xy[points_in_polygon(xy, vertices[:, :2], edge_offset)]
+
+    # Height of the floor plane under each point from the (Newell) surface normal
+    normal = np.cross(vertices, np.roll(vertices, -1, axis=0)).sum(axis=0)
+    if abs(normal[2]) > 1e-9 * np.linalg.norm(normal):
+        z = vertices[:, 2].mean() - (normal[0] * (xy[:, 0] - vertices[:, 0].mean()) + normal[1] * (
+            xy[:, 1] - vertices[:, 1].mean())) / normal[2]
+    else:
+        z = np.repeat(vertices[:, 2].max(), len(xy))
+    return np.column_stack([xy, z + surface_offset])
+
+
+def fenestration_index(fenestration_objects):
+    """
+    Group fenestration objects by the name of the surface they are hosted in
+    :type fenestration_objects: List of FENESTRATIONSURFACE:DETAILED IDF objects
+    :return: Dictionary of {Building_Surface_Name: [fenestration objects]}
+    """
+    index = collections.defaultdict(list)
+    for fen in fenestration_objects:
+        index[fen.Building_Surface_Name].append(fen)
+    return index
+
+
+def define_materials(config):
+    """
+    Define the Radiance materials applied to the surfaces from the construction properties in the config file
+    :type config: Dictionary of construction reflectances and glazing transmissivities
+    :return: Dictionary of {material role: Radiance material}
+    """
+    glass_transmittance = config["glass_visible_transmittance"]
+    return {
+        "glass_exterior": Glass("GlassMaterialExterior", r_transmittance=glass_transmittance, g_transmittance=glass_transmittance, b_transmittance=glass_transmittance, refraction_index=1.52),
+        "glass_interior": Glass("GlassMaterialInternal", r_transmittance=0.9, g_transmittance=0.9, b_transmittance=0.9, refraction_index=1.52),
+        "glass_skylight": Glass("GlassMaterialSkylight", r_transmittance=glass_transmittance, g_transmittance=glass_transmittance, b_transmittance=glass_transmittance, refraction_index=1.52),
+        "air_wall": Glass("AirWallMaterial", r_transmittance=0, g_transmittance=0, b_transmittance=0, refraction_index=1),
+        "wall": Plastic("WallMaterial", r_reflectance=config["wall_reflectivity"], g_reflectance=config["wall_reflectivity"], b_reflectance=config["wall_reflectivity"], specularity=0, roughness=0),
+        "ceiling": Plastic("CeilingMaterial", r_reflectance=config["ceiling_reflectivity"], g_reflectance=config["ceiling_reflectivity"], b_reflectance=config["ceiling_reflectivity"], specularity=0, roughness=0),
+        "floor": Plastic("FloorMaterial", r_reflectance=config["floor_reflectivity"], g_reflectance=config["floor_reflectivity"], b_reflectance=config["floor_reflectivity"], specularity=0, roughness=0)
+    }
+
+
+SURFACE_CATEGORIES = {
+    "Interior Wall": "interior_wall", "Exterior Wall": "exterior_wall", "Interior Floor": "floor",
+    "Exterior Floor": "floor", "Exposed Floor": "floor", "Interior Ceiling": "ceiling",
+    "Exterior Ceiling": "ceiling", "Roof": "ceiling"
+}
+"""Category of the BUILDINGSURFACE:DETAILED objects converted to Radiance surfaces, by construction name"""
+
+
+def convert_zone_surfaces(surfaces, materials):
+    """
+    Convert the surfaces of a zone and the fenestration hosted in them into HBSurfaces
+    :type surfaces: List of (category, number in category, name, coords, [(fenestration name, coords), ...]) tuples
+    :type materials: Dictionary of materials from define_materials
+    :return: Dictionary of {category: [HBSurfaces]}, with the fenestration under "fenestration"
+    """
+    surface_conversions = {
+        "interior_wall": ("wall", 0, materials["wall"], materials["glass_interior"]),
+        "exterior_wall": ("wall", 0, materials["wall"], materials["glass_exterior"]),
+        "floor": ("floor", 2, materials["floor"], materials["glass_skylight"]),
+        "ceiling": ("ceiling", 3, materials["ceiling"], materials["glass_skylight"])
+    }
+    hb_surfaces = collections.defaultdict(list)
+    for category, srf_n, srf_name, srf_coords, fenestration in surfaces:
+        prefix, surface_type, material, glass_material = surface_conversions[category]
+
+        fen_coords = []
+        for fen_name, coords in fenestration:
+            fen_coords.append(coords)
+            hb_surfaces["fenestration"].append(HBSurface("fenestration_{0:}".format(fen_name), coords, surface_type=5,
+                                                         is_name_set_by_user=True, is_type_set_by_user=True,
+                                                         rad_properties=RadianceProperties(material=glass_material)))
+        try:
+            for i_n, i in enumerate(triangulate_3d_surfaces(srf_coords, fen_coords)):
+                hb_surfaces[category].append(
+                    HBSurface("{0:}_{1:}_{2:}_srfP_{3:}".format(prefix, srf_n, srf_name, i_n), i.tolist(),
+                              surface_type=surface_type, is_name_set_by_user=True, is_type_set_by_user=True,
+                              rad_properties=RadianceProperties(material=material)))
+        except Exception:
+            hb_surfaces[category].append(
+                HBSurface("{0:}_{1:}_{2:}".format(prefix, srf_n, srf_name), np.array(srf_coords).tolist(),
+                          surface_type=surface_type, is_name_set_by_user=True, is_type_set_by_user=True,
+                          rad_properties=RadianceProperties(material=material)))
+    return hb_surfaces
+
+
+def write_analysis_grid(hb_analysis_grid, output_directory):
+    """
+    Write an analysis grid to a JSON file in the AnalysisGrids folder of the output directory
+    :type hb_analysis_grid: Honeybee AnalysisGrid
+    :type output_directory: Path to the target output directory
+    :return: Path to the analysis grid JSON file
+    """
+    analysis_grid_path = "{0:}/AnalysisGrids/{1:}.json".format(output_directory, hb_analysis_grid.name)
+    with open(analysis_grid_path, "w") as f:
+        json.dump({"analysis_grids": [hb_analysis_grid.to_json()]}, f)
+    return analysis_grid_path
+
+
+def zone_case(task):
+    """
+    Convert the surfaces of a zone and generate its analysis grid, writing the analysis grid to disk once it is
+    complete so only its size is sent back. Takes a single tuple so it can be mapped over a process pool.
+    :type task: (zone name, surfaces as in convert_zone_surfaces, [floor coords, ...], config,
+        (grid size, edge offset, surface offset) or None to skip the analysis grid, output directory)
+    :return: Zone name, {category: [surface JSON dictionaries]}, number of analysis points, analysis grid path
+    """
+    zone_name, surfaces, floors, config, grid_settings, output_directory = task
+    hb_surfaces = convert_zone_surfaces(surfaces, define_materials(config))
+    surface_jsons = dict((category, [i.to_json() for i in srfs]) for category, srfs in hb_surfaces.items())
+
+    if grid_settings is None or not floors:
+        return zone_name, surface_jsons, None, None
+
+    # Combine the points of zones with floors on several levels into a single grid
+    analysis_points = np.concatenate([floor_grid_points(coords, *grid_settings) for coords in floors])
+    if not len(analysis_points):
+        return zone_name, surface_jsons, 0, None
+    hb_analysis_grid = AnalysisGrid.from_points_and_vectors(analysis_points.tolist(), name=zone_name)
+    return zone_name, surface_jsons, len(analysis_points), write_analysis_grid(hb_analysis_grid, output_directory)
+
+
+class SurfacesWriter(object):
+    """
+    Write surface JSON dictionaries to a surfaces.json file one at a time, so the document is never built in memory.
+    Each material is written once to a materials list at the end of the file and the surfaces reference it by name.
+    :type file_path: Path to the surfaces JSON file
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.count = 0
+        self.materials = collections.OrderedDict()
+        self._file = None
+        # Radiance material values are RadianceNumberType objects which are written as their float values
+        self._encoder = json.JSONEncoder(separators=(",", ":"), default=float)
+
+    def __enter__(self):
+        self._file = open(self.file_path, "w")
+        self._file.write('{"surfaces":[')
+        return self
+
+    def write(self, surface_json):
+        """
+        Encode a surface JSON dictionary and append it to the surfaces list, replacing its material with the name of
+        the material in the materials list
+        :type surface_json: Dictionary from HBSurface.to_json
+        """
+        material_json = surface_json.get("surface_material")
+        if isinstance(material_json, dict):
+            material_name = material_json["name"]
+            if self.materials.setdefault(material_name, material_json) != material_json:
+                raise ValueError("Surface {0:} has a different definition for material {1:}".format(surface_json["name"], material_name))
+            surface_json = dict(surface_json, surface_material=material_name)
+
+        if self.count:
+            self._file.write(",")
+        self._write_json(surface_json)
+        self.count += 1
+
+    def _write_json(self, json_object):
+        for chunk in self._encoder.iterencode(json_object):
+            self._file.write(chunk)
+
+    def _write_materials(self):
+        self._file.write('],"materials":[')
+        for material_n, material_json in enumerate(self.materials.values()):
+            if material_n:
+                self._file.write(",")
+            self._write_json(material_json)
+        self._file.write("]}")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self._write_materials()
+        finally:
+            self._file.close()
+
+
 def str2bool(v):
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
         return True
@@ -281,6 +520,13 @@ if __name__ == "__main__":
         help="How many points to be included in each 3d grid matrix chunk!",
         default=1000
     )
+    parser.add_argument(
+        "-n",
+        "--processes",
+        type=int,
+        help="Optional number of processes to convert the zones with (default is 1)",
+        default=1
+    )
 
     args = parser.parse_args()
 
@@ -293,6 +539,7 @@ if __name__ == "__main__":
     edge_offset = args.edgeOffset
     full_building = args.fullBuilding
     chunk_size = args.chunkSize
+    processes = args.processes
 
 
 
@@ -319,105 +566,11 @@ if __name__ == "__main__":
     print("North angle has been read as {0:}".format(north_angle_rad))
 
     # Define materials to be applied to surfaces
-    glass_material_exterior = Glass("GlassMaterialInternal", r_transmittance=config["glass_visible_transmittance"], g_transmittance=config["glass_visible_transmittance"], b_transmittance=config["glass_visible_transmittance"], refraction_index=1.52)
-    glass_material_interior = Glass("GlassMaterialInternal", r_transmittance=0.9, g_transmittance=0.9, b_transmittance=0.9, refraction_index=1.52)
-    glass_material_skylight = Glass("GlassMaterialSkylight", r_transmittance=config["glass_visible_transmittance"], g_transmittance=config["glass_visible_transmittance"], b_transmittance=config["glass_visible_transmittance"], refraction_index=1.52)
-    air_wall_material = Glass("AirWallMaterial", r_transmittance=0, g_transmittance=0, b_transmittance=0, refraction_index=1)
-    wall_material = Plastic("WallMaterial", r_reflectance=config["wall_reflectivity"], g_reflectance=config["wall_reflectivity"], b_reflectance=config["wall_reflectivity"], specularity=0, roughness=0)
-    ceiling_material = Plastic("CeilingMaterial", r_reflectance=config["ceiling_reflectivity"], g_reflectance=config["ceiling_reflectivity"], b_reflectance=config["ceiling_reflectivity"], specularity=0, roughness=0)
-    floor_material = Plastic("FloorMaterial", r_reflectance=config["floor_reflectivity"], g_reflectance=config["floor_reflectivity"], b_reflectance=config["floor_reflectivity"], specularity=0, roughness=0)
+    materials = define_materials(config)
     print("Materials defined from properties in {0:}".format(os.path.normpath(configuration_file_path)))
 
-    # Define surfaces for radiation oclusion
-    fenestration_surfaces = []
-    interior_wall_surfaces = []
-    for wall_n, wall in enumerate([i for i in idf.idfobjects["BUILDINGSURFACE:DETAILED"] if i.Construction_Name == "Interior Wall"]):
-        fen_coords = []
-        for fen_n, fen in enumerate(idf.idfobjects["FENESTRATIONSURFACE:DETAILED"]):
-            if wall.Name in fen.Name:
-                fen_coords.append(fen.coords)
-                fenestration_surfaces.append(HBSurface("fenestration_{0:}".format(fen.Name), fen_coords, surface_type=5,
-                                                       is_name_set_by_user=True, is_type_set_by_user=True,
-                                                       rad_properties=RadianceProperties(
-                                                           material=glass_material_interior)))
-        try:
-            for i_n, i in enumerate(triangulate_3d_surfaces(wall.coords, fen_coords)):
-                interior_wall_surfaces.append(
-                    HBSurface("wall_{0:}_{1:}_srfP_{2:}".format(wall_n, wall.Name, i_n), i.tolist(), surface_type=0,
-                              is_name_set_by_user=True, is_type_set_by_user=True,
-                              rad_properties=RadianceProperties(material=wall_material)))
-        except:
-            interior_wall_surfaces.append(
-                HBSurface("wall_{0:}_{1:}".format(wall_n, wall.Name), np.array(wall.coords).tolist(), surface_type=0,
-                          is_name_set_by_user=True, is_type_set_by_user=True,
-                          rad_properties=RadianceProperties(material=wall_material)))
-    print("{0:} interior wall surfaces generated".format(len(interior_wall_surfaces)))
-
-    exterior_wall_surfaces = []
-    for wall_n, wall in enumerate([i for i in idf.idfobjects["BUILDINGSURFACE:DETAILED"] if i.Construction_Name == "Exterior Wall"]):
-        fen_coords = []
-        for fen_n, fen in enumerate(idf.idfobjects["FENESTRATIONSURFACE:DETAILED"]):
-            if wall.Name in fen.Name:
-                fen_coords.append(fen.coords)
-                fenestration_surfaces.append(HBSurface("fenestration_{0:}".format(fen.Name), fen_coords, surface_type=5,
-                                                       is_name_set_by_user=True, is_type_set_by_user=True,
-                                                       rad_properties=RadianceProperties(
-                                                           material=glass_material_exterior)))
-        try:
-            for i_n, i in enumerate(triangulate_3d_surfaces(wall.coords, fen_coords)):
-                exterior_wall_surfaces.append(
-                    HBSurface("wall_{0:}_{1:}_srfP_{2:}".format(wall_n, wall.Name, i_n), i.tolist(), surface_type=0,
-                              is_name_set_by_user=True, is_type_set_by_user=True,
-                              rad_properties=RadianceProperties(material=wall_material)))
-        except:
-            exterior_wall_surfaces.append(
-                HBSurface("wall_{0:}_{1:}".format(wall_n, wall.Name), np.array(wall.coords).tolist(), surface_type=0,
-                          is_name_set_by_user=True, is_type_set_by_user=True,
-                          rad_properties=RadianceProperties(material=wall_material)))
-    print("{0:} exterior wall surfaces generated".format(len(exterior_wall_surfaces)))
-
-    floor_surfaces = []
-    for wall_n, wall in enumerate([i for i in idf.idfobjects["BUILDINGSURFACE:DETAILED"] if (
-            (i.Construction_Name == "Interior Floor") or (i.Construction_Name == "Exterior Floor") or (
-            i.Construction_Name == "Exposed Floor"))]):
-        fen_coords = []
-        fenestration_surfaces.append(HBSurface("fenestration_{0:}".format(fen.Name), fen_coords, surface_type=0, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=glass_material_skylight)))
-        for fen_n, fen in enumerate(idf.idfobjects["FENESTRATIONSURFACE:DETAILED"]):
-            if wall.Name in fen.Name:
-                fen_coords.append(fen.coords)
-        try:
-            for i_n, i in enumerate(triangulate_3d_surfaces(wall.coords, fen_coords)):
-                floor_surfaces.append(HBSurface("floor_{0:}_{1:}_srfP_{2:}".format(wall_n, wall.Name, i_n), i.tolist(), surface_type=2, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=floor_material)))
-        except:
-            floor_surfaces.append(HBSurface("floor_{0:}_{1:}".format(wall_n, wall.Name), np.array(wall.coords).tolist(), surface_type=2, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=floor_material)))
-    print("{0:} floor surfaces generated".format(len(floor_surfaces)))
-
-    ceiling_surfaces = []
-    for wall_n, wall in enumerate([i for i in idf.idfobjects["BUILDINGSURFACE:DETAILED"] if ((i.Construction_Name == "Interior Ceiling") or (i.Construction_Name == "Exterior Ceiling") or (i.Construction_Name == "Roof"))]):
-        fen_coords = []
-        fenestration_surfaces.append(HBSurface("fenestration_{0:}".format(fen.Name), fen_coords, surface_type=0, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=glass_material_skylight)))
-        for fen_n, fen in enumerate(idf.idfobjects["FENESTRATIONSURFACE:DETAILED"]):
-            if wall.Name in fen.Name:
-                fen_coords.append(fen.coords)
-        try:
-            for i_n, i in enumerate(triangulate_3d_surfaces(wall.coords, fen_coords)):
-                ceiling_surfaces.append(HBSurface("ceiling_{0:}_{1:}_srfP_{2:}".format(wall_n, wall.Name, i_n), i.tolist(), surface_type=3, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=ceiling_material)))
-        except:
-            ceiling_surfaces.append(HBSurface("ceiling_{0:}_{1:}".format(wall_n, wall.Name), np.array(wall.coords).tolist(), surface_type=3, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=ceiling_material)))
-    print("{0:} ceiling surfaces generated".format(len(ceiling_surfaces)))
-
-    context_surfaces = []
-    for context_n, context in enumerate([i for i in idf.idfobjects["SHADING:BUILDING:DETAILED"]]):
-        srf = HBSurface("context_{0:}_{1:}".format(context_n, context.Name), context.coords, surface_type=6, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=wall_material))
-        context_surfaces.append(srf)
-    print("{0:} shading surfaces generated".format(len(context_surfaces)))
-
-    print("{0:} fenestration surfaces generated".format(len(fenestration_surfaces)))
-    hb_objects = np.concatenate([exterior_wall_surfaces, interior_wall_surfaces, floor_surfaces, ceiling_surfaces, context_surfaces, fenestration_surfaces]).tolist()
-
     # Generate an output directory to store the JSON recipe constituent parts
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    if not os.path.exists("{0:}/AnalysisGrids".format(output_directory)):
         os.makedirs("{0:}/AnalysisGrids".format(output_directory))
     print("Output directory set to {0:}\\AnalysisGrids".format(os.path.normpath(output_directory)))
 
@@ -447,43 +600,77 @@ if __name__ == "__main__":
 
         response = raw_input("Do you want to continue? [y/N]: ")
         if response == "y":
-            hb_analysis_grids = []
+            # Write each analysis grid as soon as it is generated rather than keeping them all in memory
             for n, c in enumerate(chunked_points):
-                hb_analysis_grids.append(AnalysisGrid.from_points_and_vectors(c, name="gridmatrix{0:04d}".format(n)))
-                print("Analysis grid_file for gridmatrix{0:04d} generated ({1:} points)".format(n, len(c)))
+                analysis_grid_path = write_analysis_grid(
+                    AnalysisGrid.from_points_and_vectors(c, name="gridmatrix{0:04d}".format(n)), output_directory)
+                print("Analysis grid_file for gridmatrix{0:04d} generated ({1:} points) and written to {2:}".format(n, len(c), os.path.normpath(analysis_grid_path)))
         elif response != "y":
             raise RuntimeError("You didn't continue. Good for you.")
             sys.exit(1)
+        grid_settings = None
 
     else:
         print("Generating a 2D Radiance case")
+        # Analysis grids are generated for each zone along with its surfaces
+        grid_settings = (grid_size, edge_offset, surface_offset)
     # TODO: UNDER CONSTRUCTION
 
-        # Define analysis grids for each zone for simulation in Radiance
-        hb_analysis_grids = []
-        for floor_srf in [i for i in idf.idfobjects["BUILDINGSURFACE:DETAILED"] if ("Floor" in i.Construction_Name)]:
-            vert_xs, vert_ys, vert_zs = list(zip(*floor_srf.coords))
-            patch = patches.Polygon(list(zip(*[vert_xs, vert_ys])))
-            min_x, max_x, min_y, max_y, max_z = min(vert_xs), max(vert_xs), min(vert_ys), max(vert_ys), max(vert_zs)
-            x_range = max_x - min_x
-            y_range = max_y - min_y
-            g = np.meshgrid(np.arange(min_x - (x_range / 2), max_x + (x_range / 2), grid_size),
-                            np.arange(min_y - (y_range / 2), max_y + (y_range / 2), grid_size))
-            coords = list(zip(*(c.flat for c in g)))
-            analysis_points = np.vstack([p for p in coords if patch.contains_point(p, radius=edge_offset)])
-            grid_points = list(zip(*[np.array(list(zip(*analysis_points)))[0], np.array(list(zip(*analysis_points)))[1],
-                                     np.repeat(max_z + surface_offset, len(analysis_points))]))
-            hb_analysis_grids.append(AnalysisGrid.from_points_and_vectors(grid_points, name=floor_srf.Zone_Name))
-            print("Analysis grid_file for {0:} generated ({1:} points)".format(floor_srf.Zone_Name, len(analysis_points)))
-
-    # Write the analysis grids to a directory for processing
-    for hb_analysis_grid in hb_analysis_grids:
-        analysis_grid_path = "{0:}/AnalysisGrids/{1:}.json".format(output_directory, hb_analysis_grid.name)
-        # print(analysis_grid_path)
-        with open(analysis_grid_path, "w") as f:
-            json.dump({"analysis_grids": [hb_analysis_grid.to_json()]}, f)
-        print("Analysis grid_file for {0:} written to {1:}".format(hb_analysis_grid.name, os.path.normpath(analysis_grid_path)))
-
+    # Index the fenestration by the surface they are hosted in, so each surface only visits its own windows
+    host_fenestration = fenestration_index(idf.idfobjects["FENESTRATIONSURFACE:DETAILED"])
+
+    # Collect the surfaces, their fenestration and the floors of each zone as plain data which can be sent to other
+    # processes, numbering the surfaces of each category in the order of the IDF
+    zone_surfaces = collections.OrderedDict()
+    zone_floors = collections.OrderedDict()
+    surface_counts = collections.Counter()
+    for srf in idf.idfobjects["BUILDINGSURFACE:DETAILED"]:
+        zone_surfaces.setdefault(srf.Zone_Name, [])
+        if "Floor" in srf.Construction_Name:
+            zone_floors.setdefault(srf.Zone_Name, []).append(srf.coords)
+        category = SURFACE_CATEGORIES.get(srf.Construction_Name)
+        if category is None:
+            continue
+        zone_surfaces[srf.Zone_Name].append((category, surface_counts[category], srf.Name, srf.coords, [
+            (fen.Name, fen.coords) for fen in host_fenestration.get(srf.Name, [])]))
+        surface_counts[category] += 1
+    zone_tasks = [(zone_name, surfaces, zone_floors.get(zone_name, []), config, grid_settings, output_directory)
+                  for zone_name, surfaces in zone_surfaces.items()]
+
+    # Convert the zones in a process pool, writing the surfaces of each zone to surfaces.json as soon as the zone is
+    # complete so only one zone's surfaces are held in memory at a time
+    surfaces_path = "{0:}/surfaces.json".format(os.path.normpath(output_directory))
+    category_counts = collections.Counter()
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        zone_results = pool.imap(zone_case, zone_tasks) if pool else (zone_case(task) for task in zone_tasks)
+        with SurfacesWriter(surfaces_path) as surfaces_writer:
+            for zone_name, surface_jsons, point_count, analysis_grid_path in zone_results:
+                for category in ("exterior_wall", "interior_wall", "floor", "ceiling", "fenestration"):
+                    for surface_json in surface_jsons.get(category, []):
+                        surfaces_writer.write(surface_json)
+                    category_counts[category] += len(surface_jsons.get(category, []))
+                if analysis_grid_path:
+                    print("Analysis grid_file for {0:} generated ({1:} points) and written to {2:}".format(zone_name, point_count, os.path.normpath(analysis_grid_path)))
+                elif point_count == 0:
+                    print("No analysis points fit in {0:} - no analysis grid_file generated".format(zone_name))
+
+            for context_n, context in enumerate(idf.idfobjects["SHADING:BUILDING:DETAILED"]):
+                srf = HBSurface("context_{0:}_{1:}".format(context_n, context.Name), context.coords, surface_type=6, is_name_set_by_user=True, is_type_set_by_user=True, rad_properties=RadianceProperties(material=materials["wall"]))
+                surfaces_writer.write(srf.to_json())
+                category_counts["context"] += 1
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    print("{0:} interior wall surfaces generated".format(category_counts["interior_wall"]))
+    print("{0:} exterior wall surfaces generated".format(category_counts["exterior_wall"]))
+    print("{0:} floor surfaces generated".format(category_counts["floor"]))
+    print("{0:} ceiling surfaces generated".format(category_counts["ceiling"]))
+    print("{0:} shading surfaces generated".format(category_counts["context"]))
+    print("{0:} fenestration surfaces generated".format(category_counts["fenestration"]))
+    print("\nSurfaces written to {0:}".format(os.path.normpath(surfaces_path)))
 
     # Generate sky matrix for annual analysis
     sky_matrix = SkyMatrix.from_epw_file(input_weatherfile_path, sky_density=2, north=north_angle_deg, hoys=range(0, 8760),
@@ -496,9 +683,3 @@ if __name__ == "__main__":
         json.dump({"sky_mtx": sky_matrix.to_json()}, f)
     print("Sky matrix written to {0:}".format(os.path.normpath(sky_matrix_path)))
 
-    # Write the context geometry (surfaces) around the analysis grids
-    surfaces_path = "{0:}/surfaces.json".format(os.path.normpath(output_directory))
-    with open(surfaces_path, "w") as f:
-        f.write(
-            repr({"surfaces": [i.to_json() for i in hb_objects]}).replace("'", '"').replace("(", '[').replace(")", ']'))
-    print("\nSurfaces written to {0:}".format(os.path.normpath(surfaces_path)))
@@ -4,19 +4,21 @@
 # TODO - Remove defaults from argParser
 
 import configparser
-import datetime
 import os
 import argparse
-import azure.storage.blob as azureblob
-import azure.batch.batch_service_client as batch
-import azure.batch.batch_auth as batchauth
-import azure.batch.models as batchmodels
+import json
+import common.backends
 import common.helpers
 
+# Ambient bounces (-ab) simulated at each quality setting of RunHoneybeeRadiance.py
+_AMBIENT_BOUNCES = {"low": 2, "medium": 3, "high": 6}
+# Fewest points worth simulating in a task, given the setup each task repeats
+_MIN_WORK_UNIT_POINTS = 250
+
 if __name__ == '__main__':
 
     # Obtain arguments from the script inputs
-    parser = argparse.ArgumentParser(description="Send Radiance case to Azure for simulation")
+    parser = argparse.ArgumentParser(description="Send Radiance case to Azure (or run it locally) for simulation")
     parser.add_argument(
         "-d",
         "--caseDirectory",
@@ -35,6 +37,24 @@ if __name__ == '__main__':
         type=str,
         help="ID for the job being undertaken",
         default="000000-testproject-3513")
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        help="Where to simulate the case ['azure', 'local']",
+        default="azure")
+    parser.add_argument(
+        "-lw",
+        "--localWorkers",
+        type=int,
+        help="Number of work units to simulate at once with the local backend (defaults to the core count divided by the processes per task)",
+        default=None)
+    parser.add_argument(
+        "-py",
+        "--python",
+        type=str,
+        help="Python 2 interpreter to run RunHoneybeeRadiance.py with on the local backend",
+        default="python")
     parser.add_argument(
         "-dp",
         "--deletePool",
@@ -53,6 +73,42 @@ if __name__ == '__main__':
         type=str,
         help="Delete container upon completion?",
         default="no")
+    parser.add_argument(
+        "-pid",
+        "--poolID",
+        type=str,
+        help="ID prefix of the long-lived pool/s to reuse (defaults to poolid in the config file)",
+        default=None)
+    parser.add_argument(
+        "-pc",
+        "--poolCount",
+        type=int,
+        help="Number of pools to spread the jobs across (defaults to poolcount in the config file)",
+        default=None)
+    parser.add_argument(
+        "-q",
+        "--quality",
+        type=str,
+        help="Simulation quality ['low', 'medium', 'high']",
+        default="low")
+    parser.add_argument(
+        "-wp",
+        "--workUnitPoints",
+        type=int,
+        help="Number of analysis points to simulate in each task (defaults to spreading the points evenly over all the work units the backend runs at once)",
+        default=None)
+    parser.add_argument(
+        "-ts",
+        "--taskSlots",
+        type=int,
+        help="Number of tasks to run at once on each node (defaults to the core count of the VM size divided by the processes per task)",
+        default=None)
+    parser.add_argument(
+        "-np",
+        "--processes",
+        type=int,
+        help="Number of Radiance processes each task runs its simulation on",
+        default=1)
     args = parser.parse_args()
 
     # Obtain locations of global configuration and radiance case
@@ -65,14 +121,6 @@ if __name__ == '__main__':
     config = configparser.RawConfigParser()
     config.read(config_file_path)
 
-    batch_account_key = config.get('Batch', 'batchaccountkey').replace("%", "%%")
-    batch_account_name = config.get('Batch', 'batchaccountname').replace("%", "%%")
-    batch_service_url = config.get('Batch', 'batchserviceurl').replace("%", "%%")
-    storage_account_key = config.get('Storage', 'storageaccountkey').replace("%", "%%")
-    storage_account_name = config.get('Storage', 'storageaccountname').replace("%", "%%")
-    storage_account_suffix = config.get('Storage', 'storageaccountsuffix').replace("%", "%%")
-    pool_vm_size = config.get('Default', 'poolvmsize')
-
     # Get the case details from the case_directory
     surfaces_path = os.path.join(case_directory, "surfaces.json")
     sky_matrix_path = os.path.join(case_directory, "sky_mtx.json")
@@ -80,159 +128,56 @@ if __name__ == '__main__':
 
     print("\nStarting project [{0:}]".format(project_id))
 
-    # Generate blob client
-    block_blob_client = azureblob.BlockBlobService(account_name=storage_account_name, account_key=storage_account_key, endpoint_suffix=storage_account_suffix)
-
-    # Create a blob container for this project
-    block_blob_client.create_container(project_id, fail_on_exist=False)
-
-    # Generate a SAS token to pass results back to the container
-    container_sas_token = block_blob_client.generate_container_shared_access_signature(project_id, permission=azureblob.ContainerPermissions(read=True, write=True), expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=24), )
-
-    print("\nUploading resource files ...")
-
-    # Upload the context surfaces file
-    surfaces_sas_url = common.helpers.upload_blob_and_create_sas(block_blob_client, project_id, "surfaces.json", surfaces_path, datetime.datetime.utcnow() + datetime.timedelta(days=7))
-    print("{0:} uploaded to {1:}/{2:}".format(os.path.basename(surfaces_path), project_id, "surfaces.json"))
-
-    # Upload the sky matrix file
-    sky_mtx_sas_url = common.helpers.upload_blob_and_create_sas(block_blob_client, project_id, "sky_mtx.json", sky_matrix_path, datetime.datetime.utcnow() + datetime.timedelta(days=7))
-    print("{0:} uploaded to {1:}/{2:}".format(os.path.basename(sky_matrix_path), project_id, "sky_mtx.json"))
-
-    # Upload the analysis grids files
-    analysis_grid_sas_urls = []
-    analysis_grid_names = []
-    for analysis_grid_path in analysis_grid_paths:
-        analysis_grid_name = common.helpers.normalise_string(os.path.basename(analysis_grid_path)).replace("json", ".json")
-        analysis_grid_sas_urls.append(common.helpers.upload_blob_and_create_sas(block_blob_client, project_id, analysis_grid_name, analysis_grid_path, datetime.datetime.utcnow() + datetime.timedelta(days=7)))
-        analysis_grid_names.append(analysis_grid_name)
-        print("{0:} uploaded to {1:}/{2:}".format(os.path.basename(analysis_grid_name), project_id, analysis_grid_name))
-
-    # TODO: For some reason with >100 tasks two pools of 100 were created, maybe we just cerate a set of jobs and assign to the same pool?
-    # A chunked list of grid indices - to create multiple pool instances
-    job_chunks = list(common.helpers.chunks(list(range(0, len(analysis_grid_names))), 100)) # TODO - change new pool amount
-
-    # Generate batch client
-    batch_client = batch.BatchServiceClient(batchauth.SharedKeyCredentials(batch_account_name, batch_account_key), base_url=batch_service_url)
-
-    # Get a verified VM image on which to run the job/s
-    sku_to_use, image_ref_to_use = common.helpers.select_latest_verified_vm_image_with_node_agent_sku(batch_client, 'Canonical', 'UbuntuServer', '16.04')
-
-    # Create a pool per job (each job contains a maximum of 100 tasks)
-    pool_ids = []
-    job_ids = []
-    task_ids = []
-    for job_n, job_chunk in enumerate(job_chunks):
-
-        print("Job{0:}, containing grids {1:}".format(job_n, job_chunk))
-
-        pool_id = common.helpers.generate_unique_resource_name("{0:}-pool{1:}".format(project_id, job_n))
-        pool_ids.append(pool_id)
-        pool_start_commands = ["cd / "]
-        pool = batchmodels.PoolAddParameter(
-            id=pool_id,
-            vm_size=pool_vm_size,
-            virtual_machine_configuration=batchmodels.VirtualMachineConfiguration( image_reference=image_ref_to_use, node_agent_sku_id=sku_to_use),
-            enable_auto_scale=True,
-            auto_scale_formula="pendingTaskSamplePercent = $PendingTasks.GetSamplePercent(180 * TimeInterval_Second); pendingTaskSamples = pendingTaskSamplePercent < 70 ? 1 : avg($PendingTasks.GetSample(180 * TimeInterval_Second)); $TargetDedicatedNodes = min(100, pendingTaskSamples);",
-            auto_scale_evaluation_interval=datetime.timedelta(minutes=5),
-            max_tasks_per_node=1,
-            task_scheduling_policy=batchmodels.TaskSchedulingPolicy(node_fill_type="spread"),
-            start_task=batchmodels.StartTask(
-                user_identity=batchmodels.UserIdentity(auto_user=batchmodels.AutoUserSpecification(elevation_level=batchmodels.ElevationLevel.admin, scope=batchmodels.AutoUserScope.pool)),
-                command_line=common.helpers.wrap_commands_in_shell("linux", pool_start_commands),
-                resource_files=[]
-            ),
-        )
-        common.helpers.create_pool_if_not_exist(batch_client, pool)
-
-        # Create job to assign tasks
-        job_id = "{0:}-job{1:}".format(pool_id, job_n)
-        job_ids.append(job_id)
-        job = batchmodels.JobAddParameter(id=job_id, pool_info=batchmodels.PoolInformation(pool_id=pool_id))
-        batch_client.job.add(job)
-        print("Job created: {0:}".format(job_id))
-
-        # TODO: SOMETHING WRONG WITH THE OUTPUT FILE GENERATION!!!!
-
-        # Create a task per analysis grid
-        for n in job_chunk:
-
-            # CHECKING OUTPUT METHOD
-            output_file = analysis_grid_names[n].replace(".json", "_result.json")
-            output_file_node = os.path.join("Results", output_file)
-            container_sas_url = "https://{0:}.blob.core.windows.net/{1:}?{3:}".format(storage_account_name, project_id, output_file_node, container_sas_token)
-
-            # print("\n##########")
-            # print("Output file on node: {0:}".format(output_file_node))
-            # print("Container SAS url: {0:}".format(container_sas_url))
-            # print("##########\n")
-            # CHECKING OUTPUT METHOD
-
-            task_id = "{0:}-task{1:}".format(job_id, n)
-            task_ids.append(task_id)
-            node_dir = "./mnt/batch/tasks/workitems/{0:}/job-1/{1:}/wd".format(job_id, task_id)
-
-            task_run_commands = [
-                "cd /",
-                "sudo wget --no-check-certificate https://github.com/FraserGreenroyd/SAMAzure/raw/master/TestFiles/resources/azure_common/CopyToBlob.py",
-                "sudo wget --no-check-certificate https://github.com/FraserGreenroyd/SAMAzure/raw/master/TestFiles/resources/azure_common/radiance-5.1.0-Linux.tar.gz",
-                "sudo tar xzf radiance-5.1.0-Linux.tar.gz",
-                "sudo rsync -av /radiance-5.1.0-Linux/usr/local/radiance/bin/ /usr/local/bin/",
-                "sudo rsync -av /radiance-5.1.0-Linux/usr/local/radiance/lib/ /usr/local/lib/ray/",
-                "sudo wget --no-check-certificate https://github.com/FraserGreenroyd/SAMAzure/raw/master/TestFiles/resources/azure_common/lb_hb.tar.gz",
-                "sudo tar xzf lb_hb.tar.gz",
-                "sudo wget --no-check-certificate https://github.com/FraserGreenroyd/SAMAzure/raw/master/TestFiles/resources/azure_common/RunHoneybeeRadiance.py",
-                "sudo python RunHoneybeeRadiance.py -s {0:}/surfaces.json -sm {0:}/sky_mtx.json -p {0:}/{1:}".format(node_dir, analysis_grid_names[n]),
-            ]
-            task = batchmodels.TaskAddParameter(
-                id=task_id,
-                command_line=common.helpers.wrap_commands_in_shell("linux", task_run_commands),
-                resource_files=[
-                    batchmodels.ResourceFile(file_path=analysis_grid_names[n], blob_source=analysis_grid_sas_urls[n]),
-                    batchmodels.ResourceFile(file_path="sky_mtx.json", blob_source=sky_mtx_sas_url),
-                    batchmodels.ResourceFile(file_path="surfaces.json", blob_source=surfaces_sas_url)],
-                output_files=[
-                    batchmodels.OutputFile(
-                        file_pattern="*_result.json",
-                        destination=batchmodels.OutputFileDestination(container=batchmodels.OutputFileBlobContainerDestination(container_url=container_sas_url)),
-                        upload_options=batchmodels.OutputFileUploadOptions(upload_condition="taskCompletion"))
-                ],
-                user_identity=batchmodels.UserIdentity(auto_user=batchmodels.AutoUserSpecification(elevation_level=batchmodels.ElevationLevel.admin, scope=batchmodels.AutoUserScope.task)))
-            batch_client.task.add(job_id=job_id, task=task)
-            print("Task created: {0:} and assigned to {1:}".format(task_id, job_id))
-
-    # Wait for tasks to complete
-    for job_id in job_ids:
-        common.helpers.wait_for_tasks_to_complete(batch_client, job_id, datetime.timedelta(hours=4))
-    # # Get a list of all the tasks currently running and wait for them to all complete
-    # all_tasks = []
-    # for job_id in job_ids:
-    #     tasks_temp = batch_client.task.list(job_id)
-    #     for task_temp in tasks_temp:
-    #         all_tasks.append(task_temp)
-    # common.helpers.wait_for_tasks_to_complete2(batch_client, all_tasks, datetime.timedelta(minutes=45))
-    print("All tasks complete\n")
-
-    # Download the results to the case directory
+    # Choose where to simulate the case
+    if args.backend == "local":
+        backend = common.backends.LocalBackend(max_workers=args.localWorkers if args.localWorkers else max(1, (os.cpu_count() or 1) // args.processes), python_executable=args.python)
+        print("Simulating locally, {0:} work units at once".format(backend.concurrency))
+    else:
+        backend = common.backends.AzureBatchBackend(
+            config, project_id, pool_id_prefix=args.poolID, pool_count=args.poolCount, task_slots_per_node=args.taskSlots,
+            processes=args.processes, delete_job=args.deleteJob == "yes", delete_pool=args.deletePool == "yes",
+            delete_container=args.deleteContainer == "yes")
+
+    # Balance the analysis grids into work units of similar cost, merging small zones and splitting large ones
+    with open(sky_matrix_path) as f:
+        sky_patches = common.helpers.sky_patch_count(json.load(f)["sky_mtx"]["sky_density"])
+    ambient_bounces = _AMBIENT_BOUNCES[args.quality]
+    if args.workUnitPoints:
+        work_unit_points = args.workUnitPoints
+    else:
+        total_points = 0
+        for analysis_grid_path in analysis_grid_paths:
+            with open(analysis_grid_path) as f:
+                total_points += sum(len(i["analysis_points"]) for i in json.load(f)["analysis_grids"])
+        work_unit_points = max(_MIN_WORK_UNIT_POINTS, -(-total_points // backend.concurrency))
+    work_units = common.helpers.create_work_units(analysis_grid_paths, common.helpers.estimate_grid_cost(work_unit_points, ambient_bounces, sky_patches), ambient_bounces, sky_patches)
+    print("{0:} analysis grids balanced into {1:} work units of up to {2:} points".format(len(analysis_grid_paths), len(work_units), work_unit_points))
+
+    # Write the work units to the case directory for the backend to simulate
+    work_unit_directory = os.path.join(case_directory, "WorkUnits")
+    if not os.path.exists(work_unit_directory):
+        os.makedirs(work_unit_directory)
+    work_unit_paths = []
+    work_unit_parts = {}
+    for work_unit_n, work_unit in enumerate(work_units):
+        work_unit_path = os.path.join(work_unit_directory, "unit{0:05d}.json".format(work_unit_n))
+        with open(work_unit_path, "w") as f:
+            json.dump({"analysis_grids": [i["analysis_grid"] for i in work_unit]}, f)
+        work_unit_paths.append(work_unit_path)
+        work_unit_parts[os.path.basename(work_unit_path).replace(".json", "_result.json")] = work_unit
+
+    # Simulate the work units, reassembling the zones each result completes and merging them into the joined results
+    # as soon as it is available
     if not os.path.exists(os.path.join(case_directory, "Results")):
         os.makedirs(os.path.join(case_directory, "Results"))
-    for n in range(len(analysis_grid_names)):
-        output_file = analysis_grid_names[n].replace(".json", "_result.json")
-        common.helpers.download_blob_from_container(block_blob_client, project_id, output_file, os.path.join(case_directory, "Results"))
-
-    # TODO: I may need to add a sleep here, possibly not depending on how good the download function is
-
-    if args.deleteJob:
-        for i in job_ids:
-            print("Deleting job: {0:}".format(i))
-            batch_client.job.delete(i)
-    if args.deletePool:
-        for i in pool_ids:
-            print("Deleting pool/s: {0:}".format(i))
-            batch_client.pool.delete(i)
-
-    # Tidy up the pools, jobs and tasks
-    if args.deleteContainer == "yes":
-        print("Deleting container: {0:}".format(project_id))
-        block_blob_client.delete_container(project_id, fail_not_exist=False)
+    results_store = common.helpers.ResultsStore(os.path.join(case_directory, "results_joined.csv"))
+    results_merger = common.helpers.WorkUnitResultsMerger(work_unit_parts, os.path.join(case_directory, "Results"), on_zone_completed=results_store.append)
+    failed_work_units = backend.run(work_unit_paths, surfaces_path, sky_matrix_path, args.quality, args.processes, on_result=results_merger.add)
+    print("Results for {0:} points joined in {1:}".format(len(results_store), results_store.csv_path))
+    if failed_work_units:
+        print("{0:} work units failed - their results are missing from {1:}\n".format(len(failed_work_units), os.path.join(case_directory, "Results")))
+    else:
+        print("All work units complete\n")
+
+    # Tidy up the pools, jobs and containers
+    backend.close()
@@ -0,0 +1,306 @@
+"""Backends which run the work units of a Radiance case through RunHoneybeeRadiance.py.
+
+Every backend takes the work unit files written next to each other (by
+2_AzureRun.py) and leaves the result of each one beside it, named
+<work unit>_result.json, so the results are merged the same way wherever
+the simulation ran.
+"""
+
+from __future__ import print_function
+import concurrent.futures
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+
+import azure.storage.blob as azureblob
+import azure.batch.batch_service_client as batch
+import azure.batch.batch_auth as batchauth
+import azure.batch.models as batchmodels
+
+import common.helpers
+
+RUNNER_PATH = os.path.join("resources", "azure_common", "RunHoneybeeRadiance.py")
+
+
+def result_path(work_unit_path):
+    """Get the path of the result file written for a work unit
+
+    :param str work_unit_path: The path to the work unit file
+    :return: The path to the work unit's result file
+    """
+    return work_unit_path.replace(".json", "_result.json")
+
+
+class ExecutionBackend(object):
+    """Somewhere to simulate the work units of a Radiance case.
+
+    Subclasses implement run, and set concurrency to the number of work
+    units they simulate at once so the case can be split to keep them busy.
+    """
+    concurrency = 1
+
+    def run(self, work_unit_paths, surfaces_path, sky_matrix_path, quality, processes, on_result=None):
+        """Simulate every work unit, blocking until they have all finished.
+
+        :param list work_unit_paths: The work unit files to simulate, all in the same directory
+        :param str surfaces_path: The path to the case's surfaces.json
+        :param str sky_matrix_path: The path to the case's sky_mtx.json
+        :param str quality: The simulation quality ['low', 'medium', 'high']
+        :param int processes: The number of Radiance processes to simulate each work unit on
+        :param on_result: Called with the path to each work unit's result file as soon as it is available
+        :return: The paths of the work units which failed
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Release anything the backend holds once its results have been collected"""
+        pass
+
+
+class LocalBackend(ExecutionBackend):
+    """Simulates the work units in parallel processes on this machine.
+
+    Each work unit runs in its own directory beside the work unit file, which
+    is kept along with the runner's stdout.txt and stderr.txt if it fails. The
+    work units share the files common to the whole case through a cache
+    directory beside them.
+    """
+
+    def __init__(self, max_workers=None, python_executable="python"):
+        """
+        :param int max_workers: The number of work units to simulate at once (defaults to the number of cores)
+        :param str python_executable: The (Python 2) interpreter to run RunHoneybeeRadiance.py with
+        """
+        self.concurrency = max_workers if max_workers else os.cpu_count() or 1
+        self.python_executable = python_executable
+
+    def run(self, work_unit_paths, surfaces_path, sky_matrix_path, quality, processes, on_result=None):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([os.path.abspath("honeybee"), os.path.abspath("ladybug")] + [i for i in [env.get("PYTHONPATH")] if i])
+        cache_directory = os.path.abspath(os.path.join(os.path.dirname(work_unit_paths[0]), "cache"))
+        run_command = [self.python_executable, os.path.abspath(RUNNER_PATH), "-s", os.path.abspath(surfaces_path), "-sm", os.path.abspath(sky_matrix_path), "-q", quality, "-n", str(processes), "-c", cache_directory]
+
+        failed_work_units = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self._run_work_unit, i, run_command, env): i for i in work_unit_paths}
+            for future in concurrent.futures.as_completed(futures):
+                if future.result():
+                    if on_result is not None:
+                        on_result(result_path(futures[future]))
+                else:
+                    failed_work_units.append(futures[future])
+        return failed_work_units
+
+    @staticmethod
+    def _run_work_unit(work_unit_path, run_command, env):
+        """Simulate a work unit in its own directory, moving its result next to the work unit file
+
+        :return: True if the work unit's result was written
+        """
+        work_unit_name = os.path.basename(work_unit_path)
+        working_directory = os.path.splitext(work_unit_path)[0]
+        if os.path.exists(working_directory):
+            shutil.rmtree(working_directory)
+        os.makedirs(working_directory)
+        shutil.copy(work_unit_path, working_directory)
+
+        with open(os.path.join(working_directory, "stdout.txt"), "w") as stdout, open(os.path.join(working_directory, "stderr.txt"), "w") as stderr:
+            return_code = subprocess.call(run_command + ["-p", work_unit_name], cwd=working_directory, env=env, stdout=stdout, stderr=stderr)
+
+        working_result_path = os.path.join(working_directory, os.path.basename(result_path(work_unit_path)))
+        if return_code != 0 or not os.path.exists(working_result_path):
+            print("{0:} failed with exit code {1:}, see the output in {2:}".format(work_unit_name, return_code, working_directory), file=sys.stderr)
+            return False
+        shutil.move(working_result_path, result_path(work_unit_path))
+        shutil.rmtree(working_directory)
+        print("{0:} complete".format(work_unit_name))
+        return True
+
+
+class AzureBatchBackend(ExecutionBackend):
+    """Simulates the work units as tasks on long-lived Azure Batch pools, one job per pool.
+
+    Results are downloaded from the project's blob container as each task
+    completes.
+    """
+
+    def __init__(self, config, project_id, pool_id_prefix=None, pool_count=None, task_slots_per_node=None,
+                 processes=1, delete_job=False, delete_pool=False, delete_container=False):
+        """
+        :param config: The Batch, Storage, Default and Toolchain configuration
+        :type config: `configparser.RawConfigParser`
+        :param str project_id: The normalised project ID, naming the jobs and the results container
+        :param str pool_id_prefix: ID prefix of the pools to reuse (defaults to poolid in the config)
+        :param int pool_count: Number of pools to spread the jobs across (defaults to poolcount in the config)
+        :param int task_slots_per_node: Number of tasks to run at once on each node (defaults to the cores per node
+            divided by processes)
+        :param int processes: The number of Radiance processes each task will run on
+        :param bool delete_job: Delete the jobs on close
+        :param bool delete_pool: Delete the pools on close
+        :param bool delete_container: Delete the results container on close
+        """
+        self.project_id = project_id
+        self.batch_account_key = config.get('Batch', 'batchaccountkey').replace("%", "%%")
+        self.batch_account_name = config.get('Batch', 'batchaccountname').replace("%", "%%")
+        self.batch_service_url = config.get('Batch', 'batchserviceurl').replace("%", "%%")
+        self.storage_account_key = config.get('Storage', 'storageaccountkey').replace("%", "%%")
+        self.storage_account_name = config.get('Storage', 'storageaccountname').replace("%", "%%")
+        self.storage_account_suffix = config.get('Storage', 'storageaccountsuffix').replace("%", "%%")
+        self.case_container = config.get('Storage', 'casecontainer', fallback="samazure-cases")
+        self.pool_vm_size = config.get('Default', 'poolvmsize')
+        self.pool_id_prefix = pool_id_prefix if pool_id_prefix else config.get('Default', 'poolid', fallback="radiance-pool")
+        self.pool_count = pool_count if pool_count else config.getint('Default', 'poolcount', fallback=1)
+        self.pool_max_nodes = config.getint('Default', 'poolmaxnodes', fallback=100)
+        self.toolchain_version = config.get('Toolchain', 'version')
+        self.radiance_url = config.get('Toolchain', 'radianceurl')
+        self.lb_hb_url = config.get('Toolchain', 'lbhburl')
+        self.toolchain_checksums = {
+            self.radiance_url.split("/")[-1]: config.get('Toolchain', 'radiancesha256', fallback=""),
+            self.lb_hb_url.split("/")[-1]: config.get('Toolchain', 'lbhbsha256', fallback="")}
+        self.node_image_id = config.get('Toolchain', 'nodeimageid', fallback="")
+        if not self.node_image_id:
+            # Nodes download the toolchain archives themselves, so each one must be pinned to a checksum
+            missing_checksums = [i for i in ["radiancesha256", "lbhbsha256"] if not config.get('Toolchain', i, fallback="")]
+            if missing_checksums:
+                raise ValueError("Set {0:} in the [Toolchain] section of the configuration file, or a nodeimageid, so the toolchain archives downloaded by each node can be verified. See \"Azure backend setup\" in README.md, or run with \"-b local\"".format(" and ".join(missing_checksums)))
+        self.node_agent_sku_id = config.get('Toolchain', 'nodeagentskuid', fallback="batch.node.ubuntu 16.04")
+        self.node_image_toolchain_dir = config.get('Toolchain', 'nodeimagetoolchaindir', fallback="/opt/samazure")
+        self.delete_job = delete_job
+        self.delete_pool = delete_pool
+        self.delete_container = delete_container
+
+        # Pack as many tasks onto each node as it has cores for their Radiance processes
+        self.task_slots_per_node = task_slots_per_node if task_slots_per_node else max(1, common.helpers.get_vm_size_core_count(self.pool_vm_size) // processes)
+        print("Each {0:} node will run up to {1:} tasks at once, on {2:} processes each".format(self.pool_vm_size, self.task_slots_per_node, processes))
+        self.concurrency = self.pool_count * self.pool_max_nodes * self.task_slots_per_node
+
+        self.block_blob_client = azureblob.BlockBlobService(account_name=self.storage_account_name, account_key=self.storage_account_key, endpoint_suffix=self.storage_account_suffix)
+        self.batch_client = batch.BatchServiceClient(batchauth.SharedKeyCredentials(self.batch_account_name, self.batch_account_key), base_url=self.batch_service_url)
+        self.pool_ids = []
+        self.job_ids = []
+
+    def run(self, work_unit_paths, surfaces_path, sky_matrix_path, quality, processes, on_result=None):
+        # Create a blob container for this project
+        self.block_blob_client.create_container(self.project_id, fail_on_exist=False)
+
+        # Generate a SAS token to pass results back to the container
+        container_sas_token = self.block_blob_client.generate_container_shared_access_signature(self.project_id, permission=azureblob.ContainerPermissions(read=True, write=True), expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=24), )
+
+        print("\nUploading resource files ...")
+
+        # Upload the case files (surfaces, sky matrix, simulation runner and work units) in parallel, reusing any
+        # identical files uploaded previously
+        case_file_sas_urls = common.helpers.upload_files_content_addressed(self.block_blob_client, self.case_container, [surfaces_path, sky_matrix_path, RUNNER_PATH] + work_unit_paths, datetime.datetime.utcnow() + datetime.timedelta(days=7))
+        surfaces_sas_url = case_file_sas_urls[surfaces_path]
+        sky_mtx_sas_url = case_file_sas_urls[sky_matrix_path]
+        runner_sas_url = case_file_sas_urls[RUNNER_PATH]
+        work_unit_sas_urls = [case_file_sas_urls[i] for i in work_unit_paths]
+        work_unit_names = [os.path.basename(i) for i in work_unit_paths]
+
+        # Provision the Radiance/Honeybee toolchain once per node, either from a custom image or in the pool start task.
+        # Tasks run the same commands, as nodes of a reused pool which were set up with an older toolchain version
+        # don't run the start task again
+        if self.node_image_id:
+            print("Nodes will use the toolchain baked into image {0:}".format(self.node_image_id))
+            sku_to_use, image_ref_to_use = self.node_agent_sku_id, batchmodels.ImageReference(virtual_machine_image_id=self.node_image_id)
+            toolchain_dir = self.node_image_toolchain_dir
+            toolchain_commands = ["test -f {0:}".format(common.helpers.toolchain_marker(toolchain_dir))]
+        else:
+            print("Nodes will install toolchain {0:} when they start".format(self.toolchain_version))
+            sku_to_use, image_ref_to_use = common.helpers.select_latest_verified_vm_image_with_node_agent_sku(self.batch_client, 'Canonical', 'UbuntuServer', '16.04')
+            toolchain_dir = "$AZ_BATCH_NODE_SHARED_DIR/toolchain/{0:}".format(self.toolchain_version)
+            toolchain_commands = common.helpers.create_toolchain_install_commands(
+                toolchain_dir, [self.radiance_url, self.lb_hb_url], self.toolchain_checksums,
+                post_install_commands=[
+                    "rsync -a radiance-5.1.0-Linux/usr/local/radiance/bin/ /usr/local/bin/",
+                    "rsync -a radiance-5.1.0-Linux/usr/local/radiance/lib/ /usr/local/lib/ray/"])
+
+        # Spread the work units over a small number of long-lived pools, submitting one job per pool
+        job_chunks = [i for i in common.helpers.distribute(list(range(0, len(work_unit_names))), self.pool_count) if i]
+        task_work_units = {}
+        for job_n, job_chunk in enumerate(job_chunks):
+
+            print("Job{0:}, containing work units {1:}".format(job_n, job_chunk))
+
+            pool_id = "{0:}-{1:}".format(self.pool_id_prefix, job_n)
+            self.pool_ids.append(pool_id)
+            pool = batchmodels.PoolAddParameter(
+                id=pool_id,
+                vm_size=self.pool_vm_size,
+                virtual_machine_configuration=batchmodels.VirtualMachineConfiguration( image_reference=image_ref_to_use, node_agent_sku_id=sku_to_use),
+                max_tasks_per_node=self.task_slots_per_node,
+                task_scheduling_policy=batchmodels.TaskSchedulingPolicy(node_fill_type="pack"),
+                start_task=batchmodels.StartTask(
+                    user_identity=batchmodels.UserIdentity(auto_user=batchmodels.AutoUserSpecification(elevation_level=batchmodels.ElevationLevel.admin, scope=batchmodels.AutoUserScope.pool)),
+                    command_line=common.helpers.wrap_commands_in_shell("linux", toolchain_commands),
+                    resource_files=[],
+                    wait_for_success=True,
+                    max_task_retry_count=2
+                ),
+            )
+            common.helpers.get_or_create_pool(self.batch_client, pool, self.pool_max_nodes)
+
+            # Create job to assign tasks
+            job_id = common.helpers.generate_unique_resource_name("{0:}-job{1:}".format(self.project_id, job_n))
+            self.job_ids.append(job_id)
+            job = batchmodels.JobAddParameter(id=job_id, pool_info=batchmodels.PoolInformation(pool_id=pool_id))
+            self.batch_client.job.add(job)
+            print("Job created: {0:}".format(job_id))
+
+            # Create a task per work unit
+            tasks = []
+            for n in job_chunk:
+                container_sas_url = "https://{0:}.blob.core.windows.net/{1:}?{2:}".format(self.storage_account_name, self.project_id, container_sas_token)
+
+                task_id = "{0:}-task{1:}".format(job_id, n)
+                task_work_units[task_id] = work_unit_paths[n]
+
+                task_run_commands = toolchain_commands + [
+                    "export PYTHONPATH={0:}/honeybee:{0:}/ladybug".format(toolchain_dir),
+                    "cd $AZ_BATCH_TASK_WORKING_DIR",
+                    "python RunHoneybeeRadiance.py -s surfaces.json -sm sky_mtx.json -p {0:} -q {1:} -n {2:} -c $AZ_BATCH_NODE_SHARED_DIR/cache".format(work_unit_names[n], quality, processes),
+                ]
+                tasks.append(batchmodels.TaskAddParameter(
+                    id=task_id,
+                    command_line=common.helpers.wrap_commands_in_shell("linux", task_run_commands),
+                    resource_files=[
+                        batchmodels.ResourceFile(file_path=work_unit_names[n], blob_source=work_unit_sas_urls[n]),
+                        batchmodels.ResourceFile(file_path="sky_mtx.json", blob_source=sky_mtx_sas_url),
+                        batchmodels.ResourceFile(file_path="surfaces.json", blob_source=surfaces_sas_url),
+                        batchmodels.ResourceFile(file_path="RunHoneybeeRadiance.py", blob_source=runner_sas_url)],
+                    output_files=[
+                        batchmodels.OutputFile(
+                            file_pattern="*_result.json",
+                            destination=batchmodels.OutputFileDestination(container=batchmodels.OutputFileBlobContainerDestination(container_url=container_sas_url)),
+                            upload_options=batchmodels.OutputFileUploadOptions(upload_condition="taskCompletion"))
+                    ],
+                    user_identity=batchmodels.UserIdentity(auto_user=batchmodels.AutoUserSpecification(elevation_level=batchmodels.ElevationLevel.admin, scope=batchmodels.AutoUserScope.task))))
+            common.helpers.add_tasks(self.batch_client, job_id, tasks)
+
+        # Download each result as soon as its task completes whilst the remaining tasks are monitored
+        download_result = common.helpers.download_blobs_as_completed(self.block_blob_client, self.project_id, os.path.dirname(work_unit_paths[0]), on_blob_downloaded=on_result)
+
+        def download_task_result(job_id, task):
+            if task.execution_info is not None and task.execution_info.result == batchmodels.TaskExecutionResult.success:
+                download_result(os.path.basename(result_path(task_work_units[task.id])))
+
+        failed_tasks = common.helpers.monitor_tasks(self.batch_client, self.job_ids, datetime.timedelta(hours=4), on_task_completed=download_task_result)
+        download_result.wait()
+        for job_id in self.job_ids:
+            common.helpers.print_task_output(self.batch_client, job_id, [i.id for i in failed_tasks if i.id.startswith(job_id)])
+        return [task_work_units[i.id] for i in failed_tasks]
+
+    def close(self):
+        if self.delete_job:
+            for i in self.job_ids:
+                print("Deleting job: {0:}".format(i))
+                self.batch_client.job.delete(i)
+        if self.delete_pool:
+            for i in self.pool_ids:
+                print("Deleting pool/s: {0:}".format(i))
+                self.batch_client.pool.delete(i)
+        if self.delete_container:
+            print("Deleting container: {0:}".format(self.project_id))
+            self.block_blob_client.delete_container(self.project_id, fail_not_exist=False)
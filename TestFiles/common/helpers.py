@@ -23,12 +23,16 @@
 # DEALINGS IN THE SOFTWARE.
 
 from __future__ import print_function
+import concurrent.futures
+import csv
 import datetime
+import hashlib
 import io
 import os
 import time
 import json
 import re
+import threading
 
 import azure.storage.blob as azureblob
 import azure.batch.models as batchmodels
@@ -36,6 +40,19 @@ import azure.batch.models as batchmodels
 
 _STANDARD_OUT_FILE_NAME = 'stdout.txt'
 _STANDARD_ERROR_FILE_NAME = 'stderr.txt'
+_MAX_TASKS_PER_ADD_COLLECTION = 100
+_VM_SIZE_CORE_COUNTS = {
+    'basic_a1': 1, 'basic_a2': 2, 'basic_a3': 4, 'basic_a4': 8,
+    'standard_a1': 1, 'standard_a2': 2, 'standard_a3': 4, 'standard_a4': 8,
+    'standard_a1_v2': 1, 'standard_a2_v2': 2, 'standard_a4_v2': 4, 'standard_a8_v2': 8,
+    'standard_d1_v2': 1, 'standard_d2_v2': 2, 'standard_d3_v2': 4, 'standard_d4_v2': 8, 'standard_d5_v2': 16,
+    'standard_d2_v3': 2, 'standard_d4_v3': 4, 'standard_d8_v3': 8, 'standard_d16_v3': 16,
+    'standard_d32_v3': 32, 'standard_d64_v3': 64,
+    'standard_f1': 1, 'standard_f2': 2, 'standard_f4': 4, 'standard_f8': 8, 'standard_f16': 16,
+    'standard_f2s_v2': 2, 'standard_f4s_v2': 4, 'standard_f8s_v2': 8, 'standard_f16s_v2': 16,
+    'standard_f32s_v2': 32, 'standard_f64s_v2': 64, 'standard_f72s_v2': 72,
+    'standard_h8': 8, 'standard_h16': 16,
+}
 
 
 class TimeoutError(Exception):
@@ -99,16 +116,20 @@ def wait_for_tasks_to_complete2(batch_client, tasks, timeout):
 
     :param batch_client: The batch client to use.
     :type batch_client: `batchserviceclient.BatchServiceClient`
-    :param str job_id: The id of the job to monitor.
+    :param tasks: The tasks to monitor.
+    :type tasks: list of `batchserviceclient.models.CloudTask`
     :param timeout: The maximum amount of time to wait.
     :type timeout: `datetime.timedelta`
     """
     time_to_timeout_at = datetime.datetime.now() + timeout
     num_tasks = len(tasks)
     while datetime.datetime.now() < time_to_timeout_at:
+        # Refresh the tasks, as their state is only a snapshot from when they were listed
+        tasks = [batch_client.task.get(_job_id_from_task_url(task.url), task.id,
+                                       task_get_options=batchmodels.TaskGetOptions(select="id,url,state")) for task in tasks]
         incomplete_tasks = [task for task in tasks if task.state != batchmodels.TaskState.completed]
         print("{0:}/{1:} tasks remaining".format(len(incomplete_tasks), num_tasks))
-        if incomplete_tasks == 0:
+        if not incomplete_tasks:
             print("All tasks completed!")
             return
         time.sleep(5)
@@ -116,6 +137,11 @@ def wait_for_tasks_to_complete2(batch_client, tasks, timeout):
     raise TimeoutError("Timed out waiting for tasks to complete")
 
 
+def _job_id_from_task_url(task_url):
+    """Get the id of the job a task belongs to from the task's URL."""
+    return re.search(r"/jobs/([^/]+)/tasks/", task_url).group(1)
+
+
 def wait_for_tasks_to_complete(batch_client, job_id, timeout):
     """Waits for all the tasks in a particular job to complete.
 
@@ -129,16 +155,107 @@ def wait_for_tasks_to_complete(batch_client, job_id, timeout):
 
     while datetime.datetime.now() < time_to_timeout_at:
         print("Checking if all tasks are complete...")
-        tasks = batch_client.task.list(job_id)
+        incomplete_tasks = batch_client.task.list(
+            job_id, task_list_options=batchmodels.TaskListOptions(filter="state ne 'completed'", select="id"))
 
-        incomplete_tasks = [task for task in tasks if task.state != batchmodels.TaskState.completed]
-        if not incomplete_tasks:
+        if not any(True for _ in incomplete_tasks):
             return
         time.sleep(5)
 
     raise TimeoutError("Timed out waiting for tasks to complete")
 
 
+def monitor_tasks(batch_client, job_ids, timeout, on_task_completed=None, min_interval=5, max_interval=60,
+                  list_margin=datetime.timedelta(minutes=5)):
+    """Waits for all the tasks in the specified jobs to complete, reporting progress and handling each task as it
+    finishes.
+
+    Progress comes from the job task counts, and only tasks which have
+    completed since the last check are listed (with a few fields selected),
+    so each check costs the same however many tasks a job holds. The task
+    list is eventually consistent, so each check lists from list_margin before
+    the latest completion already seen, and a job whose counts show more
+    completed tasks than have been handled once nothing is left to run is
+    listed in full. The polling interval doubles while nothing changes, up to
+    max_interval, and drops back to min_interval whenever a task completes.
+
+    :param batch_client: The batch client to use.
+    :type batch_client: `batchserviceclient.BatchServiceClient`
+    :param list job_ids: The ids of the jobs to monitor.
+    :param timeout: The maximum amount of time to wait.
+    :type timeout: `datetime.timedelta`
+    :param on_task_completed: Called with the job id and `batchserviceclient.models.CloudTask` of each task once it
+        completes.
+    :param int min_interval: The shortest time in seconds between checks.
+    :param int max_interval: The longest time in seconds between checks.
+    :param list_margin: How far before the latest completion seen to list completed tasks from.
+    :type list_margin: `datetime.timedelta`
+    :rtype: list
+    :return: The `batchserviceclient.models.CloudTask` of each task which failed or has no execution information
+    """
+    time_to_timeout_at = datetime.datetime.now() + timeout
+    completed_since = {job_id: None for job_id in job_ids}
+    completed_task_ids = {job_id: set() for job_id in job_ids}
+    failed_tasks = []
+    interval = min_interval
+    incomplete_job_ids = list(job_ids)
+
+    while datetime.datetime.now() < time_to_timeout_at:
+        newly_completed = 0
+        active, running, completed, failed = 0, 0, 0, 0
+        for job_id in list(incomplete_job_ids):
+            task_counts = batch_client.job.get_task_counts(job_id)
+            active += task_counts.active
+            running += task_counts.running
+            completed += task_counts.completed
+            failed += task_counts.failed
+
+            since = completed_since[job_id]
+            for task in _list_tasks_completed_since(batch_client, job_id, since and since - list_margin):
+                if task.id in completed_task_ids[job_id]:
+                    continue
+                completed_task_ids[job_id].add(task.id)
+                newly_completed += 1
+                if completed_since[job_id] is None or task.state_transition_time > completed_since[job_id]:
+                    completed_since[job_id] = task.state_transition_time
+                if task.execution_info is None:
+                    # Without its execution information there is no telling that the task succeeded
+                    failed_tasks.append(task)
+                    print("Task {0:} completed without execution information".format(task.id))
+                elif task.execution_info.result == batchmodels.TaskExecutionResult.failure:
+                    failed_tasks.append(task)
+                    print("Task {0:} failed (exit code {1:})".format(task.id, task.execution_info.exit_code))
+                if on_task_completed is not None:
+                    on_task_completed(job_id, task)
+
+            # Task counts can lag behind the task list, so only finish once every counted task has been handled
+            if task_counts.active == 0 and task_counts.running == 0:
+                if len(completed_task_ids[job_id]) >= task_counts.completed:
+                    incomplete_job_ids.remove(job_id)
+                else:
+                    # A completion may have been listed late, behind the margin, so list the whole job next time
+                    completed_since[job_id] = None
+
+        print("{0:} tasks active, {1:} running, {2:} completed ({3:} failed)".format(active, running, completed, failed))
+        if not incomplete_job_ids:
+            return failed_tasks
+
+        interval = min_interval if newly_completed else min(interval * 2, max_interval)
+        time.sleep(interval)
+
+    raise TimeoutError("Timed out waiting for tasks to complete")
+
+
+def _list_tasks_completed_since(batch_client, job_id, since):
+    """List the tasks in a job which completed at or after the specified time, with only the fields needed to handle
+    their completion."""
+    task_filter = "state eq 'completed'"
+    if since is not None:
+        task_filter += " and stateTransitionTime ge datetime'{0:}'".format(since.strftime("%Y-%m-%dT%H:%M:%S.%fZ"))
+    return batch_client.task.list(job_id, task_list_options=batchmodels.TaskListOptions(
+        filter=task_filter, select="id,state,stateTransitionTime,executionInfo"))
+
+
 def print_task_output(batch_client, job_id, task_ids, encoding=None):
     """Prints the stdout and stderr for each task specified.
 
@@ -245,6 +362,116 @@ def chunks(l, n):
         yield l[i:i + n]
 
 
+def distribute(l, n):
+    """Split l into n interleaved groups of near-equal size (round-robin).
+
+    :param list l: The items to distribute
+    :param int n: The number of groups to distribute the items across
+    :rtype: list
+    :return: A list of n lists
+    """
+    return [l[i::n] for i in range(n)]
+
+
+def get_vm_size_core_count(vm_size):
+    """Look up the number of cores available on an Azure VM size.
+
+    :param str vm_size: The Azure VM size name, e.g. STANDARD_D4_V3
+    :rtype: int
+    :return: The core count for the VM size, or 1 if it is not known
+    """
+    core_count = _VM_SIZE_CORE_COUNTS.get(vm_size.lower())
+    if core_count is None:
+        print("Core count for VM size {0:} is unknown - assuming 1".format(vm_size))
+        return 1
+    return core_count
+
+
+def create_auto_scale_formula(max_nodes, task_slots_per_node):
+    """Create a pool auto scale formula sizing the pool to its pending tasks.
+
+    Nodes are requested for the pending tasks divided by the task slots
+    available on each node, so a pool shrinks back to zero nodes when idle.
+
+    :param int max_nodes: The maximum number of dedicated nodes in the pool
+    :param int task_slots_per_node: The number of tasks each node runs at once
+    :rtype: str
+    :return: An Azure Batch auto scale formula
+    """
+    return "pendingTaskSamplePercent = $PendingTasks.GetSamplePercent(180 * TimeInterval_Second); " \
+           "pendingTaskSamples = pendingTaskSamplePercent < 70 ? 1 : avg($PendingTasks.GetSample(180 * TimeInterval_Second)); " \
+           "$TargetDedicatedNodes = min({0:}, ceil(pendingTaskSamples / {1:})); " \
+           "$NodeDeallocationOption = taskcompletion;".format(max_nodes, task_slots_per_node)
+
+
+def get_or_create_pool(batch_client, pool, max_nodes):
+    """Reuse the specified pool if it already exists, otherwise create it.
+
+    An existing pool keeps its nodes, VM size and task slots, but has its
+    auto scale formula refreshed so that it grows to meet the new tasks. A
+    changed start task only runs on nodes which join the pool afterwards, so
+    tasks must set up anything they need which it would have provided.
+
+    :param batch_client: The batch client to use.
+    :type batch_client: `batchserviceclient.BatchServiceClient`
+    :param pool: The pool to create.
+    :type pool: `batchserviceclient.models.PoolAddParameter`
+    :param int max_nodes: The maximum number of dedicated nodes in the pool
+    :rtype: `batchserviceclient.models.CloudPool`
+    :return: The pool that tasks should be submitted to
+    """
+    try:
+        existing_pool = batch_client.pool.get(pool.id)
+    except batchmodels.BatchErrorException as e:
+        if e.error.code != "PoolNotFound":
+            raise
+        pool.enable_auto_scale = True
+        pool.auto_scale_formula = create_auto_scale_formula(max_nodes, pool.max_tasks_per_node)
+        pool.auto_scale_evaluation_interval = datetime.timedelta(minutes=5)
+        create_pool_if_not_exist(batch_client, pool)
+        return batch_client.pool.get(pool.id)
+
+    if existing_pool.state == batchmodels.PoolState.deleting:
+        raise RuntimeError("Pool {0:} is being deleted and cannot be reused".format(pool.id))
+    if existing_pool.vm_size.lower() != pool.vm_size.lower():
+        print("Pool {0:} uses VM size {1:} rather than {2:}".format(pool.id, existing_pool.vm_size, pool.vm_size))
+    if pool.start_task is not None and (existing_pool.start_task is None or
+                                        existing_pool.start_task.command_line != pool.start_task.command_line):
+        print("Updating the start task of pool {0:} - nodes already running are not set up again by it".format(pool.id))
+        batch_client.pool.patch(pool.id, batchmodels.PoolPatchParameter(start_task=pool.start_task))
+
+    print("Reusing pool {0:} ({1:} nodes, {2:} task slots per node)".format(
+        pool.id, existing_pool.current_dedicated_nodes, existing_pool.max_tasks_per_node))
+    try:
+        batch_client.pool.enable_auto_scale(
+            pool.id,
+            auto_scale_formula=create_auto_scale_formula(max_nodes, existing_pool.max_tasks_per_node),
+            auto_scale_evaluation_interval=datetime.timedelta(minutes=5))
+    except batchmodels.BatchErrorException as e:
+        # The pool keeps its current formula (e.g. whilst a resize is in progress)
+        print_batch_exception(e)
+    return existing_pool
+
+
+def add_tasks(batch_client, job_id, tasks):
+    """Add tasks to a job in as few requests as the Batch service allows.
+
+    :param batch_client: The batch client to use.
+    :type batch_client: `batchserviceclient.BatchServiceClient`
+    :param str job_id: The id of the job to add the tasks to.
+    :param tasks: The tasks to add.
+    :type tasks: list of `batchserviceclient.models.TaskAddParameter`
+    """
+    for task_chunk in chunks(tasks, _MAX_TASKS_PER_ADD_COLLECTION):
+        result = batch_client.task.add_collection(job_id, task_chunk)
+        failures = [i for i in result.value if i.status != batchmodels.TaskAddStatus.success]
+        if failures:
+            raise RuntimeError("Failed to add {0:} tasks to job {1:}: {2:}".format(
+                len(failures), job_id, ", ".join(
+                    "{0:} ({1:})".format(i.task_id, i.error.message.value if i.error else i.status) for i in failures)))
+        print("{0:} tasks added to {1:}".format(len(task_chunk), job_id))
+
+
 def create_pool_if_not_exist(batch_client, pool):
     """Creates the specified pool if it doesn't already exist
 
@@ -264,6 +491,54 @@ def create_pool_if_not_exist(batch_client, pool):
             print("Pool {!r} already exists".format(pool.id))
 
 
+def create_toolchain_install_commands(toolchain_dir, archive_urls, checksums=None, post_install_commands=None):
+    """Create commands which install the simulation toolchain once per node.
+
+    Each archive is downloaded into the versioned toolchain_dir, checked
+    against its SHA-256 checksum and unpacked. A marker file is written once
+    installation succeeds, so a node which restarts reuses the toolchain it
+    already has rather than downloading it again. The installation holds a
+    lock on the node, so the commands can be run by the pool start task and
+    by every task, which installs a new toolchain version on nodes that were
+    set up before it.
+
+    :param str toolchain_dir: The versioned directory on the node to install into
+    :param list archive_urls: The URLs of the archives to download and unpack
+    :param dict checksums: SHA-256 checksums keyed by archive file name, required for every archive
+    :param list post_install_commands: Commands run in toolchain_dir after unpacking
+    :rtype: list
+    :return: A list of commands for the pool start task or a task
+    """
+    if checksums is None:
+        checksums = {}
+    archive_names = [i.split("?")[0].split("/")[-1] for i in archive_urls]
+    unverified_archives = [i for i in archive_names if not checksums.get(i)]
+    if unverified_archives:
+        raise ValueError("No SHA-256 checksum given for {0:}".format(", ".join(unverified_archives)))
+    install_commands = ["cd {0:}".format(toolchain_dir)]
+    for archive_url, archive_name in zip(archive_urls, archive_names):
+        install_commands.append("wget -q -O {0:} \"{1:}\"".format(archive_name, archive_url))
+        install_commands.append("echo \"{0:}  {1:}\" | sha256sum -c -".format(checksums[archive_name], archive_name))
+        install_commands.append("tar xzf {0:}".format(archive_name))
+        install_commands.append("rm {0:}".format(archive_name))
+    install_commands.extend(post_install_commands or [])
+    install_commands.append("touch {0:}".format(toolchain_marker(toolchain_dir)))
+    # Tasks starting together on a node wait for the first of them to install the toolchain
+    return ["mkdir -p {0:}".format(toolchain_dir),
+            "(flock 9; if [ ! -f {0:} ]; then {1:}; fi) 9>{2:}/.lock".format(
+                toolchain_marker(toolchain_dir), "; ".join(install_commands), toolchain_dir)]
+
+
+def toolchain_marker(toolchain_dir):
+    """The file marking a completed toolchain installation on a node.
+
+    :param str toolchain_dir: The versioned directory on the node the toolchain is installed into
+    :rtype: str
+    :return: The path to the marker file
+    """
+    return "{0:}/.installed".format(toolchain_dir)
+
+
 def create_job(batch_service_client, job_id, pool_id):
     """
     Creates a job with the specified ID, associated with the specified pool.
@@ -413,6 +688,72 @@ def upload_blob_and_create_sas(block_blob_client, container_name, blob_name, fil
     return sas_url
 
 
+def file_content_hash(file_path, block_size=1048576):
+    """Calculate the SHA-256 hash of a file's contents.
+
+    :param str file_path: The path to the file to hash
+    :param int block_size: The number of bytes read from the file at a time
+    :rtype: str
+    :return: The hex digest of the file contents
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def content_addressed_blob_name(file_path):
+    """Name a blob after the hash of the file it holds, keeping its extension.
+
+    :param str file_path: The path to the local file
+    :rtype: str
+    :return: A blob name which is identical for identical file contents
+    """
+    return "{0:}{1:}".format(file_content_hash(file_path), os.path.splitext(file_path)[1])
+
+
+def upload_files_content_addressed(block_blob_client, container_name, file_paths, expiry, max_workers=16):
+    """Uploads files concurrently to blobs named by their content, and creates SAS URLs for them.
+
+    Files whose content is already in the container (from this or any earlier
+    project) are not uploaded again, so re-running a case, or running another
+    case sharing its sky matrix or surfaces, only uploads what has changed.
+
+    :param block_blob_client: The storage block blob client to use.
+    :type block_blob_client: `azure.storage.blob.BlockBlobService`
+    :param str container_name: The name of the container to upload the blobs to.
+    :param list file_paths: The paths of the local files to upload.
+    :param expiry: The SAS expiry time.
+    :type expiry: `datetime.datetime`
+    :param int max_workers: The number of files hashed and uploaded at once.
+    :rtype: dict
+    :return: A SAS URL to the blob holding each file, keyed by file path.
+    """
+    block_blob_client.create_container(
+        container_name,
+        fail_on_exist=False)
+
+    def _upload(file_path):
+        blob_name = content_addressed_blob_name(file_path)
+        if block_blob_client.exists(container_name, blob_name):
+            print("{0:} already uploaded to {1:}/{2:}".format(os.path.basename(file_path), container_name, blob_name))
+        else:
+            block_blob_client.create_blob_from_path(container_name, blob_name, file_path)
+            print("{0:} uploaded to {1:}/{2:}".format(os.path.basename(file_path), container_name, blob_name))
+        sas_token = create_sas_token(
+            block_blob_client,
+            container_name,
+            blob_name,
+            permission=azureblob.BlobPermissions.READ,
+            expiry=expiry)
+        return block_blob_client.make_blob_url(container_name, blob_name, sas_token=sas_token)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sas_urls = executor.map(_upload, file_paths)
+        return dict(zip(file_paths, sas_urls))
+
+
 def upload_file_to_container(block_blob_client, container_name, file_path, timeout):
     """
     Uploads a local file to an Azure Blob storage container.
@@ -457,6 +798,219 @@ def download_blob_from_container(block_blob_client, container_name, blob_name, d
     print('Downloaded blob [{0:}] from container [{1:}] to {2:}'.format(blob_name, container_name, destination_file_path))
 
 
+def sky_patch_count(sky_density):
+    """The number of patches (including the ground) in a Reinhart subdivided sky.
+
+    :param int sky_density: The Reinhart sky subdivision (1 for a Tregenza sky)
+    :rtype: int
+    :return: The number of sky patches
+    """
+    return 144 * sky_density ** 2 + 2
+
+
+def estimate_grid_cost(point_count, ambient_bounces, sky_patches):
+    """Estimate the relative cost of simulating a number of analysis points.
+
+    :param int point_count: The number of analysis points
+    :param int ambient_bounces: The number of ambient bounces (-ab) simulated
+    :param int sky_patches: The number of sky patches in the sky matrix
+    :rtype: int
+    :return: A cost in arbitrary units, comparable between grids of a case
+    """
+    return point_count * max(ambient_bounces, 1) * sky_patches
+
+
+def create_work_units(analysis_grid_paths, target_cost, ambient_bounces, sky_patches):
+    """Balance the analysis grids of a case into work units of similar simulation cost.
+
+    Grids costing more than target_cost are split into near-equal parts, and
+    the resulting grids and parts are then packed (largest first) into units
+    costing up to target_cost each, so small zones share one simulation and
+    large zones no longer set the length of the whole job.
+
+    :param list analysis_grid_paths: The paths to the analysis grid JSON files of the case
+    :param int target_cost: The estimated cost (from estimate_grid_cost) of each work unit
+    :param int ambient_bounces: The number of ambient bounces (-ab) simulated
+    :param int sky_patches: The number of sky patches in the sky matrix
+    :rtype: list
+    :return: A list of work units, each a list of grid parts. Each part is a dict holding the analysis grid to
+        simulate ("analysis_grid"), the name of the result file for the analysis grid file it belongs to
+        ("result_file"), the index of its grid in that file ("grid"), its position amongst the parts of that grid
+        ("part" of "parts"), and the number of parts of all the grids in the file ("file_parts").
+    """
+    parts = []
+    for analysis_grid_path in analysis_grid_paths:
+        result_file = normalise_string(os.path.splitext(os.path.basename(analysis_grid_path))[0]) + "_result.json"
+        with open(analysis_grid_path) as f:
+            analysis_grids = json.load(f)["analysis_grids"]
+        file_parts = []
+        for grid, analysis_grid in enumerate(analysis_grids):
+            points = analysis_grid["analysis_points"]
+            if not points:
+                print("Analysis grid {0:} in {1:} has no points - it will not be simulated".format(analysis_grid["name"], analysis_grid_path))
+                continue
+            cost = estimate_grid_cost(len(points), ambient_bounces, sky_patches)
+            part_count = max(1, int(-(-cost // target_cost)))
+            part_size = int(-(-len(points) // part_count))
+            for part, part_points in enumerate(chunks(points, part_size)):
+                file_parts.append({
+                    "analysis_grid": {"name": "{0:}_part{1:}".format(analysis_grid["name"], part) if part_count > 1
+                                      else analysis_grid["name"], "analysis_points": part_points},
+                    "zone": analysis_grid["name"], "result_file": result_file, "grid": grid, "part": part,
+                    "parts": part_count, "cost": estimate_grid_cost(len(part_points), ambient_bounces, sky_patches)})
+        for part in file_parts:
+            part["file_parts"] = len(file_parts)
+        parts.extend(file_parts)
+
+    # First fit decreasing bin packing of the parts into work units
+    work_units = []
+    work_unit_costs = []
+    for part in sorted(parts, key=lambda i: i["cost"], reverse=True):
+        for n, work_unit_cost in enumerate(work_unit_costs):
+            if work_unit_cost + part["cost"] <= target_cost:
+                work_units[n].append(part)
+                work_unit_costs[n] += part["cost"]
+                break
+        else:
+            work_units.append([part])
+            work_unit_costs.append(part["cost"])
+    return work_units
+
+
+class WorkUnitResultsMerger(object):
+    """Reassembles the per-zone result files from the results of the work units holding each zone's parts.
+
+    Once every part of every grid in a zone's analysis grid file has arrived
+    its points are written, with the grids in file order and each grid's
+    points in their original order, to the zone's result file (in the format
+    written by RunHoneybeeRadiance.py for the same file). Adding results is
+    safe from multiple threads.
+    """
+
+    def __init__(self, work_units, directory_path, on_zone_completed=None):
+        """
+        :param dict work_units: The parts in each work unit (from create_work_units), keyed by work unit result file
+        :param str directory_path: The directory to write the zone result files to
+        :param on_zone_completed: Called with the path to each zone result file once it is written
+        """
+        self.directory_path = directory_path
+        self.on_zone_completed = on_zone_completed
+        self._work_units = work_units
+        self._zone_parts = {}
+        self._lock = threading.Lock()
+
+    def add(self, work_unit_result_path):
+        """Add the results of a work unit, writing the results of any zones it completes.
+
+        :param str work_unit_result_path: The path to the work unit result file
+        """
+        with open(work_unit_result_path) as f:
+            result = {k.strip(): v for k, v in json.load(f).items()}
+        parts = self._work_units[os.path.basename(work_unit_result_path)]
+
+        # The points of each part follow on from the previous part's, as its grids are simulated in order (grid names
+        # are not unique enough to identify them by)
+        completed_zones = []
+        with self._lock:
+            start = 0
+            for part in parts:
+                end = start + len(part["analysis_grid"]["analysis_points"])
+                zone_parts = self._zone_parts.setdefault(part["result_file"], {})
+                part_result = {k: v[start:end] for k, v in result.items() if k != "name"}
+                part_result["name"] = [part["zone"]] * (end - start)
+                zone_parts[(part["grid"], part["part"])] = part_result
+                start = end
+                if len(zone_parts) == part["file_parts"]:
+                    completed_zones.append((part["result_file"], self._zone_parts.pop(part["result_file"])))
+
+        for result_file, zone_parts in completed_zones:
+            keys = sorted(zone_parts)
+            zone_result = {k: [i for key in keys for i in zone_parts[key][k]] for k in zone_parts[keys[0]]}
+            # A single grid keeps its name as a single value, otherwise each point is labelled with its grid
+            zone_names = sorted(set(zone_result["name"]), key=zone_result["name"].index)
+            if len(zone_names) == 1:
+                zone_result["name"] = zone_names[0]
+            zone_result_path = os.path.join(self.directory_path, result_file)
+            with open(zone_result_path, "w") as f:
+                json.dump(zone_result, f)
+            print("Results for {0:} written to {1:}".format(", ".join(zone_names), zone_result_path))
+            if self.on_zone_completed is not None:
+                self.on_zone_completed(zone_result_path)
+
+
+class ResultsStore(object):
+    """Results from many analysis grids, merged column by column as each result file arrives.
+
+    Every appended result is also written straight to a CSV file, so the
+    merged results on disk are usable (and complete) as soon as the last
+    result has been appended. Appending is safe from multiple threads.
+    """
+    COLUMNS = ["name", "x", "y", "z", "df", "da", "cda", "udi_less", "udi", "udi_more"]
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.columns = {column: [] for column in self.COLUMNS}
+        self._lock = threading.Lock()
+        with open(self.csv_path, "w", newline="") as f:
+            csv.writer(f).writerow(self.COLUMNS)
+
+    def __len__(self):
+        return len(self.columns["x"])
+
+    def append(self, result_path):
+        """Add the points in a result file (written by RunHoneybeeRadiance.py) to the store.
+
+        :param str result_path: The path to the result JSON file
+        """
+        with open(result_path) as f:
+            result = {k.strip(): v for k, v in json.load(f).items()}
+        if not isinstance(result["name"], list):
+            result["name"] = [result["name"]] * len(result["x"])
+
+        with self._lock:
+            for column in self.COLUMNS:
+                self.columns[column].extend(result[column])
+            with open(self.csv_path, "a", newline="") as f:
+                csv.writer(f).writerows(zip(*[result[column] for column in self.COLUMNS]))
+
+
+def download_blobs_as_completed(block_blob_client, container_name, directory_path, max_workers=8,
+                                on_blob_downloaded=None):
+    """Create a function which downloads a blob in the background each time it is called.
+
+    Downloads run concurrently in a thread pool, and the returned function's
+    wait attribute blocks until every download requested so far has finished.
+
+    :param block_blob_client: A blob service client.
+    :type block_blob_client: `azure.storage.blob.BlockBlobService`
+    :param container_name: The Azure Blob storage container from which to download the blobs.
+    :param directory_path: The local directory to which to download the blobs.
+    :param int max_workers: The number of blobs downloaded at once.
+    :param on_blob_downloaded: Called with the local path of each blob once it is downloaded.
+    :return: A function taking the name of the blob to download
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+
+    def _download(blob_name):
+        download_blob_from_container(block_blob_client, container_name, blob_name, directory_path)
+        if on_blob_downloaded is not None:
+            on_blob_downloaded(os.path.join(directory_path, blob_name))
+
+    def download(blob_name):
+        futures.append(executor.submit(_download, blob_name))
+
+    def wait():
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        finally:
+            executor.shutdown()
+
+    download.wait = wait
+    return download
+
+
 def generate_unique_resource_name(resource_prefix):
     """Generates a unique resource name by appending a time string after the specified prefix.
 
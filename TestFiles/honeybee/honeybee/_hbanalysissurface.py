@@ -78,39 +78,67 @@ class HBAnalysisSurface(HBObject):
             self.add_surface_state(state)
 
     @classmethod
-    def from_json(cls, srf_json):
+    def from_json(cls, srf_json, materials=None):
         """Create a surface from json object.
 
         The minimum schema is:
             {"name": "",
             "vertices": [[(x, y, z), (x1, y1, z1), (x2, y2, z2)]],
-            "surface_material": {},  // radiance material json file
+            "surface_material": {},  // radiance material json file or material name
              "surface_type": null  // 0: wall, 5: window
             }
+
+        Args:
+            srf_json: A surface as a dictionary.
+            materials: An optional dictionary of {name: material} from
+                materials_from_json. surface_material can be the name of one of these
+                materials and the surfaces will share the same material instance.
         """
         name = srf_json["name"]
         vertices = srf_json["vertices"]
         type_id = srf_json["surface_type"]
         srf_type = surfacetype.SurfaceTypes.get_type_by_key(type_id)
         HBsrf = cls(name, vertices, srf_type)
-        # Check material type and determine appropriate "from_json" classmethod
         if "surface_material" in srf_json.keys():
             material_json = srf_json["surface_material"]
-            type = material_json["type"]
-            if type == "plastic":
-                radiance_material = Plastic.from_json(material_json)
-            elif type == "metal":
-                radiance_material = Metal.from_json(material_json)
-            elif type == "glass":
-                radiance_material = Glass.from_json(material_json)
+            if isinstance(material_json, basestring):
+                try:
+                    radiance_material = materials[material_json]
+                except (KeyError, TypeError):
+                    raise ValueError(
+                        'Material {} for {} is not in the materials.'.format(
+                            material_json, name))
             else:
-                # raise ValueError "The material type {} in the surface json is either
-                # not currently suported or incorrect"
-                # .format(srf_json["surface_material"])
-                radiance_material = None
+                radiance_material = cls._radiance_material_from_json(material_json)
             HBsrf.radiance_material = radiance_material
         return HBsrf
 
+    @classmethod
+    def materials_from_json(cls, materials_json):
+        """Create a dictionary of {name: material} from a list of material json objects.
+
+        Use this method to create each material once for surfaces which reference
+        their material by name.
+        """
+        return dict((mat_json["name"], cls._radiance_material_from_json(mat_json))
+                    for mat_json in materials_json)
+
+    @staticmethod
+    def _radiance_material_from_json(material_json):
+        """Check material type and use the appropriate "from_json" classmethod."""
+        type = material_json["type"]
+        if type == "plastic":
+            return Plastic.from_json(material_json)
+        elif type == "metal":
+            return Metal.from_json(material_json)
+        elif type == "glass":
+            return Glass.from_json(material_json)
+        else:
+            # raise ValueError "The material type {} in the surface json is either
+            # not currently suported or incorrect"
+            # .format(srf_json["surface_material"])
+            return None
+
     @classmethod
     def from_rad_ep_properties(
         cls, name, sorted_points, surface_type=None, is_name_set_by_user=False,
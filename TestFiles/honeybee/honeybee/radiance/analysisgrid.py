@@ -4,11 +4,20 @@ from ..utilcol import random_name
 from ..dataoperation import match_data
 from ..schedule import Schedule
 from .analysispoint import AnalysisPoint
+from .matrix import matrix_index, load_matrix, row_chunks
+from .resultstore import ResultStore, PointValues, mode_values
+from . import metrics
 
 import os
-from itertools import izip
+from itertools import izip, repeat
 from collections import namedtuple, OrderedDict
 
+try:
+    import numpy as np
+except ImportError:
+    # IronPython or NumPy is not installed
+    np = None
+
 
 class EmptyFileError(Exception):
     """Exception for trying to load results from an empty file."""
@@ -31,7 +40,7 @@ class AnalysisGrid(object):
     """
 
     __slots__ = ('_analysis_points', '_name', '_sources', '_wgroups', '_directFiles',
-                 '_totalFiles')
+                 '_totalFiles', '_result_store')
 
     def __init__(self, analysis_points, name=None, window_groups=None):
         """Initialize a AnalysisPointGroup.
@@ -60,6 +69,7 @@ class AnalysisGrid(object):
         self._analysis_points = analysis_points
         self._directFiles = []  # list of results files
         self._totalFiles = []  # list of results files
+        self._result_store = None  # arrays of values for all the points if loaded
 
     @classmethod
     def from_json(cls, ag_json):
@@ -200,36 +210,61 @@ class AnalysisGrid(object):
                 hourlyValues, hoys, source, state, is_direct)
 
     def parse_header(self, inf, start_line, hoys, check_point_count=False):
-        """Parse radiance matrix header."""
-        # read the header
-        for i in xrange(40):
-            line = inf.next()
-            if line[:6] == 'FORMAT':
-                inf.next()  # pass empty line
-                break  # done with the header!
-            elif start_line == 0 and line[:5] == 'NROWS':
-                points_count = int(line.split('=')[-1])
-                if check_point_count:
-                    assert len(self._analysis_points) == points_count, \
-                        "Length of points [{}] must match the number " \
-                        "of rows [{}].".format(
-                            len(self._analysis_points), points_count)
-
-            elif start_line == 0 and line[:5] == 'NCOLS':
-                hours_count = int(line.split('=')[-1])
-                if hoys:
-                    assert hours_count == len(hoys), \
-                        "Number of hours [{}] must match the " \
-                        "number of columns [{}]." \
-                        .format(len(hoys), hours_count)
-                else:
-                    hoys = xrange(0, hours_count)
+        """Parse radiance matrix header and move to the first row after the header.
+
+        The header is read once for each file and is reused for the other grids which
+        read their results from the same file.
+        """
+        header = matrix_index(inf.name).header
+        if start_line == 0 and header.nrows is not None and check_point_count:
+            assert len(self._analysis_points) == header.nrows, \
+                "Length of points [{}] must match the number " \
+                "of rows [{}].".format(len(self._analysis_points), header.nrows)
+
+        if start_line == 0 and header.ncols is not None:
+            if hoys:
+                assert header.ncols == len(hoys), \
+                    "Number of hours [{}] must match the " \
+                    "number of columns [{}]." \
+                    .format(len(hoys), header.ncols)
+            else:
+                hoys = xrange(0, header.ncols)
 
+        inf.seek(header.offset)
         return inf, hoys
 
+    def matrix_rows(self, inf, start_line=None, hoys=None, header=True,
+                    check_point_count=False):
+        """Return an iterator of the rows of values in an open result file.
+
+        Binary float and double matrices are memory-mapped using NumPy and ASCII
+        matrices are read one line at a time. The file is moved to start_line using
+        the matrix index for the file instead of reading the rows before it.
+
+        Args:
+            inf: A result file opened in 'rb' mode.
+            start_line: Number of start lines after the header from 0 (default: 0).
+            hoys: A collection of hours of the year to check against the header.
+            header: A Boolean to declare if the file has header (default: True).
+            check_point_count: A Boolean to check the number of rows in the header
+                against the number of analysis points (default: False).
+
+        Returns:
+            An iterator of sequences of values for each row from start_line.
+        """
+        st = start_line or 0
+        if header:
+            inf, _ = self.parse_header(inf, st, hoys, check_point_count)
+            if matrix_index(inf.name).header.is_binary:
+                return (row.tolist() for row in load_matrix(inf.name)[st:])
+
+        inf.seek(matrix_index(inf.name).row_offset(st))
+
+        return (line.split() for line in inf)
+
     def set_values_from_file(self, file_path, hoys=None, source=None, state=None,
                              start_line=None, is_direct=False, header=True,
-                             check_point_count=True, mode=0):
+                             check_point_count=True, mode=0, memory_map=False):
         """Load values for test points from a file.
 
         Args:
@@ -246,6 +281,10 @@ class AnalysisGrid(object):
                 will be 1. This is useful for studies such as sunlight hours. 2 >
                 load the values divided by mode number. Use this mode for daylight
                 factor or radiation analysis.
+            memory_map: Set to True to memory-map binary result files instead of
+                loading the values to the memory. Values are only read from the file
+                when they are accessed which makes it possible to post-process grids
+                that are larger than the memory. Requires NumPy (default: False).
         """
 
         if os.path.getsize(file_path) < 2:
@@ -253,26 +292,30 @@ class AnalysisGrid(object):
 
         st = start_line or 0
 
+        store = self._get_result_store(hoys)
+        if store is not None:
+            self._set_store_values(store, file_path, st, header, check_point_count,
+                                   source, state, is_direct, mode, memory_map)
+            self.add_result_files(file_path, hoys, st, is_direct, header, mode)
+            self._update_direct_loaded(store)
+            return
+
         with open(file_path, 'rb') as inf:
-            if header:
-                inf, _ = self.parse_header(inf, st, hoys, check_point_count)
+            rows = self.matrix_rows(inf, st, hoys, header, check_point_count)
 
             self.add_result_files(file_path, hoys, st, is_direct, header, mode)
 
-            for i in xrange(st):
-                inf.next()
-
             end = len(self._analysis_points)
             if mode == 0:
-                values = (tuple(int(float(r)) for r in inf.next().split())
+                values = (tuple(int(float(r)) for r in rows.next())
                           for count in xrange(end))
             elif mode == 1:
                 # binary 0-1 (useful for solaraccess studies)
-                values = (tuple(1 if float(r) > 0 else 0 for r in inf.next().split())
+                values = (tuple(1 if float(r) > 0 else 0 for r in rows.next())
                           for count in xrange(end))
             else:
                 # divide values by mode (useful for daylight factor calculation)
-                values = (tuple(float(r) / mode for r in inf.next().split())
+                values = (tuple(float(r) / mode for r in rows.next())
                           for count in xrange(end))
 
             # assign the values to points
@@ -282,7 +325,8 @@ class AnalysisGrid(object):
 
     def set_coupled_values_from_file(
             self, total_file_path, direct_file_path, hoys=None, source=None, state=None,
-            start_line=None, header=True, check_point_count=True, mode=0):
+            start_line=None, header=True, check_point_count=True, mode=0,
+            memory_map=False):
         """Load direct and total values for test points from two files.
 
         Args:
@@ -297,6 +341,10 @@ class AnalysisGrid(object):
                 will be 1. This is useful for studies such as sunlight hours. 2 >
                 load the values divided by mode number. Use this mode for daylight
                 factor or radiation analysis.
+            memory_map: Set to True to memory-map binary result files instead of
+                loading the values to the memory. Values are only read from the file
+                when they are accessed which makes it possible to post-process grids
+                that are larger than the memory. Requires NumPy (default: False).
         """
 
         for file_path in (total_file_path, direct_file_path):
@@ -305,37 +353,45 @@ class AnalysisGrid(object):
 
         st = start_line or 0
 
-        with open(total_file_path, 'rb') as inf, open(direct_file_path, 'rb') as dinf:
-            if header:
-                inf, _ = self.parse_header(inf, st, hoys, check_point_count)
-                dinf, _ = self.parse_header(dinf, st, hoys, check_point_count)
+        store = self._get_result_store(hoys)
+        if store is not None:
+            self._set_store_values(store, total_file_path, st, header, check_point_count,
+                                   source, state, False, mode, memory_map)
+            self._set_store_values(store, direct_file_path, st, header,
+                                   check_point_count, source, state, True, mode,
+                                   memory_map)
 
             self.add_result_files(total_file_path, hoys, st, False, header, mode)
             self.add_result_files(direct_file_path, hoys, st, True, header, mode)
+            self._update_direct_loaded(store)
+            return
 
-            for i in xrange(st):
-                inf.next()
-                dinf.next()
+        with open(total_file_path, 'rb') as inf, open(direct_file_path, 'rb') as dinf:
+            rows = self.matrix_rows(inf, st, hoys, header, check_point_count)
+            drows = self.matrix_rows(dinf, st, hoys, header, check_point_count)
+
+            self.add_result_files(total_file_path, hoys, st, False, header, mode)
+            self.add_result_files(direct_file_path, hoys, st, True, header, mode)
 
             end = len(self._analysis_points)
 
             if mode == 0:
                 coupled_values = (
                     tuple((int(float(r)), int(float(d))) for r, d in
-                          izip(inf.next().split(), dinf.next().split()))
+                          izip(rows.next(), drows.next()))
                     for count in xrange(end))
             elif mode == 1:
                 # binary 0-1
                 coupled_values = (tuple(
                     (int(float(1 if float(r) > 0 else 0)),
                      int(float(1 if float(d) > 0 else 0)))
-                    for r, d in izip(inf.next().split(), dinf.next().split()))
+                    for r, d in izip(rows.next(), drows.next()))
                     for count in xrange(end))
             else:
                 # divide values by mode (useful for daylight factor calculation)
                 coupled_values = (
                     tuple((float(r) / mode, float(d) / mode) for r, d in
-                          izip(inf.next().split(), dinf.next().split()))
+                          izip(rows.next(), drows.next()))
                     for count in xrange(end))
 
             # assign the values to points
@@ -375,7 +431,13 @@ class AnalysisGrid(object):
         if self.digit_sign == 1:
             self.load_values_from_files()
 
-        return (p.combined_value_by_id(hoys, blinds_state_ids) for p in self)
+        store = self._loaded_store()
+        if store is None:
+            return (p.combined_values_by_id(hoys, blinds_state_ids) for p in self)
+
+        return (izip(total, direct) for total, direct in
+                self._combined_values(store, hoys, blinds_state_ids,
+                                     lambda v: v.tolist()))
 
     def sum_values_by_id(self, hoys=None, blinds_state_ids=None):
         """Get sum of value for all the hours.
@@ -393,7 +455,14 @@ class AnalysisGrid(object):
         if self.digit_sign == 1:
             self.load_values_from_files()
 
-        return (p.sum_values_by_id(hoys, blinds_state_ids) for p in self)
+        store = self._loaded_store()
+        if store is None:
+            return (p.sum_values_by_id(hoys, blinds_state_ids) for p in self)
+
+        # direct values are 0 if they are not loaded
+        return ((total, direct or 0) for total, direct in
+                self._combined_values(store, hoys, blinds_state_ids,
+                                     lambda v: v.sum(axis=1).tolist()))
 
     def max_values_by_id(self, hoys=None, blinds_state_ids=None):
         """Get maximum value for all the hours.
@@ -409,7 +478,40 @@ class AnalysisGrid(object):
         if self.digit_sign == 1:
             self.load_values_from_files()
 
-        return (p.max_values_by_id(hoys, blinds_state_ids) for p in self)
+        store = self._loaded_store()
+        if store is None:
+            return (p.max_values_by_id(hoys, blinds_state_ids) for p in self)
+
+        return self._combined_values(store, hoys, blinds_state_ids,
+                                     lambda v: v.max(axis=1).tolist())
+
+    def _combined_values(self, store, hoys, blinds_state_ids, reduce_values,
+                         chunk_size=1000):
+        """Combine the values from a result store for chunks of points.
+
+        Args:
+            store: A ResultStore with the values of all the points.
+            hoys: A collection of hours of the year (default: self.hoys).
+            blinds_state_ids: List of state ids for all the sources for input hoys.
+            reduce_values: A function to get a list of values for each point from an
+                array of (points, hours) (e.g. sum of the values for each point).
+
+        Returns:
+            A generator of (total, direct) for each point. direct is None if the
+            direct values are not loaded.
+        """
+        hoys = hoys or self.hoys
+        is_direct_loaded = store.has_direct_values
+        for start in xrange(0, len(self._analysis_points), chunk_size):
+            points = slice(start, min(start + chunk_size, len(self._analysis_points)))
+            total = store.combined_values(blinds_state_ids, False, points, hoys)
+            if is_direct_loaded:
+                direct = reduce_values(
+                    store.combined_values(blinds_state_ids, True, points, hoys))
+            else:
+                direct = repeat(None)
+            for values in izip(reduce_values(total), direct):
+                yield values
 
     def annual_metrics(self, da_threshhold=None, udi_min_max=None, blinds_state_ids=None,
                        occ_schedule=None):
@@ -449,7 +551,8 @@ class AnalysisGrid(object):
         hoys = self.hoys
         occ_schedule = occ_schedule or Schedule.eight_am_to_six_pm()
 
-        if results_loaded:
+        store = self._loaded_store()
+        if results_loaded and store is None:
             blinds_state_ids = blinds_state_ids or [[0] * len(self.sources)] * len(hoys)
 
             for sensor in self.analysis_points:
@@ -459,6 +562,14 @@ class AnalysisGrid(object):
                                                             occ_schedule
                                                             )):
                     res[c].append(r)
+        elif np is not None:
+            # calculate the metrics for chunks of points at once
+            hoys, chunks = self._value_chunks(store, blinds_state_ids)
+            occupied = metrics.occupancy_mask(hoys, occ_schedule)
+            for values in chunks:
+                for c, r in enumerate(metrics.annual_metrics(
+                        values, occupied, da_threshhold, udi_min_max)):
+                    res[c].extend(r.tolist())
         else:
             # This is a method for annual recipe to load the results line by line
             # which unlike the other method doesn't load all the values to the memory
@@ -480,17 +591,13 @@ class AnalysisGrid(object):
                 st = start_line or 0
 
                 with open(file_path, 'rb') as inf:
-                    if header:
-                        inf, _ = self.parse_header(inf, st, hoys, False)
-
-                    for i in xrange(st):
-                        inf.next()
+                    rows = self.matrix_rows(inf, st, hoys, header)
 
                     end = len(self._analysis_points)
 
                     # load one line at a time
                     for count in xrange(end):
-                        values = (int(float(r)) for r in inf.next().split())
+                        values = (int(float(r)) for r in rows.next())
                         for c, r in enumerate(
                             calculate_annual_metrics(
                                 values, hoys, da_threshhold, udi_min_max,
@@ -537,7 +644,8 @@ class AnalysisGrid(object):
         hoys = self.hoys
         occ_schedule = occ_schedule or Schedule.eight_am_to_six_pm()
 
-        if results_loaded:
+        store = self._loaded_store()
+        if results_loaded and store is None:
             blinds_state_ids = blinds_state_ids or [[0] * len(self.sources)] * len(hoys)
 
             for sensor in self.analysis_points:
@@ -546,6 +654,14 @@ class AnalysisGrid(object):
                                                                occ_schedule
                                                                )):
                     res[c].append(r)
+        elif np is not None:
+            # calculate the metrics for chunks of points at once
+            hoys, chunks = self._value_chunks(store, blinds_state_ids)
+            occupied = metrics.occupancy_mask(hoys, occ_schedule)
+            for values in chunks:
+                for c, r in enumerate(metrics.daylight_autonomy(
+                        values, occupied, da_threshhold)):
+                    res[c].extend(r.tolist())
         else:
             # This is a method for annual recipe to load the results line by line
             # which unlike the other method doesn't load all the values to the memory
@@ -569,17 +685,13 @@ class AnalysisGrid(object):
                 st = start_line or 0
 
                 with open(file_path, 'rb') as inf:
-                    if header:
-                        inf, _ = self.parse_header(inf, st, hoys, False)
-
-                    for i in xrange(st):
-                        inf.next()
+                    rows = self.matrix_rows(inf, st, hoys, header)
 
                     end = len(self._analysis_points)
 
                     # load one line at a time
                     for count in xrange(end):
-                        values = (int(float(r)) for r in inf.next().split())
+                        values = (int(float(r)) for r in rows.next())
                         for c, r in enumerate(
                             calculate_daylight_autonomy(
                                 values, hoys, da_threshhold,
@@ -646,7 +758,8 @@ class AnalysisGrid(object):
         hoys = self.hoys
         occ_schedule = occ_schedule or set(hoys)
 
-        if results_loaded:
+        store = self._loaded_store()
+        if results_loaded and store is None:
             blinds_state_ids = blinds_state_ids or [[0] * len(self.sources)] * len(hoys)
 
             for sensor in self.analysis_points:
@@ -656,6 +769,19 @@ class AnalysisGrid(object):
                                                                       target_hours
                                                                       )):
                     res[c].append(r)
+        elif np is not None:
+            # calculate the exposure for chunks of points at once
+            hoys, chunks = self._value_chunks(store, blinds_state_ids, True)
+            occupied = metrics.occupancy_mask(hoys, occ_schedule)
+            for values in chunks:
+                ase, exposed = metrics.annual_sunlight_exposure(
+                    values, occupied, threshhold)
+                success = ase < target_hours
+                res[0].extend(success.tolist())
+                res[1].extend(ase.tolist())
+                # problematic hours are only collected for the failing points
+                res[2].extend([] if ok else [hoys[i] for i in np.flatnonzero(hours)]
+                              for ok, hours in izip(success, exposed))
         else:
             # This is a method for annual recipe to load the results line by line
             # which unlike the other method doesn't load all the values to the memory
@@ -679,17 +805,13 @@ class AnalysisGrid(object):
                 st = start_line or 0
 
                 with open(file_path, 'rb') as inf:
-                    if header:
-                        inf, _ = self.parse_header(inf, st, hoys, False)
-
-                    for i in xrange(st):
-                        inf.next()
+                    rows = self.matrix_rows(inf, st, hoys, header)
 
                     end = len(self._analysis_points)
 
                     # load one line at a time
                     for count in xrange(end):
-                        values = (int(float(r)) for r in inf.next().split())
+                        values = (int(float(r)) for r in rows.next())
                         for c, r in enumerate(
                             calculate_annual_sunlight_exposure(
                                 values, hoys, threshhold, blinds_state_ids, occ_schedule,
@@ -715,6 +837,116 @@ class AnalysisGrid(object):
         return per_problematic < target_area, ase_values, per_problematic, \
             problematic_points, problematic_hours
 
+    def _value_chunks(self, store=None, blinds_state_ids=None, is_direct=False):
+        """Get the hours and a generator of arrays of (points, hours) of values.
+
+        Values are combined from the result store if it's provided and are read from
+        the result files otherwise.
+        """
+        if store is not None:
+            return store.hoys, store.value_chunks(blinds_state_ids, is_direct)
+        file_data = self.result_files[1 if is_direct else 0][0]
+        return file_data.hoys, self._result_value_chunks(file_data)
+
+    def _result_value_chunks(self, file_data):
+        """Yield arrays of (points, hours) for chunks of points from a result file.
+
+        Values are truncated to integers the same as the other illuminance loaders.
+        """
+        file_path, hoys, start_line, header, mode = file_data
+        if os.path.getsize(file_path) < 2:
+            raise EmptyFileError(file_path)
+
+        assert mode == 0, \
+            TypeError(
+                'Annual results can only be calculated from '
+                'illuminance studies.')
+
+        with open(file_path, 'rb') as inf:
+            for values in self._matrix_chunks(inf, start_line, hoys, header):
+                yield np.trunc(values)
+
+    def _matrix_chunks(self, inf, start_line=None, hoys=None, header=True,
+                       check_point_count=False, chunk_size=1000):
+        """Yield arrays of (points, hours) for chunks of points from an open file.
+
+        Binary matrices are sliced from the memory-mapped matrix and ASCII matrices are
+        parsed one chunk of rows at a time.
+        """
+        st = start_line or 0
+        end = len(self._analysis_points)
+        rows = self.matrix_rows(inf, st, hoys, header, check_point_count)
+        if not (header and matrix_index(inf.name).header.is_binary):
+            for values in row_chunks(rows, end, chunk_size):
+                yield values
+            return
+
+        matrix = load_matrix(inf.name)
+        for i in xrange(st, min(st + end, len(matrix)), chunk_size):
+            yield np.asarray(matrix[i:min(i + chunk_size, st + end)], dtype=float)
+
+    def _get_result_store(self, hoys):
+        """Get the ResultStore to load the values for hoys.
+
+        A new store will be created if the analysis points have no values. Returns None
+        if NumPy is not available or the values can't be added to the current store.
+        In that case the values should be loaded to each point.
+        """
+        if np is None or hoys is None:
+            return None
+
+        store = self._result_store
+        if store is None:
+            if self.has_values:
+                # values are loaded to analysis points
+                return None
+            store = ResultStore(len(self._analysis_points), hoys)
+            for count, ap in enumerate(self._analysis_points):
+                ap._sources = store.sources
+                ap._values = store.point_values(count)
+            self._result_store = store
+        elif store.hoys != tuple(hoys):
+            return None
+
+        return store
+
+    def _set_store_values(self, store, file_path, start_line, header, check_point_count,
+                          source, state, is_direct, mode, memory_map):
+        """Memory-map or copy the values from a result file to the result store."""
+        hoys = store.hoys
+        with open(file_path, 'rb') as inf:
+            if memory_map and header and matrix_index(file_path).header.is_binary:
+                # only check the header
+                self.matrix_rows(inf, start_line, hoys, header, check_point_count)
+                matrix = load_matrix(file_path)
+                store.set_matrix(
+                    matrix[start_line:start_line + len(self._analysis_points)],
+                    source, state, is_direct, mode)
+                return
+
+            # copy the values to the arrays of the grid one chunk of points at a time
+            start = 0
+            for values in self._matrix_chunks(inf, start_line, hoys, header,
+                                              check_point_count):
+                store.set_values(mode_values(values, mode), source, state, is_direct,
+                                 start)
+                start += len(values)
+
+    def _loaded_store(self):
+        """Get the ResultStore if the values of all the points are loaded to it."""
+        store = self._result_store
+        if store is None or not all(
+                isinstance(ap._values, PointValues) and ap._values._store is store
+                for ap in self._analysis_points):
+            return None
+        return store
+
+    def _update_direct_loaded(self, store):
+        """Update has_direct_values for analysis points after loading the values."""
+        is_direct_loaded = store.has_direct_values
+        for ap in self._analysis_points:
+            ap._is_directLoaded = is_direct_loaded
+
     def parse_blind_states(self, blinds_state_ids):
         """Parse input blind states.
 
@@ -730,9 +962,15 @@ class AnalysisGrid(object):
         """
         return self.analysis_points[0].parse_blind_states(blinds_state_ids)
 
-    def load_values_from_files(self):
-        """Load grid values from self.result_files."""
+    def load_values_from_files(self, memory_map=False):
+        """Load grid values from self.result_files.
+
+        Args:
+            memory_map: Set to True to memory-map binary result files instead of
+                loading the values to the memory (default: False).
+        """
         # remove old results
+        self._result_store = None
         for ap in self._analysis_points:
             ap._sources = OrderedDict()
             ap._values = []
@@ -755,7 +993,7 @@ class AnalysisGrid(object):
                         self.name, source, state, rfPath, dfPath))
                 self.set_coupled_values_from_file(
                     rfPath, dfPath, hoys, source, state, start_line, header,
-                    False, mode
+                    False, mode, memory_map
                 )
         elif r_files:
             for rf in r_files:
@@ -766,8 +1004,9 @@ class AnalysisGrid(object):
                 print('\nloading the results for {} AnalysisGrid form {}::{}\n{}\n'
                       .format(self.name, source, state, rfPath))
                 self.set_values_from_file(
-                    rf, hoys, source, state, start_line, is_direct=False,
-                    header=header, check_point_count=False, mode=mode
+                    rfPath, hoys, source, state, start_line, is_direct=False,
+                    header=header, check_point_count=False, mode=mode,
+                    memory_map=memory_map
                 )
         elif d_files:
             for rf in d_files:
@@ -778,14 +1017,16 @@ class AnalysisGrid(object):
                 print('\nloading the results for {} AnalysisGrid form {}::{}\n{}\n'
                       .format(self.name, source, state, rfPath))
                 self.set_values_from_file(
-                    rf, hoys, source, state, start_line, is_direct=True,
-                    header=header, check_point_count=False, mode=mode
+                    rfPath, hoys, source, state, start_line, is_direct=True,
+                    header=header, check_point_count=False, mode=mode,
+                    memory_map=memory_map
                 )
 
     def unload(self):
         """Remove all the sources and values from analysis_points."""
         self._totalFiles = []
         self._directFiles = []
+        self._result_store = None
 
         for ap in self._analysis_points:
             ap._sources = OrderedDict()
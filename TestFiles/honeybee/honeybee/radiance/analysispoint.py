@@ -1,13 +1,20 @@
 # """Honeybee PointGroup and TestPointGroup."""
 from __future__ import division
 from ..vectormath.euclid import Point3, Vector3
-from ..schedule import Schedule
+from ..schedule import Schedule, occupancy_mask
+from .resultstore import PointValues
 from collections import defaultdict, OrderedDict
-from itertools import izip
+from itertools import izip, compress, repeat
 import types
 import copy
 import ladybug.dt as dt
 
+try:
+    import numpy as np
+except ImportError:
+    # IronPython or NumPy is not installed
+    np = None
+
 
 class AnalysisPoint(object):
     """A radiance analysis point.
@@ -24,7 +31,9 @@ class AnalysisPoint(object):
     a single point (8760 * sources * states for each source). The data are sorted as
     integers and in different lists for each source. There are several methods to
     set or get the data but if you're interested in more details read the comments
-    under __init__ to know how the data is stored.
+    under __init__ to know how the data is stored. When an AnalysisGrid loads the
+    values from result files and NumPy is available the values are stored in arrays
+    for the whole grid and each point only keeps a view to its values.
 
     In this class:
      - Id stands for 'the id of a blind state'. Each state has a name and an ID will
@@ -51,6 +60,8 @@ class AnalysisPoint(object):
         # inside each source list there will be a dictionary for each state
         # in each dictionary the key is the hoy and the values are a list which
         # is [total, direct]. If the value is not available it will be None
+        # If the values are loaded to a ResultStore by the analysis grid this will be
+        # a PointValues view with the same structure.
         self._values = []
         self._is_directLoaded = False
         self.logic = self._logic
@@ -247,6 +258,15 @@ class AnalysisPoint(object):
         def double():
             return [None, None]
 
+        if not isinstance(self._values, list):
+            # values are a view to the values of the analysis grid. copy them to this
+            # point before changing them.
+            self._sources = copy.deepcopy(self._sources)
+            self._values = [
+                [defaultdict(double, ((moy, list(v)) for moy, v in sv.iteritems()))
+                 for sv in source_values]
+                for source_values in self._values.to_list()]
+
         current_sources = self._sources.keys()
         if source not in current_sources:
             self._sources[source] = {
@@ -573,6 +593,14 @@ class AnalysisPoint(object):
             'There should be a list of states for each hour. #states[{}] != #hours[{}]' \
             .format(len(blinds_state_ids), len(hoys))
 
+        if isinstance(self._values, PointValues):
+            # combine the values for all the hours at once
+            total, direct = self._store_combined_values(hoys, blinds_state_ids)
+            for value in izip(total.tolist(),
+                              repeat(None) if direct is None else direct.tolist()):
+                yield value
+            return
+
         dir_value = 0 if self._is_directLoaded else None
         for count, hoy in enumerate(hoys):
             total = 0
@@ -597,6 +625,18 @@ class AnalysisPoint(object):
 
             yield total, direct
 
+    def _store_combined_values(self, hoys, blinds_state_ids):
+        """Get arrays of combined total and direct values from the ResultStore.
+
+        Direct values will be None if they are not loaded.
+        """
+        store = self._values.store
+        points = [self._values.index]
+        total = store.combined_values(blinds_state_ids, False, points, hoys)[0]
+        if not self._is_directLoaded:
+            return total, None
+        return total, store.combined_values(blinds_state_ids, True, points, hoys)[0]
+
     def sum_values_by_id(self, hoys=None, blinds_state_ids=None):
         """Get sum of value for all the hours.
 
@@ -682,6 +722,9 @@ class AnalysisPoint(object):
         print("Blinds combinations:\n{}".format(
               '\n'.join(str(ids) for ids in comb_ids)))
 
+        if isinstance(self._values, PointValues):
+            return self._store_blinds_state(hoys, comb_ids, args, kwargs)
+
         # collect the results for each combination
         results = range(len(comb_ids))
         for count, state in enumerate(comb_ids):
@@ -712,6 +755,54 @@ class AnalysisPoint(object):
         blinds_state = tuple(comb_ids[ids] for ids in blinds_index)
         return blinds_state, blinds_index, ill_values, dir_values, success
 
+    def _store_blinds_state(self, hoys, comb_ids, args, kwargs):
+        """Calculate blinds state for values in a ResultStore.
+
+        The values for all the combinations are loaded as arrays of (combinations,
+        hours) and the logic is evaluated for all of them at once. If the logic doesn't
+        work with arrays it will be evaluated for each value separately.
+        """
+        hours_count = len(hoys)
+        ill = np.empty((len(comb_ids), hours_count))
+        ill_dir = np.empty((len(comb_ids), hours_count)) \
+            if self._is_directLoaded else None
+        for count, state in enumerate(comb_ids):
+            total, direct = self._store_combined_values(hoys, [state] * hours_count)
+            ill[count] = total
+            if ill_dir is not None:
+                ill_dir[count] = direct
+
+        try:
+            fails = np.asarray(
+                self.logic(ill, ill_dir, np.array(hoys, dtype=float), args, kwargs),
+                dtype=bool)
+            fails = np.broadcast_to(fails, ill.shape)
+        except (ValueError, TypeError):
+            # the logic only works for single values
+            fails = np.array([
+                [bool(self.logic(ill[c, h], None if ill_dir is None else ill_dir[c, h],
+                                 hoy, args, kwargs))
+                 for h, hoy in enumerate(hoys)]
+                for c in xrange(len(comb_ids))], dtype=bool).reshape(ill.shape)
+
+        # use the first state which meets the logic and the last state if none of them
+        # meets the logic.
+        passes = ~fails
+        has_passed = passes.any(axis=0)
+        blinds_index = np.where(has_passed, passes.argmax(axis=0), len(comb_ids) - 1)
+        success = np.where(has_passed, (blinds_index > 0).astype(int), -1)
+
+        hours = np.arange(hours_count)
+        ill_values = ill[blinds_index, hours].tolist()
+        if ill_dir is None:
+            dir_values = [None] * hours_count
+        else:
+            dir_values = ill_dir[blinds_index, hours].tolist()
+
+        blinds_index = blinds_index.tolist()
+        blinds_state = tuple(comb_ids[ids] for ids in blinds_index)
+        return blinds_state, blinds_index, ill_values, dir_values, success.tolist()
+
     def annual_metrics(self, da_threshhold=None, udi_min_max=None, blinds_state_ids=None,
                        occ_schedule=None):
         """Calculate annual metrics.
@@ -757,12 +848,10 @@ class AnalysisPoint(object):
         udi = 0
         udi_l = 0
         udi_m = 0
-        total_hour_count = len(hours)
+        occupied = occupancy_mask(hours, schedule)
+        total_hour_count = sum(occupied)
         values = tuple(v[0] for v in self.combined_values_by_id(hours, blinds_state_ids))
-        for h, v in izip(hours, values):
-            if h not in schedule:
-                total_hour_count -= 1
-                continue
+        for v in compress(values, occupied):
             if v < udiMin:
                 udi_l += 1
             elif v > udiMax:
@@ -794,12 +883,10 @@ class AnalysisPoint(object):
         schedule = occ_schedule or Schedule.eight_am_to_six_pm()
         DA = 0
         cda = 0
-        total_hour_count = len(hours)
+        occupied = occupancy_mask(hours, schedule)
+        total_hour_count = sum(occupied)
         values = tuple(v[0] for v in self.combined_values_by_id(hours, blinds_state_ids))
-        for h, v in izip(hours, values):
-            if h not in schedule:
-                total_hour_count -= 1
-                continue
+        for v in compress(values, occupied):
             if v >= da_threshhold:
                 DA += 1
                 cda += 1
@@ -849,9 +936,7 @@ class AnalysisPoint(object):
         schedule = occ_schedule or Schedule.eight_am_to_six_pm()
         ase = 0
         problematic_hours = []
-        for h, v in izip(hoys, values):
-            if h not in schedule:
-                continue
+        for h, v in compress(izip(hoys, values), occupancy_mask(hoys, schedule)):
             if v > threshhold:
                 ase += 1
                 problematic_hours.append(h)
@@ -862,9 +947,8 @@ class AnalysisPoint(object):
     def _calculate_annual_metrics(
         values, hours, da_threshhold=None, udi_min_max=None, blinds_state_ids=None,
             occ_schedule=None):
-        total_hour_count = len(hours)
-        udiMin, udiMax = udi_min_max
         udi_min_max = udi_min_max or (100, 2000)
+        udiMin, udiMax = udi_min_max
         da_threshhold = da_threshhold or 300.0
         schedule = occ_schedule or Schedule.eight_am_to_six_pm()
         DA = 0
@@ -872,10 +956,9 @@ class AnalysisPoint(object):
         udi = 0
         udi_l = 0
         udi_m = 0
-        for h, v in izip(hours, values):
-            if h not in schedule:
-                total_hour_count -= 1
-                continue
+        occupied = occupancy_mask(hours, schedule)
+        total_hour_count = sum(occupied)
+        for v in compress(values, occupied):
             if v >= da_threshhold:
                 DA += 1
                 cda += 1
@@ -915,11 +998,9 @@ class AnalysisPoint(object):
         schedule = occ_schedule or Schedule.eight_am_to_six_pm()
         DA = 0
         cda = 0
-        total_hour_count = len(hours)
-        for h, v in izip(hours, values):
-            if h not in schedule:
-                total_hour_count -= 1
-                continue
+        occupied = occupancy_mask(hours, schedule)
+        total_hour_count = sum(occupied)
+        for v in compress(values, occupied):
             if v >= da_threshhold:
                 DA += 1
                 cda += 1
@@ -985,7 +1066,8 @@ class AnalysisPoint(object):
         """
         return {"location": tuple(self.location),
                 "direction": tuple(self.direction),
-                "values": self._values}
+                "values": self._values if isinstance(self._values, list)
+                else self._values.to_list()}
 
     def __repr__(self):
         """Print an analysis point."""
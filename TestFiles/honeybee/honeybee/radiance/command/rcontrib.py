@@ -1,7 +1,7 @@
 # coding=utf-8
 """RADIANCE rcontrib command."""
 from ._commandbase import RadianceCommand
-from ..datatype import RadiancePath
+from ..datatype import RadiancePath, RadianceNumber
 from ..parameters.rcontrib import RcontribParameters
 
 import os
@@ -22,6 +22,7 @@ class Rcontrib(RadianceCommand):
         rcontrib_parameters: Radiance parameters for rcontrib. If None Default
             parameters will be set. You can use self.rcontrib_parameters to view,
             add or remove the parameters before executing the command.
+        num_processors: Number of processes to run rcontrib on (Default: None).
 
     Usage:
 
@@ -50,9 +51,10 @@ class Rcontrib(RadianceCommand):
     output_file = RadiancePath("dc", "results file", extension=".dc")
     octree_file = RadiancePath("oct", "octree file", extension=".oct")
     points_file = RadiancePath("points", "test point file")
+    num_processors = RadianceNumber('n', 'number of processors', num_type=int)
 
     def __init__(self, output_name=None, octree_file=None, points_file=None,
-                 rcontrib_parameters=None):
+                 rcontrib_parameters=None, num_processors=None):
         """Init command."""
         RadianceCommand.__init__(self)
 
@@ -74,6 +76,9 @@ class Rcontrib(RadianceCommand):
         set. You can use self.rcontrib_parameters to view, add or remove the
         parameters before executing the command."""
 
+        self.num_processors = num_processors
+        """Number of processors"""
+
     @property
     def rcontrib_parameters(self):
         """Get and set gendaymtx_parameters."""
@@ -89,9 +94,12 @@ class Rcontrib(RadianceCommand):
 
     def to_rad_string(self, relative_path=False):
         """Return full command as a string."""
+        num_processors = self.num_processors.to_rad_string()
+        num_processors = "%s " % num_processors if num_processors else ""
         if self.output_file.to_rad_string().strip():
-            rad_string = "%s %s %s < %s > %s" % (
+            rad_string = "%s %s%s %s < %s > %s" % (
                 self.normspace(os.path.join(self.radbin_path, "rcontrib")),
+                num_processors,
                 self.rcontrib_parameters.to_rad_string(),
                 self.normspace(self.octree_file.to_rad_string()),
                 self.normspace(self.points_file.to_rad_string()),
@@ -104,16 +112,18 @@ class Rcontrib(RadianceCommand):
             self.rcontrib_parameters.mod_file = None
             self.rcontrib_parameters.output_filename_format = None
 
-            rad_string = "%s %s < %s -o %s -M %s %s" % (
+            rad_string = "%s %s%s < %s -o %s -M %s %s" % (
                 self.normspace(os.path.join(self.radbin_path, "rcontrib")),
+                num_processors,
                 self.rcontrib_parameters.to_rad_string(),
                 self.normspace(self.points_file.to_rad_string()),
                 out, mod,
                 self.normspace(self.octree_file.to_rad_string())
             )
         else:
-            rad_string = "%s %s %s < %s" % (
+            rad_string = "%s %s%s %s < %s" % (
                 self.normspace(os.path.join(self.radbin_path, "rcontrib")),
+                num_processors,
                 self.rcontrib_parameters.to_rad_string(),
                 self.normspace(self.octree_file.to_rad_string()),
                 self.normspace(self.points_file.to_rad_string())
@@ -1,7 +1,7 @@
 import os
 from ._commandbase import RadianceCommand
 from ..parameters.rtrace import LowQuality
-from ..datatype import RadiancePath
+from ..datatype import RadiancePath, RadianceNumber
 
 
 class Rtrace(RadianceCommand):
@@ -18,14 +18,16 @@ class Rtrace(RadianceCommand):
             (Default: 0)
         radiance_parameters: Radiance parameters for this analysis.
             (Default: girdbased.LowQuality)
+        num_processors: Number of processes to run rtrace on (Default: None).
     """
 
     output_file = RadiancePath("res", "results file", extension=".res")
     octree_file = RadiancePath("oct", "octree file", extension=".oct")
     points_file = RadiancePath("points", "test point file", extension=".pts")
+    num_processors = RadianceNumber('n', 'number of processors', num_type=int)
 
     def __init__(self, output_name='untitled', octree_file=None, points_file=None,
-                 simulation_type=0, radiance_parameters=None):
+                 simulation_type=0, radiance_parameters=None, num_processors=None):
         """Initialize the class."""
         # Initialize base class to make sure path to radiance is set correctly
         RadianceCommand.__init__(self)
@@ -60,6 +62,9 @@ class Rtrace(RadianceCommand):
             (Default: 0)
         """
 
+        self.num_processors = num_processors
+        """Number of processors"""
+
     @property
     def simulation_type(self):
         """Get/set simulation Type.
@@ -106,8 +111,10 @@ class Rtrace(RadianceCommand):
     # TODO: Implement relative path
     def to_rad_string(self, relative_path=False):
         """Return full command as a string."""
-        rad_string = "%s %s %s < %s > %s" % (
+        num_processors = self.num_processors.to_rad_string()
+        rad_string = "%s %s%s %s < %s > %s" % (
             self.normspace(os.path.join(self.radbin_path, "rtrace")),
+            "%s " % num_processors if num_processors else "",
             self.radiance_parameters.to_rad_string(),
             self.normspace(self.octree_file.to_rad_string()),
             self.normspace(self.points_file.to_rad_string()),
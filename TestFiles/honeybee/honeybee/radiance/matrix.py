@@ -0,0 +1,350 @@
+# coding=utf-8
+"""Read Radiance matrix files.
+
+Radiance matrices are either written as ASCII or as binary floats (-ff) or doubles
+(-fd). Binary matrices are memory-mapped to NumPy arrays which is much faster than
+parsing the ASCII values. NumPy is only required for load_matrix and the functions
+which read the matrices in chunks.
+
+Use matrix_index to find the position of the rows in a file. It's useful for reading
+the rows for one analysis grid from a result file with the results of several grids.
+"""
+import os
+from array import array
+from collections import namedtuple
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    # IronPython or NumPy is not installed
+    np = None
+
+
+DATA_TYPES = {'float': 'f4', 'double': 'f8'}
+"""NumPy data types for binary Radiance matrix formats."""
+
+BYTE_ORDERS = {'LittleEndian': '<', 'BigEndian': '>'}
+"""NumPy byte order characters for Radiance BYTEORDER values."""
+
+
+class MatrixHeader(namedtuple('MatrixHeader',
+                              'nrows ncols ncomp data_format byte_order offset')):
+    """Header of a Radiance matrix file.
+
+    Attributes:
+        nrows: Number of rows or None if the header doesn't include NROWS.
+        ncols: Number of columns or None if the header doesn't include NCOLS.
+        ncomp: Number of components for each value (e.g. 3 for RGB) (Default: 1).
+        data_format: Format of the data (e.g. ascii, float, double).
+        byte_order: Byte order of the binary data (LittleEndian or BigEndian) or None
+            for the native byte order.
+        offset: Number of bytes before the data starts.
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_binary(self):
+        """Return True if the data is written as binary floats or doubles."""
+        return self.data_format in DATA_TYPES
+
+    @property
+    def dtype(self):
+        """NumPy data type string for binary data."""
+        assert self.is_binary, \
+            '{} is not a binary data format.'.format(self.data_format)
+        return BYTE_ORDERS.get(self.byte_order, '=') + DATA_TYPES[self.data_format]
+
+    @property
+    def itemsize(self):
+        """Number of bytes for each binary value."""
+        return int(self.dtype[2:])
+
+
+def read_header(file_path):
+    """Read the header of a Radiance matrix file.
+
+    Args:
+        file_path: Full path to the matrix file.
+
+    Returns:
+        A MatrixHeader. A file without a header is considered to be an ASCII matrix
+        with no header.
+    """
+    nrows = ncols = byte_order = None
+    ncomp = 1
+    data_format = 'ascii'
+    with open(file_path, 'rb') as inf:
+        if not inf.readline().startswith(b'#?'):
+            return MatrixHeader(nrows, ncols, ncomp, data_format, byte_order, 0)
+
+        # header ends with an empty line
+        for line in iter(inf.readline, b''):
+            line = line.strip()
+            if not line:
+                break
+            key, _, value = line.partition(b'=')
+            if key == b'NROWS':
+                nrows = int(value)
+            elif key == b'NCOLS':
+                ncols = int(value)
+            elif key == b'NCOMP':
+                ncomp = int(value)
+            elif key == b'FORMAT':
+                data_format = value.decode('ascii')
+            elif key == b'BYTEORDER':
+                byte_order = value.decode('ascii')
+
+        return MatrixHeader(nrows, ncols, ncomp, data_format, byte_order, inf.tell())
+
+
+class MatrixIndex(object):
+    """Byte offsets for the rows of a Radiance matrix file.
+
+    Offsets for binary matrices are calculated from the header. Offsets for ASCII
+    matrices are collected by reading the lines once and only up to the row that is
+    requested.
+
+    Attributes:
+        file_path: Full path to the matrix file.
+        header: MatrixHeader of the file.
+    """
+
+    __slots__ = ('_file_path', '_header', '_row_size', '_offsets', '_stamp')
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._stamp = _file_stamp(file_path)
+        self._header = read_header(file_path)
+        if self._header.is_binary:
+            nrows, ncols = _binary_shape(self._header, file_path)
+            self._row_size = ncols * self._header.ncomp * self._header.itemsize
+            self._offsets = None
+        else:
+            self._row_size = None
+            # offset for the start of each row. The last one is the end of the rows
+            # which are read so far. Offsets are stored as doubles which unlike long
+            # integers can store the offsets for files larger than 4 GB on Windows.
+            self._offsets = array('d', (self._header.offset,))
+
+    @property
+    def file_path(self):
+        """Full path to the matrix file."""
+        return self._file_path
+
+    @property
+    def header(self):
+        """MatrixHeader of the file."""
+        return self._header
+
+    @property
+    def is_valid(self):
+        """Check if the file has not changed since the index is created."""
+        return self._stamp == _file_stamp(self._file_path)
+
+    def row_offset(self, row):
+        """Get the number of bytes from the start of the file to a row.
+
+        Args:
+            row: Index of the row from 0.
+        """
+        if self._row_size is not None:
+            return self._header.offset + row * self._row_size
+
+        offsets = self._offsets
+        if row >= len(offsets):
+            # read the lines from the last known row
+            with open(self._file_path, 'rb') as inf:
+                inf.seek(offsets[-1])
+                for line in iter(inf.readline, b''):
+                    offsets.append(offsets[-1] + len(line))
+                    if len(offsets) > row:
+                        break
+            if row >= len(offsets):
+                raise ValueError(
+                    'Row {} is out of range. {} has {} rows.'.format(
+                        row, self._file_path, len(offsets) - 1))
+        return int(offsets[row])
+
+
+_indexes = {}
+
+
+def matrix_index(file_path):
+    """Get the MatrixIndex for a matrix file.
+
+    Indexes are created once for each file and are reused until the file changes.
+
+    Args:
+        file_path: Full path to the matrix file.
+    """
+    key = os.path.abspath(file_path)
+    index = _indexes.get(key)
+    if index is None or not index.is_valid:
+        index = MatrixIndex(file_path)
+        _indexes[key] = index
+    return index
+
+
+def _file_stamp(file_path):
+    """Size and modification time of a file to find if it has changed."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime
+
+
+def _binary_shape(header, file_path):
+    """Find number of rows and columns for a binary matrix."""
+    value_count = (os.path.getsize(file_path) - header.offset) // header.itemsize
+    ncomp = header.ncomp
+    if header.ncols:
+        return header.nrows or value_count // (header.ncols * ncomp), header.ncols
+    elif header.nrows:
+        return header.nrows, value_count // (header.nrows * ncomp)
+    else:
+        raise ValueError(
+            'Failed to find the shape of binary matrix: {}\nThe header must include'
+            ' NROWS or NCOLS.'.format(file_path))
+
+
+def load_matrix(file_path, mmap_mode='r'):
+    """Load a Radiance matrix file as a NumPy array.
+
+    Binary matrices are memory-mapped and only the values which are accessed are read
+    from the disk. ASCII matrices are fully loaded to the memory. The values of an
+    ASCII matrix are reshaped based on NROWS and NCOLS if the header includes them
+    and otherwise each line is a row.
+
+    Args:
+        file_path: Full path to the matrix file.
+        mmap_mode: Mode to memory-map binary matrices with. Use 'c' to change the
+            values in memory without writing them to the file (Default: 'r').
+
+    Returns:
+        An array of (nrows, ncols) for single component matrices and
+        (nrows, ncols, ncomp) for matrices with several components.
+    """
+    if np is None:
+        raise ImportError('NumPy is required to load Radiance matrices as arrays.')
+
+    header = read_header(file_path)
+    ncomp = header.ncomp
+
+    if header.is_binary:
+        nrows, ncols = _binary_shape(header, file_path)
+        values = np.memmap(file_path, dtype=header.dtype, mode=mmap_mode,
+                           offset=header.offset, shape=(nrows, ncols, ncomp))
+    elif header.nrows and header.ncols:
+        # the shape is known and the values can be parsed regardless of how they
+        # are split between the lines (e.g. gendaymtx writes a line for each hour).
+        with open(file_path, 'rb') as inf:
+            inf.seek(header.offset)
+            values = np.fromfile(inf, sep=' ')
+        if values.size != header.nrows * header.ncols * ncomp:
+            raise ValueError(
+                'Failed to load {} values for ({} x {} x {}) matrix from {}.'.format(
+                    values.size, header.nrows, header.ncols, ncomp, file_path))
+        values = values.reshape(header.nrows, header.ncols, ncomp)
+    else:
+        with open(file_path, 'rb') as inf:
+            inf.seek(header.offset)
+            values = np.loadtxt(inf, ndmin=2)
+        values = values.reshape(values.shape[0], -1, ncomp)
+
+    return values[:, :, 0] if ncomp == 1 else values
+
+
+def matrix_chunks(file_path, chunk_size=1000):
+    """Read a Radiance matrix file as arrays for chunks of rows.
+
+    Unlike read_row_chunks the values of an ASCII matrix don't need to be written in
+    a line for each row as long as the header includes NROWS and NCOLS (e.g. sky
+    matrices from gendaymtx). Only one chunk of rows is in the memory at a time.
+
+    Args:
+        file_path: Full path to the matrix file.
+        chunk_size: Maximum number of rows in each array (Default: 1000).
+
+    Returns:
+        A generator of arrays of (rows, ncols, ncomp).
+    """
+    if np is None:
+        raise ImportError('NumPy is required to load Radiance matrices as arrays.')
+
+    header = read_header(file_path)
+    ncomp = header.ncomp
+    if header.is_binary or not (header.nrows and header.ncols):
+        values = load_matrix(file_path)
+        if ncomp == 1:
+            values = values[:, :, None]
+        for start in range(0, len(values), chunk_size):
+            yield np.asarray(values[start:start + chunk_size], dtype=float)
+        return
+
+    row_size = header.ncols * ncomp
+    with open(file_path, 'rb') as inf:
+        inf.seek(header.offset)
+        for start in range(0, header.nrows, chunk_size):
+            count = min(chunk_size, header.nrows - start)
+            values = np.fromfile(inf, count=count * row_size, sep=' ')
+            if values.size != count * row_size:
+                raise ValueError(
+                    'Failed to load {} rows from row {} of {}.'.format(
+                        count, start, file_path))
+            yield values.reshape(count, header.ncols, ncomp)
+
+
+def row_chunks(rows, count, chunk_size=1000):
+    """Group rows of values into arrays.
+
+    Use this method to process the rows of a large matrix with NumPy without loading
+    the whole matrix to the memory.
+
+    Args:
+        rows: An iterator of sequences of values for each row.
+        count: Number of rows to read from rows.
+        chunk_size: Maximum number of rows in each array (Default: 1000).
+
+    Returns:
+        A generator of arrays of (rows, values).
+    """
+    if np is None:
+        raise ImportError('NumPy is required to load Radiance matrices as arrays.')
+
+    for start in range(0, count, chunk_size):
+        yield np.array(list(islice(rows, min(chunk_size, count - start))), dtype=float)
+
+
+def read_row_chunks(file_path, start_row, count, chunk_size=1000, offset=None):
+    """Read a range of rows from a matrix file as arrays.
+
+    Only the rows from start_row to start_row + count are read. Binary matrices are
+    sliced from the memory-mapped matrix and the file is moved to the start of the
+    rows for ASCII matrices.
+
+    Args:
+        file_path: Full path to the matrix file.
+        start_row: Index of the first row from 0.
+        count: Number of rows to read.
+        chunk_size: Maximum number of rows in each array (Default: 1000).
+        offset: Number of bytes from the start of the file to start_row if it is
+            already known. Use this input to read the rows of an ASCII matrix in another
+            process without indexing the file again (Default: None).
+
+    Returns:
+        A generator of arrays of (rows, values).
+    """
+    index = matrix_index(file_path)
+    if index.header.is_binary:
+        values = load_matrix(file_path)
+        end = min(start_row + count, len(values))
+        for start in range(start_row, end, chunk_size):
+            yield np.asarray(values[start:min(start + chunk_size, end)], dtype=float)
+        return
+
+    if offset is None:
+        offset = index.row_offset(start_row)
+    with open(file_path, 'rb') as inf:
+        inf.seek(offset)
+        for values in row_chunks((line.split() for line in inf), count, chunk_size):
+            yield values
@@ -0,0 +1,455 @@
+# coding=utf-8
+"""Multiply daylight coefficient and sky matrices in Python.
+
+This module is an in-process alternative to dctimestep and rmtxop for the daylight
+coefficient recipes. The matrices are loaded as NumPy arrays and each component is
+multiplied with matrix multiplications which NumPy hands over to BLAS. Sky matrices
+are read in chunks of rows to limit the memory for large sun matrices.
+
+NumPy is required to use this module.
+"""
+from .matrix import load_matrix, matrix_chunks, read_header
+
+import os
+import sys
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    # IronPython or NumPy is not installed
+    np = None
+
+
+RGB_COEFFICIENTS = (47.4, 119.9, 11.6)
+"""Coefficients to convert RGB values to illuminance (rmtxop -c 47.4 119.9 11.6)."""
+
+FORMATS = {'f': ('float', 'f4'), 'd': ('double', 'f8')}
+"""Radiance FORMAT and NumPy data type for binary output formats."""
+
+
+def _check_numpy():
+    if np is None:
+        raise ImportError('NumPy is required to multiply the matrices in Python.')
+
+
+def _components(matrix):
+    """Return an array of (rows, cols, ncomp) for a matrix."""
+    return matrix if matrix.ndim == 3 else matrix[:, :, None]
+
+
+def _column_count(matrix):
+    """Return number of columns for a matrix or a file or None if it's not known."""
+    if hasattr(matrix, 'shape'):
+        return matrix.shape[1]
+    header = read_header(matrix)
+    if header.is_binary:
+        return load_matrix(matrix).shape[1]
+    return header.ncols
+
+
+def _row_chunks(matrix, chunk_size, columns=None):
+    """Yield arrays of (rows, cols, ncomp) for chunks of rows of a matrix or a file.
+
+    Binary files are memory-mapped and only the values for columns are read. ASCII
+    files are parsed from the start every time.
+    """
+    columns = slice(None) if columns is None else columns
+    if not hasattr(matrix, 'shape'):
+        if not read_header(matrix).is_binary:
+            for values in matrix_chunks(matrix, chunk_size):
+                yield values[:, columns]
+            return
+        matrix = load_matrix(matrix)
+    matrix = _components(matrix)
+    for st in xrange(0, len(matrix), chunk_size):
+        yield np.asarray(matrix[st:st + chunk_size, columns])
+
+
+def _prepare_dc(dc_matrix, coefficients, dtype=float, allocate=None):
+    """Scale a daylight coefficient matrix by the coefficients.
+
+    The values of each component are put next to each other in the memory for BLAS
+    and only one copy of the matrix is created. Use allocate to create the array for
+    the copy from its shape (e.g. a memory-mapped array).
+
+    Returns:
+        An array of (ncomp, points, patches).
+    """
+    if not hasattr(dc_matrix, 'shape'):
+        dc_matrix = load_matrix(dc_matrix)
+    dc_matrix = _components(dc_matrix)
+    point_count, patch_count, ncomp = dc_matrix.shape
+    coefficients = coefficients or (1,)
+    assert len(coefficients) == ncomp, \
+        'There should be a coefficient for each component [{}]: {}'.format(
+            ncomp, coefficients)
+    shape = (ncomp, point_count, patch_count)
+    dc = allocate(shape) if allocate else np.empty(shape, dtype=dtype)
+    for comp in xrange(ncomp):
+        np.multiply(dc_matrix[:, :, comp], coefficients[comp], out=dc[comp])
+    return dc
+
+
+def _accumulate(values, dc, sky_matrix, chunk_size, columns=None):
+    """Add the product of a prepared daylight coefficient matrix and a sky matrix.
+
+    Args:
+        values: An array of (points, hours) to add the results to or None to create
+            a new array in the data type of dc.
+        dc: An array of (ncomp, points, patches) from _prepare_dc.
+        sky_matrix: Path to a sky matrix or an array of (patches, hours, ncomp).
+        chunk_size: Maximum number of rows of the sky matrix to multiply at once.
+        columns: An optional slice of the hours in the sky matrix.
+
+    Returns:
+        values.
+    """
+    ncomp, point_count, patch_count = dc.shape
+    st = 0
+    for sky in _row_chunks(sky_matrix, chunk_size, columns):
+        end = st + len(sky)
+        assert end <= patch_count and sky.shape[2] == ncomp, \
+            'Sky matrix does not match the daylight coefficient matrix {}.'.format(
+                (point_count, patch_count, ncomp))
+        if values is None:
+            values = np.zeros((point_count, sky.shape[1]), dtype=dc.dtype)
+        sky = np.ascontiguousarray(sky.transpose(2, 0, 1), dtype=dc.dtype)
+        for comp in xrange(ncomp):
+            values += np.dot(dc[comp, :, st:end], sky[comp])
+        st = end
+
+    assert st == patch_count, \
+        'Sky matrix has {} rows. Daylight coefficient matrix has {} columns.'.format(
+            st, patch_count)
+    return values
+
+
+def multiply(dc_matrix, sky_matrix, coefficients=RGB_COEFFICIENTS, chunk_size=500,
+             columns=None, dtype=float):
+    """Multiply a daylight coefficient matrix by a sky matrix.
+
+    This is equivalent to dctimestep [dc_matrix] [sky_matrix] followed by rmtxop -c
+    to combine the components of the results.
+
+    The sky matrix is read in chunks of rows (sky patches or suns) and the values for
+    all the hours are added up from the product of each chunk. A sun matrix for a
+    year can be several GB as an array but only one chunk is kept in the memory.
+
+    Args:
+        dc_matrix: Path to a daylight coefficient matrix or an array of
+            (points, patches, ncomp).
+        sky_matrix: Path to a sky matrix or an array of (patches, hours, ncomp).
+        coefficients: Coefficients to combine the components of the results. Use
+            None for single component matrices (Default: RGB_COEFFICIENTS).
+        chunk_size: Maximum number of rows of the sky matrix to multiply at once
+            (Default: 500).
+        columns: An optional slice to only calculate the values for some of the hours.
+        dtype: Data type to calculate the values in (Default: float).
+
+    Returns:
+        An array of (points, hours).
+    """
+    _check_numpy()
+    dc = _prepare_dc(dc_matrix, coefficients, dtype)
+    return _accumulate(None, dc, sky_matrix, chunk_size, columns)
+
+
+def daylight_coeff_values(total, direct=None, sun=None,
+                          coefficients=RGB_COEFFICIENTS, chunk_size=500):
+    """Calculate total - direct + sun values for a daylight coefficient study.
+
+    Args:
+        total: A tuple of (daylight coefficient matrix, sky matrix) for the total sky.
+            For radiation studies use the diffuse sky.
+        direct: An optional tuple of (black daylight coefficient matrix, direct sky
+            matrix) for the direct sky which will be subtracted from the results.
+        sun: An optional tuple of (sun coefficient matrix, sun matrix) for the
+            direct sunlight which will be added to the results.
+        coefficients: Coefficients to combine the components of the results
+            (Default: RGB_COEFFICIENTS).
+        chunk_size: Maximum number of rows of the sky matrices to multiply at once
+            (Default: 500).
+
+    Returns:
+        A tuple of arrays of (points, hours) for the final values and the sun values.
+        Sun values will be None if sun is None.
+    """
+    values = multiply(total[0], total[1], coefficients, chunk_size)
+    if direct:
+        values -= multiply(direct[0], direct[1], coefficients, chunk_size)
+    if not sun:
+        return values, None
+    sun_values = multiply(sun[0], sun[1], coefficients, chunk_size)
+    values += sun_values
+    return values, sun_values
+
+
+def _write_header(outf, nrows, ncols, output_format=None):
+    """Write a Radiance matrix header and return the NumPy data type for the values."""
+    if output_format:
+        data_format, dtype = FORMATS[output_format]
+    else:
+        data_format, dtype = 'ascii', None
+
+    header = ['#?RADIANCE', 'NROWS=%d' % nrows, 'NCOLS=%d' % ncols, 'NCOMP=1',
+              'FORMAT=%s' % data_format]
+    if dtype:
+        header.append('BYTEORDER={}Endian'.format(sys.byteorder.capitalize()))
+    outf.write(('\n'.join(header) + '\n\n').encode('ascii'))
+    return dtype
+
+
+def write_matrix(file_path, values, output_format=None, transpose=False):
+    """Write an array of values to a Radiance matrix file.
+
+    Args:
+        file_path: Full path to the output file.
+        values: An array of (rows, cols).
+        output_format: Set to 'f' or 'd' to write the values as binary floats or
+            doubles (Default: None, ASCII).
+        transpose: Set to True to transpose the matrix before writing it.
+    """
+    _check_numpy()
+    values = np.asarray(values)
+    if transpose:
+        values = values.T
+    nrows, ncols = values.shape
+    with open(file_path, 'wb') as outf:
+        dtype = _write_header(outf, nrows, ncols, output_format)
+        if dtype:
+            np.ascontiguousarray(values, dtype=dtype).tofile(outf)
+        else:
+            np.savetxt(outf, values, fmt='%.6e', delimiter='\t')
+
+
+class ColumnBlockWriter(object):
+    """Write a matrix of (rows, cols) to a Radiance matrix file in blocks of columns.
+
+    Binary files are memory-mapped and each block is written in place. Transposed
+    ASCII files are written a block at a time in order. Other ASCII files are
+    collected in a temporary binary file next to the output and are written once
+    all the blocks are added. A single block for all the columns is written with
+    write_matrix.
+
+    Use the writer in a with statement to close it once all the blocks are added.
+
+    Args:
+        file_path: Full path to the output file.
+        nrows: Number of rows (e.g. points).
+        ncols: Number of columns (e.g. hours).
+        output_format: Set to 'f' or 'd' to write the values as binary floats or
+            doubles (Default: None, ASCII).
+        transpose: Set to True to transpose the matrix before writing it.
+    """
+
+    __slots__ = ('file_path', 'nrows', 'ncols', 'output_format', 'transpose',
+                 '_values', '_tmp_path', '_outf', '_next_column')
+
+    def __init__(self, file_path, nrows, ncols, output_format=None, transpose=False):
+        _check_numpy()
+        self.file_path = file_path
+        self.nrows = nrows
+        self.ncols = ncols
+        self.output_format = output_format
+        self.transpose = transpose
+        self._values = None
+        self._tmp_path = None
+        self._outf = None
+        self._next_column = 0
+
+    def _open(self):
+        if self.output_format:
+            shape = (self.nrows, self.ncols)
+            if self.transpose:
+                shape = shape[::-1]
+            with open(self.file_path, 'wb') as outf:
+                dtype = _write_header(outf, shape[0], shape[1], self.output_format)
+                offset = outf.tell()
+                outf.truncate(offset + shape[0] * shape[1] * np.dtype(dtype).itemsize)
+            self._values = np.memmap(self.file_path, dtype=dtype, mode='r+',
+                                     offset=offset, shape=shape)
+        elif self.transpose:
+            self._outf = open(self.file_path, 'wb')
+            _write_header(self._outf, self.ncols, self.nrows)
+        else:
+            self._tmp_path = self.file_path + '.tmp'
+            self._values = np.memmap(self._tmp_path, dtype='f8', mode='w+',
+                                     shape=(self.nrows, self.ncols))
+
+    def write(self, start, values):
+        """Write an array of (rows, block columns) from column start."""
+        end = start + values.shape[1]
+        if start == 0 and self._next_column == 0 and \
+                (self.ncols is None or end == self.ncols):
+            write_matrix(self.file_path, values, self.output_format, self.transpose)
+            self._next_column = end
+            return
+        if self._values is None and self._outf is None:
+            self._open()
+        if self._outf is not None:
+            assert start == self._next_column, \
+                'Blocks of a transposed ASCII matrix must be written in order.'
+            np.savetxt(self._outf, values.T, fmt='%.6e', delimiter='\t')
+        elif self.transpose:
+            self._values[start:end] = values.T
+        else:
+            self._values[:, start:end] = values
+        self._next_column = end
+
+    def close(self):
+        """Finish writing the file."""
+        if self._outf is not None:
+            self._outf.close()
+            self._outf = None
+        elif self._tmp_path is not None:
+            with open(self.file_path, 'wb') as outf:
+                _write_header(outf, self.nrows, self.ncols)
+                for st in xrange(0, self.nrows, 1000):
+                    np.savetxt(outf, self._values[st:st + 1000], fmt='%.6e',
+                               delimiter='\t')
+            self._values = None
+            os.remove(self._tmp_path)
+            self._tmp_path = None
+        elif self._values is not None:
+            self._values.flush()
+            self._values = None
+
+    def discard(self):
+        """Stop writing the file and remove the temporary file if any."""
+        self._values = None
+        if self._outf is not None:
+            self._outf.close()
+            self._outf = None
+        if self._tmp_path is not None and os.path.isfile(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._tmp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def _sky_array(sky_matrix, allocate, chunk_size=500):
+    """Copy an ASCII sky matrix to an array from allocate to read its hours in blocks.
+
+    Arrays and binary files are returned as they are.
+    """
+    if hasattr(sky_matrix, 'shape'):
+        return sky_matrix
+    header = read_header(sky_matrix)
+    if header.is_binary:
+        return sky_matrix
+    if not (header.nrows and header.ncols):
+        return _components(load_matrix(sky_matrix))
+    values = allocate((header.nrows, header.ncols, header.ncomp))
+    st = 0
+    for chunk in matrix_chunks(sky_matrix, chunk_size):
+        values[st:st + len(chunk)] = chunk
+        st += len(chunk)
+    return values
+
+
+def calculate_daylight_coeff(output, total, direct=None, sun=None, sun_output=None,
+                             output_format=None, transpose=False, chunk_size=500,
+                             hour_chunk_size=1000):
+    """Calculate the results of a daylight coefficient study and write them to files.
+
+    This replaces the dctimestep and rmtxop commands for a state of a window group.
+
+    The values are calculated for blocks of hours and each block is written to the
+    result files once it is calculated, so only the values for a block of hours are
+    kept in the memory. The scaled daylight coefficient matrices and ASCII sky
+    matrices are kept in temporary files next to the output while the blocks are
+    calculated. Values are calculated in single precision for float outputs.
+
+    Args:
+        output: Path to the result file for total - direct + sun values.
+        total: A tuple of paths to (daylight coefficient matrix, sky matrix) for the
+            total sky.
+        direct: An optional tuple of paths to (black daylight coefficient matrix,
+            direct sky matrix) for the direct sky.
+        sun: An optional tuple of paths to (sun coefficient matrix, sun matrix).
+        sun_output: An optional path to write the sun values to.
+        output_format: Set to 'f' or 'd' to write the results as binary floats or
+            doubles (Default: None, ASCII).
+        transpose: Set to True to write a row for each hour instead of each point.
+        chunk_size: Maximum number of rows of the sky matrices to multiply at once
+            (Default: 500).
+        hour_chunk_size: Maximum number of hours to calculate at once. Use None to
+            calculate all the hours at once (Default: 1000).
+
+    Returns:
+        Path to the result file.
+    """
+    _check_numpy()
+    dtype = 'f4' if output_format == 'f' else 'f8'
+    # direct values are subtracted by using negative coefficients. sun values are
+    # calculated first so they can be written before the other values are added.
+    negative_coefficients = tuple(-c for c in RGB_COEFFICIENTS)
+    inputs = [(matrices, coefficients) for matrices, coefficients in
+              ((sun, RGB_COEFFICIENTS), (total, RGB_COEFFICIENTS),
+               (direct, negative_coefficients)) if matrices]
+    hour_count = _column_count(total[1])
+    if hour_chunk_size and hour_count and hour_count > hour_chunk_size:
+        blocks = [slice(st, min(st + hour_chunk_size, hour_count))
+                  for st in xrange(0, hour_count, hour_chunk_size)]
+    else:
+        blocks = [None]
+
+    temp_paths = []
+    writer = sun_writer = values = dc = sky = None
+
+    def allocate(shape, dtype=dtype):
+        """Create a temporary memory-mapped array next to the output."""
+        fd, temp_path = tempfile.mkstemp(
+            suffix='.tmp', dir=os.path.dirname(os.path.abspath(output)))
+        os.close(fd)
+        temp_paths.append(temp_path)
+        return np.memmap(temp_path, dtype=dtype, mode='w+', shape=shape)
+
+    try:
+        if len(blocks) > 1:
+            # prepare the matrices once rather than parsing the files for every block
+            inputs = [((_prepare_dc(dc, coefficients, dtype, allocate),
+                        _sky_array(sky, allocate, chunk_size)), None)
+                      for (dc, sky), coefficients in inputs]
+
+        for block in blocks:
+            values = None
+            for n, ((dc, sky), coefficients) in enumerate(inputs):
+                if coefficients is not None:
+                    dc = _prepare_dc(dc, coefficients, dtype)
+                values = _accumulate(values, dc, sky, chunk_size, block)
+                dc = None
+                if writer is None:
+                    writer = ColumnBlockWriter(output, len(values), hour_count,
+                                               output_format, transpose)
+                    if sun and sun_output:
+                        sun_writer = ColumnBlockWriter(
+                            sun_output, len(values), hour_count, output_format,
+                            transpose)
+                if n == 0 and sun_writer is not None:
+                    sun_writer.write(block.start if block else 0, values)
+            writer.write(block.start if block else 0, values)
+
+        writer.close()
+        if sun_writer is not None:
+            sun_writer.close()
+    except Exception:
+        for block_writer in (writer, sun_writer):
+            if block_writer is not None:
+                block_writer.discard()
+        raise
+    finally:
+        # release the memory-mapped arrays before removing their files
+        inputs = values = dc = sky = None
+        for temp_path in temp_paths:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+    return output
@@ -0,0 +1,128 @@
+# coding=utf-8
+"""Calculate annual daylight metrics for many analysis points at once.
+
+The functions take an array of illuminance values with a row for each analysis point
+and a column for each hour and calculate the metrics for all the points in a few NumPy
+operations. Use occupancy_mask to find the occupied columns from a schedule.
+"""
+from .. import schedule
+
+try:
+    import numpy as np
+except ImportError:
+    # IronPython or NumPy is not installed
+    np = None
+
+
+def _check_numpy():
+    if np is None:
+        raise ImportError('NumPy is required to calculate the metrics as arrays.')
+
+
+def occupancy_mask(hoys, occ_schedule):
+    """Return a boolean array of the occupied hours.
+
+    Args:
+        hoys: A collection of hours of the year for the columns of the values.
+        occ_schedule: An annual occupancy schedule or a collection of occupied hours.
+            Schedules are matched to the hour of the year that each hour falls in.
+    """
+    _check_numpy()
+    return np.array(schedule.occupancy_mask(hoys, occ_schedule), dtype=bool)
+
+
+def _occupied_values(values, occupied):
+    """Return the values for the occupied hours and the number of occupied hours."""
+    hour_count = int(occupied.sum())
+    if hour_count == 0:
+        raise ValueError('There is 0 hours available in the schedule.')
+    return np.asarray(values)[:, occupied], float(hour_count)
+
+
+def _daylight_autonomy(values, hour_count, da_threshhold):
+    """Calculate daylight autonomy and continious daylight autonomy."""
+    da = 100 * (values >= da_threshhold).sum(axis=1) / hour_count
+    cda = 100 * np.minimum(values / da_threshhold, 1).sum(axis=1) / hour_count
+    return da, cda
+
+
+def daylight_autonomy(values, occupied, da_threshhold=None):
+    """Calculate daylight autonomy and continious daylight autonomy.
+
+    Args:
+        values: An array of illuminance values (points x hours).
+        occupied: A boolean array of occupied hours. Use occupancy_mask to create it.
+        da_threshhold: Threshhold for daylight autonomy in lux (default: 300).
+
+    Returns:
+        Arrays of Daylight autonomy and Continious daylight autonomy for each point.
+    """
+    _check_numpy()
+    da_threshhold = da_threshhold or 300.0
+    values, hour_count = _occupied_values(values, occupied)
+    return _daylight_autonomy(values, hour_count, da_threshhold)
+
+
+def annual_metrics(values, occupied, da_threshhold=None, udi_min_max=None):
+    """Calculate annual metrics.
+
+    Args:
+        values: An array of illuminance values (points x hours).
+        occupied: A boolean array of occupied hours. Use occupancy_mask to create it.
+        da_threshhold: Threshhold for daylight autonomy in lux (default: 300).
+        udi_min_max: A tuple of min, max value for useful daylight illuminance
+            (default: (100, 3000)).
+
+    Returns:
+        Arrays of Daylight autonomy, Continious daylight autonomy, Useful daylight
+        illuminance, Less than UDI and More than UDI for each point.
+    """
+    _check_numpy()
+    da_threshhold = da_threshhold or 300.0
+    udi_min, udi_max = udi_min_max or (100, 3000)
+    values, hour_count = _occupied_values(values, occupied)
+
+    da, cda = _daylight_autonomy(values, hour_count, da_threshhold)
+    udi_less = values < udi_min
+    udi_more = values > udi_max
+    udi = 100 * (~(udi_less | udi_more)).sum(axis=1) / hour_count
+    return da, cda, udi, 100 * udi_less.sum(axis=1) / hour_count, \
+        100 * udi_more.sum(axis=1) / hour_count
+
+
+def spatial_daylight_autonomy(da, target_da=None):
+    """Calculate Spatial Daylight Autonomy (sDA).
+
+    Args:
+        da: An array of daylight autonomy for each point.
+        target_da: Minimum threshhold for daylight autonomy in percentage
+            (default: 50%).
+
+    Returns:
+        sDA as percentage of analysis points and a boolean array of the points which
+        are below target_da.
+    """
+    _check_numpy()
+    target_da = target_da or 50.0
+    problematic = np.asarray(da) < target_da
+    if not len(problematic):
+        return 0, problematic
+    return (1 - problematic.sum() / float(len(problematic))) * 100, problematic
+
+
+def annual_sunlight_exposure(values, occupied, threshhold=None):
+    """Calculate Annual Sunlight Exposure (ASE) hours.
+
+    Args:
+        values: An array of direct illuminance values (points x hours).
+        occupied: A boolean array of occupied hours. Use occupancy_mask to create it.
+        threshhold: Threshhold for for solar exposure in lux (default: 1000).
+
+    Returns:
+        An array of the number of exposed hours for each point and a boolean array of
+        the exposed hours (points x hours).
+    """
+    _check_numpy()
+    threshhold = threshhold or 1000
+    exposed = (np.asarray(values) > threshhold) & occupied
+    return exposed.sum(axis=1), exposed
@@ -5,7 +5,7 @@ sunlighthours recipe and annual analysis recipe.
 """
 
 from abc import ABCMeta, abstractmethod
-from ..analysisgrid import AnalysisGrid
+from ..analysisgrid import AnalysisGrid, EmptyFileError
 from ...futil import write_to_file
 from ...utilcol import random_name
 from ._recipebase import AnalysisRecipe
@@ -13,6 +13,7 @@ from ._recipebase import AnalysisRecipe
 from ladybug.legendparameters import LegendParameters
 
 import os
+from itertools import islice
 
 
 class GenericGridBased(AnalysisRecipe):
@@ -27,6 +28,8 @@ class GenericGridBased(AnalysisRecipe):
             vectors.
         hb_objects: An optional list of Honeybee surfaces or zones (Default: None).
         sub_folder: Analysis subfolder for this recipe. (Default: "gridbased")
+        num_processors: Number of processes for the ray-tracing commands to run on
+            (Default: None).
     """
 
     __metaclass__ = ABCMeta
@@ -37,6 +40,11 @@ class GenericGridBased(AnalysisRecipe):
         AnalysisRecipe.__init__(self, hb_objects=hb_objects, sub_folder=sub_folder)
         self.analysis_grids = analysis_grids
 
+        self.num_processors = None
+        """Number of processes for the ray-tracing commands (rtrace, rfluxmtx and
+        rcontrib) to run on. Only used on platforms which support -n
+        (Default: None, a single process)."""
+
     @classmethod
     def from_points_and_vectors(cls, point_groups, vector_groups=None, hb_objects=None,
                                 sub_folder="gridbased"):
@@ -158,6 +166,54 @@ class GenericGridBased(AnalysisRecipe):
         """Return results for this analysis."""
         raise NotImplementedError()
 
+    def result_values(self, file_path, hoys=None, header=True, mode=0):
+        """Read values for the points of all the analysis grids from a result file.
+
+        Unlike results, the values are not loaded to the analysis points. The file is
+        read once and one row at a time which makes this method suitable for
+        extracting the results of large grids.
+
+        Args:
+            file_path: Full file path to a result file with a row of values for each
+                point of the analysis grids in order. The file can be an ASCII or a
+                binary float or double matrix.
+            hoys: A collection of hours of the year to check against the header.
+            header: A Boolean to declare if the file has header (default: True).
+            mode: 0 > load the values 1 > load values as binary. Any non-zero value
+                will be 1. 2 > load the values divided by mode number.
+
+        Returns:
+            A generator of (analysis_grid, values) for each analysis grid where values
+            is a generator of tuples of values for each point. Any values which are not
+            read before moving to the next analysis grid are skipped.
+        """
+        assert self._isCalculated, \
+            "You haven't run the Recipe yet. Use self.run " + \
+            "to run the analysis before loading the results."
+
+        if os.path.getsize(file_path) < 2:
+            raise EmptyFileError(file_path)
+
+        if mode == 0:
+            def parse(r):
+                return int(float(r))
+        elif mode == 1:
+            def parse(r):
+                return 1 if float(r) > 0 else 0
+        else:
+            def parse(r):
+                return float(r) / mode
+
+        with open(file_path, 'rb') as inf:
+            rows = self.analysis_grids[0].matrix_rows(inf, 0, hoys, header)
+
+            for ag in self.analysis_grids:
+                ag_rows = islice(rows, len(ag))
+                yield ag, (tuple(parse(r) for r in row) for row in ag_rows)
+                # skip the rows that are left for this grid
+                for row in ag_rows:
+                    pass
+
     def ToString(self):
         """Overwriet .NET ToString method."""
         return self.__repr__()
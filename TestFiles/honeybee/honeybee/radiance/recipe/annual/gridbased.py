@@ -7,11 +7,22 @@ however it can only be used for models with no window groups.
 """
 from ..daylightcoeff.gridbased import DaylightCoeffGridBased
 from ...sky.skymatrix import SkyMatrix
-from ...analysisgrid import AnalysisGrid
+from ...analysisgrid import AnalysisGrid, EmptyFileError
+from ...analysispoint import AnalysisPoint
+from ...matrix import row_chunks, matrix_index, read_row_chunks
+from ... import metrics
 from ...parameters.rfluxmtx import RfluxmtxParameters
 from ....hbsurface import HBSurface
+from ....schedule import Schedule
 
 import os
+from itertools import izip
+
+try:
+    import numpy as np
+except ImportError:
+    # IronPython or NumPy is not installed
+    np = None
 
 
 class GridBased(DaylightCoeffGridBased):
@@ -53,6 +64,8 @@ class GridBased(DaylightCoeffGridBased):
             "sky_mtx": {}, // sky matrix json file
             "analysis_grids": [], // list of analysis grids
             "surfaces": [], // list of honeybee surfaces
+            "materials": [], // optional list of radiance materials that surfaces
+                reference by name
             "simulation_type": int // value between 0-2
             "rad_parameters": {
                 gridbased_parameters: string //  A standard radiance parameter string
@@ -63,7 +76,9 @@ class GridBased(DaylightCoeffGridBased):
         sky_mtx = SkyMatrix.from_json(rec_json["sky_mtx"])
         analysis_grids = \
             tuple(AnalysisGrid.from_json(ag) for ag in rec_json["analysis_grids"])
-        hb_objects = tuple(HBSurface.from_json(srf) for srf in rec_json["surfaces"])
+        materials = HBSurface.materials_from_json(rec_json.get("materials", ()))
+        hb_objects = tuple(HBSurface.from_json(srf, materials)
+                           for srf in rec_json["surfaces"])
         rad_parameters = RfluxmtxParameters.from_json(rec_json["rad_parameters"])
         if 'simulation_type' in rec_json:
             simulation_type = rec_json["simulation_type"]
@@ -166,3 +181,119 @@ class GridBased(DaylightCoeffGridBased):
                     )
 
         return self.analysis_grids
+
+    def annual_metrics(self, da_threshhold=None, udi_min_max=None, occ_schedule=None,
+                       processes=None):
+        """Calculate annual metrics for all the analysis grids without loading the results.
+
+        The merged result file is read once and one line at a time. If NumPy is
+        available the metrics are calculated for chunks of points at once.
+
+        Args:
+            da_threshhold: Threshhold for daylight autonomy in lux (default: 300).
+            udi_min_max: A tuple of min, max value for useful daylight illuminance
+                (default: (100, 3000)).
+            occ_schedule: An annual occupancy schedule.
+            processes: Number of processes to calculate the metrics for several
+                analysis grids at the same time. Each process reads the rows for its
+                own analysis grid from the result file. The results are returned in
+                the same order as the analysis grids. Requires NumPy (default: None).
+
+        Returns:
+            A generator of (analysis_grid, metrics) for each analysis grid where metrics
+            are lists of Daylight autonomy, Continious daylight autonomy, Useful
+            daylight illuminance, Less than UDI and More than UDI for each point.
+        """
+        assert len(self._result_files) == 1, \
+            ValueError(
+                'Annual recipe can currently only handle '
+                'a single merged result file.'
+        )
+        assert self.simulation_type != 1, \
+            TypeError(
+                'Annual results can only be calculated from '
+                'illuminance studies.')
+
+        da_threshhold = da_threshhold or 300.0
+        udi_min_max = udi_min_max or (100, 3000)
+        occ_schedule = occ_schedule or Schedule.eight_am_to_six_pm()
+        hoys = self.sky_matrix.hoys
+
+        if np is not None and (processes or 1) > 1 and len(self.analysis_grids) > 1:
+            occupied = metrics.occupancy_mask(hoys, occ_schedule)
+            for ag, res in self._parallel_annual_metrics(
+                    self._result_files[0], hoys, occupied, da_threshhold, udi_min_max,
+                    processes):
+                yield ag, res
+            return
+
+        if np is not None:
+            occupied = metrics.occupancy_mask(hoys, occ_schedule)
+            for ag, values in self.result_values(self._result_files[0], hoys):
+                res = ([], [], [], [], [])
+                for chunk in row_chunks(values, len(ag)):
+                    for c, r in enumerate(metrics.annual_metrics(
+                            chunk, occupied, da_threshhold, udi_min_max)):
+                        res[c].extend(r.tolist())
+                yield ag, res
+            return
+
+        calculate_annual_metrics = AnalysisPoint._calculate_annual_metrics
+        for ag, values in self.result_values(self._result_files[0], hoys):
+            res = ([], [], [], [], [])
+            for point_values in values:
+                for c, r in enumerate(
+                    calculate_annual_metrics(point_values, hoys, da_threshhold,
+                                             udi_min_max, None, occ_schedule)):
+                    res[c].append(r)
+            yield ag, res
+
+    def _parallel_annual_metrics(self, file_path, hoys, occupied, da_threshhold,
+                                 udi_min_max, processes):
+        """Calculate annual metrics for each analysis grid in a process pool."""
+        import multiprocessing
+
+        if os.path.getsize(file_path) < 2:
+            raise EmptyFileError(file_path)
+
+        index = matrix_index(file_path)
+        assert index.header.ncols is None or index.header.ncols == len(hoys), \
+            "Number of hours [{}] must match the number of columns [{}]." \
+            .format(len(hoys), index.header.ncols)
+
+        # find where the rows for each grid start once so the processes can move to
+        # their rows without reading the file from the start.
+        tasks = []
+        start_row = 0
+        for ag in self.analysis_grids:
+            tasks.append((file_path, start_row, len(ag), index.row_offset(start_row),
+                          occupied, da_threshhold, udi_min_max))
+            start_row += len(ag)
+
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            # imap returns the results in the same order as analysis grids
+            results = pool.imap(_grid_annual_metrics, tasks)
+            for ag, res in izip(self.analysis_grids, results):
+                yield ag, tuple(r.tolist() for r in res)
+        finally:
+            pool.close()
+            pool.join()
+
+
+def _grid_annual_metrics(task):
+    """Calculate annual metrics for the rows of an analysis grid in a result file.
+
+    This function is called in the worker processes of GridBased.annual_metrics.
+
+    Returns:
+        Arrays of Daylight autonomy, Continious daylight autonomy, Useful daylight
+        illuminance, Less than UDI and More than UDI for each point.
+    """
+    file_path, start_row, count, offset, occupied, da_threshhold, udi_min_max = task
+    res = ([], [], [], [], [])
+    for values in read_row_chunks(file_path, start_row, count, offset=offset):
+        for c, r in enumerate(metrics.annual_metrics(
+                np.trunc(values), occupied, da_threshhold, udi_min_max)):
+            res[c].append(r)
+    return tuple(np.concatenate(r) if r else np.array([]) for r in res)
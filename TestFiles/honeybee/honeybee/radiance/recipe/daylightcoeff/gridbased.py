@@ -28,6 +28,11 @@ class DaylightCoeffGridBased(GenericGridBased):
             should be an instance of RfluxmtxParameters.
         hb_objects: An optional list of Honeybee surfaces or zones (Default: None).
         sub_folder: Analysis subfolder for this recipe. (Default: "daylightcoeff").
+        matrix_format: Format of the daylight coefficient and result matrices. Set to
+            'f' or 'd' for binary floats or doubles (Default: None, ASCII).
+        in_process_multiplication: Set to True to multiply the daylight coefficient
+            and sky matrices in Python with NumPy instead of dctimestep and rmtxop
+            (Default: False).
 
 
     Usage:
@@ -69,6 +74,19 @@ class DaylightCoeffGridBased(GenericGridBased):
 
         self.reuse_daylight_mtx = reuse_daylight_mtx
 
+        self.matrix_format = None
+        """Format of the daylight coefficient and result matrices. Set to 'f' or 'd' to
+        write binary floats or doubles which are smaller on disk and are loaded with
+        NumPy (Default: None, ASCII)."""
+
+        self.in_process_multiplication = False
+        """Multiply the daylight coefficient and sky matrices in Python with NumPy
+        after running the commands instead of using dctimestep and rmtxop. The
+        matrices are loaded once and each component is multiplied with BLAS
+        (Default: False)."""
+
+        self._matrix_calculations = []
+
     @classmethod
     def from_json(cls, rec_json):
         """Create daylight coefficient recipe from JSON file
@@ -78,6 +96,8 @@ class DaylightCoeffGridBased(GenericGridBased):
             "sky_mtx": {}, // sky matrix json file
             "analysis_grids": [], // list of analysis grids
             "surfaces": [], // list of honeybee surfaces
+            "materials": [], // optional list of radiance materials that surfaces
+                reference by name
             "simulation_type": int // value between 0-2
             "rad_parameters": {} // radiance gridbased parameters json file
             }
@@ -85,7 +105,9 @@ class DaylightCoeffGridBased(GenericGridBased):
         sky_mtx = SkyMatrix.from_json(rec_json["sky_mtx"])
         analysis_grids = \
             tuple(AnalysisGrid.from_json(ag) for ag in rec_json["analysis_grids"])
-        hb_objects = tuple(HBSurface.from_json(srf) for srf in rec_json["surfaces"])
+        materials = HBSurface.materials_from_json(rec_json.get("materials", ()))
+        hb_objects = tuple(HBSurface.from_json(srf, materials)
+                           for srf in rec_json["surfaces"])
         rad_parameters = RfluxmtxParameters.from_json(rec_json["rad_parameters"])
         simulation_type = rec_json["simulation_type"]
 
@@ -229,22 +251,25 @@ class DaylightCoeffGridBased(GenericGridBased):
         cmd = ['echo ' + c if c[:2] == '::' else c for c in cmd]
         return ['@echo off'] + cmd
 
-    def _add_commands(self, skycommands, commands):
+    def _add_commands(self, skycommands, commands, calculations=()):
         """Check if the commands should be added to self._commands."""
         if self.reuse_daylight_mtx:
             if not skycommands:
                 for f in self._result_files:
                     if not os.path.isfile(f):
                         self._commands.extend(commands)
+                        self._matrix_calculations.extend(calculations)
                         break
             else:
                 # there are changes in the sky.
                 # matrices multiplication needs to be recalculated.
                 self._commands.extend(commands)
+                self._matrix_calculations.extend(calculations)
         else:
             # there are changes in the sky.
             # matrices multiplication needs to be recalculated.
             self._commands.extend(commands)
+            self._matrix_calculations.extend(calculations)
 
     def to_json(self):
         """Create daylight coefficient JSON file
@@ -313,10 +338,13 @@ class DaylightCoeffGridBased(GenericGridBased):
         # for each window group - calculate total, direct and direct-analemma results
         # calculate the contribution of glazing if any with all window groups blacked
         inputfiles = opqfiles, glzfiles, wgsfiles, extrafiles
+        calculations = [] if self.in_process_multiplication else None
         commands, results = get_commands_scene_daylight_coeff(
             project_name, self.sky_matrix.sky_density, project_folder, skyfiles,
             inputfiles, points_file, self.total_point_count, self.radiance_parameters,
-            self.reuse_daylight_mtx, self.total_runs_count, transpose=transpose)
+            self.reuse_daylight_mtx, self.total_runs_count, transpose=transpose,
+            num_processors=self.num_processors, matrix_format=self.matrix_format,
+            calculations=calculations)
 
         self._result_files.extend(
             # os.path.join(project_folder, str(result)) for result in results :: this was removed and replaced with below to fix file reference error!
@@ -324,17 +352,20 @@ class DaylightCoeffGridBased(GenericGridBased):
             results
         )
 
-        self._add_commands(skycommands, commands)
+        self._add_commands(skycommands, commands, calculations or ())
 
         if self.window_groups:
             # calculate the contribution for all window groups
+            calculations = [] if self.in_process_multiplication else None
             commands, results = get_commands_w_groups_daylight_coeff(
                 project_name, self.sky_matrix.sky_density, project_folder,
                 self.window_groups, skyfiles, inputfiles, points_file,
                 self.total_point_count, self.radiance_parameters,
-                self.reuse_daylight_mtx, self.total_runs_count, transpose=transpose)
+                self.reuse_daylight_mtx, self.total_runs_count, transpose=transpose,
+                num_processors=self.num_processors, matrix_format=self.matrix_format,
+                calculations=calculations)
 
-            self._add_commands(skycommands, commands)
+            self._add_commands(skycommands, commands, calculations or ())
             self._result_files.extend(
                 os.path.join(project_folder, str(result)) for result in results
             )
@@ -347,6 +378,28 @@ class DaylightCoeffGridBased(GenericGridBased):
 
         return batch_file
 
+    def run(self, command_file, debug=False, env=None):
+        """Run the analysis.
+
+        If in_process_multiplication is True the matrices are multiplied in Python
+        once the commands are finished. An IOError is raised if any of the matrices
+        are missing or empty because the commands have failed.
+        """
+        super(DaylightCoeffGridBased, self).run(command_file, debug, env)
+        # total, direct and sun matrices of each calculation
+        missing = [f for calculation in self._matrix_calculations
+                   for matrices in calculation.args[1:4] if matrices
+                   for f in matrices
+                   if not os.path.isfile(f) or not os.path.getsize(f)]
+        if missing:
+            raise IOError(
+                'Failed to find the matrices to multiply. Check the output of {}:'
+                '\n{}'.format(command_file, '\n'.join(sorted(set(missing)))))
+        for calculation in self._matrix_calculations:
+            print('Calculating {}'.format(calculation.args[0]))
+            calculation()
+        return True
+
     def results(self):
         """Return results for this analysis."""
         assert self._isCalculated, \
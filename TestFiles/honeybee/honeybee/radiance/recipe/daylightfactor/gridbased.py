@@ -41,6 +41,8 @@ class GridBased(PITGridBased):
             "type": "gridbased",
             "analysis_grids": [], // list of analysis grids
             "surfaces": [], // list of honeybee surfaces
+            "materials": [], // optional list of radiance materials that surfaces
+                reference by name
             "rad_parameters": {
                 gridbased_parameters: string //  A standard radiance parameter string
                 (e.g. -ab 5 -aa 0.05 -ar 128)
@@ -49,7 +51,9 @@ class GridBased(PITGridBased):
         """
         analysis_grids = tuple(AnalysisGrid.from_json(ag)
                                for ag in rec_json["analysis_grids"])
-        hb_objects = tuple(HBSurface.from_json(srf) for srf in rec_json["surfaces"])
+        materials = HBSurface.materials_from_json(rec_json.get("materials", ()))
+        hb_objects = tuple(HBSurface.from_json(srf, materials)
+                           for srf in rec_json["surfaces"])
         rad_parameters = RtraceParameters.from_json(rec_json["rad_parameters"])
 
         recipe = cls(analysis_grids=analysis_grids, rad_parameters=rad_parameters,
@@ -135,6 +139,20 @@ class GridBased(PITGridBased):
 
         return self.analysis_grids
 
+    def daylight_factors(self):
+        """Return daylight factor values without loading them to the analysis grids.
+
+        Returns:
+            A generator of (analysis_grid, values) for each analysis grid where values
+            is a list of daylight factors for each point.
+        """
+        # all the results will be divided by this value to calculated the percentage
+        div = self.SKYILLUM / 100.0
+
+        for ag, values in self.result_values(self._result_files, header=False,
+                                             mode=div):
+            yield ag, [v[0] for v in values]
+
     def __repr__(self):
         """Represent grid based recipe."""
         return "%s: Daylight Factor\n#PointGroups: %d #Points: %d" % \
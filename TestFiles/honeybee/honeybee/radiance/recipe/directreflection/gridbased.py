@@ -63,6 +63,8 @@ class DirectReflectionGridBased(SolarAccessGridBased):
               "location": null, // a honeybee location - see below
               "hoys": [], // list of hours of the year
               "surfaces": [], // list of honeybee surfaces
+              "materials": [], // optional list of radiance materials that surfaces
+                  reference by name
               "analysis_grids": [] // list of analysis grids
               "sun_vectors": [] // list of sun vectors if location is not provided
             }
@@ -80,7 +82,9 @@ class DirectReflectionGridBased(SolarAccessGridBased):
 
         analysis_grids = \
             tuple(AnalysisGrid.from_json(ag) for ag in rec_json["analysis_grids"])
-        hb_objects = tuple(HBSurface.from_json(srf) for srf in rec_json["surfaces"])
+        materials = HBSurface.materials_from_json(rec_json.get("materials", ()))
+        hb_objects = tuple(HBSurface.from_json(srf, materials)
+                           for srf in rec_json["surfaces"])
         return cls(sun_vectors, hoys, analysis_grids, 1, hb_objects)
 
     @classmethod
@@ -70,6 +70,8 @@ class FivePhaseGridBased(ThreePhaseGridBased):
             "sky_mtx": {}, // sky matrix json file
             "analysis_grids": [], // list of analysis grids
             "surfaces": [], // list of honeybee surfaces
+            "materials": [], // optional list of radiance materials that surfaces
+                reference by name
             "simulation_type": int // value between 0-2
             "view_mtx_parameters": {} // radiance gridbased parameters json file
             "daylight_mtx_parameters": {} //radiance gridbased parameters json file
@@ -78,7 +80,9 @@ class FivePhaseGridBased(ThreePhaseGridBased):
         sky_mtx = SkyMatrix.from_json(rec_json["sky_mtx"])
         analysis_grids = \
             tuple(AnalysisGrid.from_json(ag) for ag in rec_json["analysis_grids"])
-        hb_objects = tuple(HBSurface.from_json(srf) for srf in rec_json["surfaces"])
+        materials = HBSurface.materials_from_json(rec_json.get("materials", ()))
+        hb_objects = tuple(HBSurface.from_json(srf, materials)
+                           for srf in rec_json["surfaces"])
         simulation_type = rec_json["simulation_type"]
 
         view_mtx_parameters = \
@@ -79,6 +79,8 @@ class GridBased(GenericGridBased):
           "type": "gridbased",
           "sky": null, // a honeybee sky
           "surfaces": [], // list of honeybee surfaces
+          "materials": [], // optional list of radiance materials that surfaces
+              reference by name
           "analysis_grids": [] // list of analysis grids
           // [0] illuminance(lux), [1] radiation (kwh), [2] luminance (Candela).
           "analysis_type": 0
@@ -87,7 +89,9 @@ class GridBased(GenericGridBased):
         sky = CIE.from_json(rec_json['sky'])
         analysis_grids = \
             tuple(AnalysisGrid.from_json(ag) for ag in rec_json['analysis_grids'])
-        hb_objects = tuple(HBSurface.from_json(srf) for srf in rec_json['surfaces'])
+        materials = HBSurface.materials_from_json(rec_json.get('materials', ()))
+        hb_objects = tuple(HBSurface.from_json(srf, materials)
+                           for srf in rec_json['surfaces'])
         rad_parameters = RtraceParameters.from_json(rec_json["rad_parameters"])
         return cls(sky, analysis_grids, rec_json['analysis_type'], rad_parameters,
                    hb_objects)
@@ -244,7 +248,8 @@ class GridBased(GenericGridBased):
         # # 4.2.prepare rtrace
         rt = Rtrace('result/' + project_name,
                     simulation_type=self.simulation_type,
-                    radiance_parameters=self.radiance_parameters)
+                    radiance_parameters=self.radiance_parameters,
+                    num_processors=self.num_processors)
         rt.radiance_parameters.h = True
         rt.octree_file = str(oc.output_file)
         rt.points_file = self.relpath(points_file, project_folder)
@@ -56,13 +56,17 @@ class GridBased(DaylightCoeffGridBased):
             "sky_mtx": {}, // sky matrix json file
             "analysis_grids": [], // list of analysis grids
             "surfaces": [], // list of honeybee surfaces
+            "materials": [], // optional list of radiance materials that surfaces
+                reference by name
             "rad_parameters": {} // radiance gridbased parameters json file
             }
         """
         sky_mtx = SkyMatrix.from_json(rec_json["sky_mtx"])
         analysis_grids = \
             tuple(AnalysisGrid.from_json(ag) for ag in rec_json["analysis_grids"])
-        hb_objects = tuple(HBSurface.from_json(srf) for srf in rec_json["surfaces"])
+        materials = HBSurface.materials_from_json(rec_json.get("materials", ()))
+        hb_objects = tuple(HBSurface.from_json(srf, materials)
+                           for srf in rec_json["surfaces"])
 
         rad_parameters = RfluxmtxParameters.from_json(rec_json["rad_parameters"])
 
@@ -185,7 +189,8 @@ class GridBased(DaylightCoeffGridBased):
             project_name, self.sky_matrix.sky_density, project_folder, skyfiles,
             inputfiles, points_file, self.total_point_count, self.radiance_parameters,
             self.reuse_daylight_mtx, self.total_runs_count, radiation_only=True,
-            transpose=transpose, simplified=simplified)
+            transpose=transpose, simplified=simplified,
+            num_processors=self.num_processors, matrix_format=self.matrix_format)
 
         self._result_files.extend(
             os.path.join(project_folder, str(result)) for result in results
@@ -200,7 +205,8 @@ class GridBased(DaylightCoeffGridBased):
                 self.window_groups, skyfiles, inputfiles, points_file,
                 self.total_point_count, self.radiance_parameters,
                 self.reuse_daylight_mtx, self.total_runs_count, radiation_only=True,
-                transpose=transpose)
+                transpose=transpose, num_processors=self.num_processors,
+                matrix_format=self.matrix_format)
 
             self._add_commands(skycommands, commands)
             self._result_files.extend(
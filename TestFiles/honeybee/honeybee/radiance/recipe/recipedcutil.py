@@ -4,6 +4,7 @@ from ..command.rfluxmtx import Rfluxmtx
 from ..command.dctimestep import Dctimestep
 from ..command.rmtxop import Rmtxop, RmtxopMatrix
 from ..command.gendaymtx import Gendaymtx
+from ..matrixcalc import calculate_daylight_coeff
 from ..sky.sunmatrix import SunMatrix
 from ..sky.analemma import AnalemmaReversed as Analemma
 from ..command.oconv import Oconv
@@ -17,6 +18,7 @@ from .parameters import get_radiance_parameters_grid_based, \
 
 import os
 from collections import namedtuple
+from functools import partial
 
 
 def write_rad_files_daylight_coeff(working_dir, project_name, opq, glz, wgs):
@@ -130,9 +132,12 @@ def get_commands_sky(project_folder, sky_matrix, reuse=True):
     sm = SunMatrix(sky_matrix.wea, sky_matrix.north, sky_matrix.hoys,
                    sky_matrix.sky_type, suffix=sky_matrix.suffix)
 
+    # analemma can only be reused if it was written for the same hours as sun matrix
+    reuse_analemma = reuse and \
+        sm.hours_match(os.path.join(project_folder, 'sky', sm.name + '.hrs'))
     analemma_mtx = sm.execute(os.path.join(project_folder, 'sky'), reuse=reuse)
     ann = Analemma.from_wea(sky_matrix.wea, sky_matrix.hoys, sky_matrix.north)
-    ann.execute(os.path.join(project_folder, 'sky'))
+    ann.execute(os.path.join(project_folder, 'sky'), reuse=reuse_analemma)
     sunlist = os.path.join('.', 'sky', ann.sunlist_file)
     analemma = os.path.join(project_folder + '/sky', ann.analemma_file)
 
@@ -183,9 +188,11 @@ def get_commands_radiation_sky(project_folder, sky_matrix, reuse=True, simplifie
         # # 2.2. Create sun matrix
         sm = SunMatrix(sky_matrix.wea, sky_matrix.north, sky_matrix.hoys,
                        sky_matrix.sky_type, suffix=sky_matrix.suffix)
+        reuse_analemma = reuse and \
+            sm.hours_match(os.path.join(project_folder, 'sky', sm.name + '.hrs'))
         analemma_mtx = sm.execute(os.path.join(project_folder, 'sky'), reuse=reuse)
         ann = Analemma.from_wea(sky_matrix.wea, sky_matrix.hoys, sky_matrix.north)
-        ann.execute(os.path.join(project_folder, 'sky'))
+        ann.execute(os.path.join(project_folder, 'sky'), reuse=reuse_analemma)
         sunlist = os.path.join('.', 'sky', ann.sunlist_file)
         analemma = os.path.join(project_folder + '/sky', ann.analemma_file)
 
@@ -201,7 +208,8 @@ def get_commands_radiation_sky(project_folder, sky_matrix, reuse=True, simplifie
 def get_commands_scene_daylight_coeff(
         project_name, sky_density, project_folder, skyfiles, inputfiles,
         points_file, total_point_count, rfluxmtx_parameters, reuse_daylight_mtx=False,
-        total_count=1, radiation_only=False, transpose=False, simplified=False):
+        total_count=1, radiation_only=False, transpose=False, simplified=False,
+        num_processors=None, matrix_format=None, calculations=None):
     """Get commands for the static windows in the scene.
 
     Use get_commands_w_groups_daylight_coeff to get the commands for the rest of the
@@ -223,6 +231,15 @@ def get_commands_scene_daylight_coeff(
         rfluxmtx_parameters: An instance of rfluxmtx_parameters for daylight matrix.
         reuse_daylight_mtx: A boolean not to include the commands for daylight matrix
             calculation if they already exist inside the folder.
+        num_processors: Number of processes for rfluxmtx and rcontrib to run on
+            (Default: None).
+        matrix_format: Format of the daylight coefficient and result matrices. Use
+            'f' for binary floats and 'd' for binary doubles (Default: None, ASCII).
+        calculations: An optional list to multiply the matrices in Python. The
+            commands for dctimestep and rmtxop are not added and a calculation for
+            each state is appended to the list instead. Call each calculation after
+            running the commands to write the results. Simplified studies are always
+            calculated with the commands (Default: None).
     """
     # unpack inputs
     opqfiles, glzfiles, wgsfiles, extrafiles = inputfiles
@@ -244,7 +261,9 @@ def get_commands_scene_daylight_coeff(
         project_name, sky_density, project_folder, window_group, skyfiles,
         inputfiles, points_file, total_point_count, blkmaterial, wgsblacked,
         rfluxmtx_parameters, 0, window_groupfiles, reuse_daylight_mtx, (1, total_count),
-        radiation_only=radiation_only, transpose=transpose, simplified=simplified)
+        radiation_only=radiation_only, transpose=transpose, simplified=simplified,
+        num_processors=num_processors, matrix_format=matrix_format,
+        calculations=calculations)
 
     return commands, results
 
@@ -252,7 +271,8 @@ def get_commands_scene_daylight_coeff(
 def get_commands_w_groups_daylight_coeff(
         project_name, sky_density, project_folder, window_groups, skyfiles, inputfiles,
         points_file, total_point_count, rfluxmtx_parameters, reuse_daylight_mtx=False,
-        total_count=1, radiation_only=False, transpose=False):
+        total_count=1, radiation_only=False, transpose=False, num_processors=None,
+        matrix_format=None, calculations=None):
     """Get commands for the static windows in the scene.
 
     Use get_commands_w_groups_daylight_coeff to get the commands for the rest of the
@@ -275,6 +295,14 @@ def get_commands_w_groups_daylight_coeff(
         rfluxmtx_parameters: An instance of rfluxmtx_parameters for daylight matrix.
         reuse_daylight_mtx: A boolean not to include the commands for daylight matrix
             calculation if they already exist inside the folder.
+        num_processors: Number of processes for rfluxmtx and rcontrib to run on
+            (Default: None).
+        matrix_format: Format of the daylight coefficient and result matrices. Use
+            'f' for binary floats and 'd' for binary doubles (Default: None, ASCII).
+        calculations: An optional list to multiply the matrices in Python. The
+            commands for dctimestep and rmtxop are not added and a calculation for
+            each state is appended to the list instead. Call each calculation after
+            running the commands to write the results (Default: None).
     """
     # unpack inputs
     opqfiles, glzfiles, wgsfiles, extrafiles = inputfiles
@@ -296,7 +324,9 @@ def get_commands_w_groups_daylight_coeff(
             inputfiles, points_file, total_point_count, blkmaterial, wgsblacked,
             rfluxmtx_parameters, count, window_groupfiles=None,
             reuse_daylight_mtx=reuse_daylight_mtx, counter=(counter, total_count),
-            radiation_only=radiation_only, transpose=transpose)
+            radiation_only=radiation_only, transpose=transpose,
+            num_processors=num_processors, matrix_format=matrix_format,
+            calculations=calculations)
 
         commands.extend(cmds)
         results.extend(res)
@@ -308,7 +338,8 @@ def _get_commands_daylight_coeff(
         project_name, sky_density, project_folder, window_group, skyfiles, inputfiles,
         points_file, total_point_count, blkmaterial, wgsblacked, rfluxmtx_parameters,
         window_group_count=0, window_groupfiles=None, reuse_daylight_mtx=False,
-        counter=None, radiation_only=False, transpose=False, simplified=False):
+        counter=None, radiation_only=False, transpose=False, simplified=False,
+        num_processors=None, matrix_format=None, calculations=None):
     """Get commands for the daylight coefficient recipe.
 
     This function is used by get_commands_scene_daylight_coeff and
@@ -394,7 +425,7 @@ def _get_commands_daylight_coeff(
             rflux = coeff_matrix_commands(
                 d_matrix, os.path.relpath(receiver, project_folder), rad_files, sender,
                 os.path.relpath(points_file, project_folder), total_point_count,
-                rfluxmtx_parameters
+                rfluxmtx_parameters, num_processors, matrix_format
             )
             commands.append(rflux.to_rad_string())
 
@@ -415,7 +446,8 @@ def _get_commands_daylight_coeff(
                     d_matrix_direct, os.path.relpath(receiver, project_folder),
                     rad_files_blacked, sender,
                     os.path.relpath(points_file, project_folder),
-                    total_point_count, rfluxmtx_parameters
+                    total_point_count, rfluxmtx_parameters, num_processors,
+                    matrix_format
                 )
                 commands.append(rflux_direct.to_rad_string())
                 rfluxmtx_parameters.ambient_bounces = original_value
@@ -429,7 +461,8 @@ def _get_commands_daylight_coeff(
                 sun_commands = sun_coeff_matrix_commands(
                     sun_matrix, os.path.relpath(points_file, project_folder),
                     rad_files_blacked, os.path.relpath(analemma, project_folder),
-                    sunlist, rfluxmtx_parameters.irradiance_calc
+                    sunlist, rfluxmtx_parameters.irradiance_calc, num_processors,
+                    matrix_format
                 )
 
                 commands.extend(cmd.to_rad_string() for cmd in sun_commands)
@@ -437,6 +470,35 @@ def _get_commands_daylight_coeff(
             commands.append(':: :: 1. reusing daylight matrices')
             commands.append('::')
 
+        if calculations is not None and not simplified:
+            # matrices are multiplied in Python after running the commands
+            output = os.path.join(
+                project_folder,
+                'result/{}..{}.ill'.format(window_group.name, state.name))
+            sun_output = os.path.join(
+                project_folder,
+                'result/sun..{}..{}.ill'.format(window_group.name, state.name))
+            if radiation_only:
+                total = (d_matrix, sky_mtxDiff)
+                direct = None
+            else:
+                total = (d_matrix, sky_mtx_total)
+                direct = tuple(os.path.join(project_folder, f)
+                               for f in (d_matrix_direct, sky_mtx_direct))
+            total = tuple(os.path.join(project_folder, f) for f in total)
+            sun = (os.path.join(project_folder, sun_matrix), analemmaMtx)
+
+            commands.append(':: :: 2. matrix multiplication is calculated in Python')
+            commands.append(
+                ':: end of calculation for {}, {}'.format(window_group.name, state.name))
+            commands.append('::')
+            commands.append('::')
+            calculations.append(partial(
+                calculate_daylight_coeff, output, total, direct, sun, sun_output,
+                matrix_format, transpose))
+            result_files.append(output)
+            continue
+
         commands.append(':: :: 2. matrix multiplication')
         commands.append('::')
         if simplified:
@@ -450,7 +512,7 @@ def _get_commands_daylight_coeff(
                                                                             rsky_type))
             dct_total = matrix_calculation(
                 'tmp/{}..{}..{}.rgb'.format(rsky_type, window_group.name, state.name),
-                d_matrix=d_matrix, sky_matrix=sky_mtxDiff
+                d_matrix=d_matrix, sky_matrix=sky_mtxDiff, output_format=matrix_format
             )
         else:
             commands.append(':: :: [1/3] calculating daylight mtx * total sky')
@@ -459,7 +521,8 @@ def _get_commands_daylight_coeff(
 
             dct_total = matrix_calculation(
                 'tmp/total..{}..{}.rgb'.format(window_group.name, state.name),
-                d_matrix=d_matrix, sky_matrix=sky_mtx_total
+                d_matrix=d_matrix, sky_matrix=sky_mtx_total,
+                output_format=matrix_format
             )
 
         commands.append(dct_total.to_rad_string())
@@ -472,7 +535,7 @@ def _get_commands_daylight_coeff(
             finalmtx = rgb_matrix_file_to_ill(
                 (dct_total.output_file,),
                 'result/{}..{}..{}.ill'.format(rsky_type, window_group.name, state.name),
-                transpose
+                transpose, matrix_format
             )
         else:
             commands.append(
@@ -481,7 +544,7 @@ def _get_commands_daylight_coeff(
             finalmtx = rgb_matrix_file_to_ill(
                 (dct_total.output_file,),
                 'result/total..{}..{}.ill'.format(window_group.name, state.name),
-                transpose
+                transpose, matrix_format
             )
 
         commands.append('::')
@@ -496,7 +559,8 @@ def _get_commands_daylight_coeff(
 
             dct_direct = matrix_calculation(
                 'tmp/direct..{}..{}.rgb'.format(window_group.name, state.name),
-                d_matrix=d_matrix_direct, sky_matrix=sky_mtx_direct
+                d_matrix=d_matrix_direct, sky_matrix=sky_mtx_direct,
+                output_format=matrix_format
             )
             commands.append(dct_direct.to_rad_string())
             commands.append(
@@ -507,7 +571,7 @@ def _get_commands_daylight_coeff(
             finalmtx = rgb_matrix_file_to_ill(
                 (dct_direct.output_file,),
                 'result/direct..{}..{}.ill'.format(window_group.name, state.name),
-                transpose
+                transpose, matrix_format
             )
             commands.append(finalmtx.to_rad_string())
 
@@ -523,7 +587,8 @@ def _get_commands_daylight_coeff(
             dct_sun = sun_matrix_calculation(
                 'tmp/sun..{}..{}.rgb'.format(window_group.name, state.name),
                 dc_matrix=sun_matrix,
-                sky_matrix=os.path.relpath(analemmaMtx, project_folder)
+                sky_matrix=os.path.relpath(analemmaMtx, project_folder),
+                output_format=matrix_format
             )
             commands.append(dct_sun.to_rad_string())
 
@@ -535,7 +600,7 @@ def _get_commands_daylight_coeff(
             finalmtx = rgb_matrix_file_to_ill(
                 (dct_sun.output_file,),
                 'result/sun..{}..{}.ill'.format(window_group.name, state.name),
-                transpose
+                transpose, matrix_format
             )
             commands.append(finalmtx.to_rad_string())
 
@@ -549,7 +614,8 @@ def _get_commands_daylight_coeff(
                 fmtx = final_matrix_addition_radiation(
                     'result/diffuse..{}..{}.ill'.format(window_group.name, state.name),
                     'result/sun..{}..{}.ill'.format(window_group.name, state.name),
-                    'result/{}..{}.ill'.format(window_group.name, state.name)
+                    'result/{}..{}.ill'.format(window_group.name, state.name),
+                    matrix_format
                 )
                 commands.append(fmtx.to_rad_string())
             else:
@@ -562,7 +628,8 @@ def _get_commands_daylight_coeff(
                     'result/total..{}..{}.ill'.format(window_group.name, state.name),
                     'result/direct..{}..{}.ill'.format(window_group.name, state.name),
                     'result/sun..{}..{}.ill'.format(window_group.name, state.name),
-                    'result/{}..{}.ill'.format(window_group.name, state.name)
+                    'result/{}..{}.ill'.format(window_group.name, state.name),
+                    matrix_format
                 )
                 commands.append(fmtx.to_rad_string())
 
@@ -683,7 +750,8 @@ def image_based_view_coeff_matrix_commands(
 
 
 def coeff_matrix_commands(output_name, receiver, rad_files, sender, points_file=None,
-                          number_of_points=None, rfluxmtx_parameters=None):
+                          number_of_points=None, rfluxmtx_parameters=None,
+                          num_processors=None, output_format=None):
     """Returns radiance commands to create coefficient matrix.
 
     Args:
@@ -697,6 +765,9 @@ def coeff_matrix_commands(output_name, receiver, rad_files, sender, points_file=
         number_of_points: Number of points in points_file as an integer.
         rfluxmtx_parameters: Radiance parameters for Rfluxmtx command using a
             RfluxmtxParameters instance (Default: None).
+        num_processors: Number of processes for rfluxmtx to run on (Default: None).
+        output_format: Set to 'f' or 'd' to write the matrix as binary floats or
+            doubles (Default: None, ASCII).
     """
     sender = sender or '-'
     rad_files = rad_files or ()
@@ -709,6 +780,10 @@ def coeff_matrix_commands(output_name, receiver, rad_files, sender, points_file=
 
     # -------------- set the parameters ----------------- #
     rfluxmtx.rfluxmtx_parameters = rfluxmtx_parameters
+    rfluxmtx.num_processors = num_processors
+    if output_format:
+        # points are ASCII
+        rfluxmtx.output_data_format = 'a' + output_format
 
     # -------------- set up the sender objects ---------- #
     # '-' in case of view matrix, window group in case of
@@ -774,10 +849,11 @@ def sky_receiver(filepath, density, ground_file_format=None, sky_file_format=Non
 
 
 def matrix_calculation(output, v_matrix=None, t_matrix=None,
-                       d_matrix=None, sky_matrix=None):
+                       d_matrix=None, sky_matrix=None, output_format=None):
     """Get commands for matrix calculation.
 
-    This method sets up a matrix calculations using Dctimestep.
+    This method sets up a matrix calculations using Dctimestep. Set output_format to
+    'f' or 'd' to write the results as binary floats or doubles.
     """
     dct = Dctimestep()
     dct.tmatrix_file = t_matrix
@@ -785,6 +861,7 @@ def matrix_calculation(output, v_matrix=None, t_matrix=None,
     dct.dmatrix_file = d_matrix
     dct.sky_vector_file = sky_matrix
     dct.output_file = output
+    dct.dctimestep_parameters.output_data_format = output_format
     return dct
 
 
@@ -815,20 +892,23 @@ def image_based_view_matrix_calculation(view, wg, state, sky_matrix, extention='
     return dct
 
 
-def sun_matrix_calculation(output, dc_matrix=None, sky_matrix=None):
+def sun_matrix_calculation(output, dc_matrix=None, sky_matrix=None,
+                           output_format=None):
     """Get commands for sun matrix calculation.
 
-    This method sets up a matrix calculations using Dctimestep.
+    This method sets up a matrix calculations using Dctimestep. Set output_format to
+    'f' or 'd' to write the results as binary floats or doubles.
     """
     dct = Dctimestep()
     dct.daylight_coeff_spec = dc_matrix
     dct.sky_vector_file = sky_matrix
     dct.output_file = output
+    dct.dctimestep_parameters.output_data_format = output_format
     return dct
 
 
 def sun_coeff_matrix_commands(output, point_file, scene_files, analemma, sunlist,
-                              irradiance_calc):
+                              irradiance_calc, num_processors=None, output_format=None):
     """Return commands for calculating analemma coefficient.
 
     Args:
@@ -841,6 +921,9 @@ def sun_coeff_matrix_commands(output, point_file, scene_files, analemma, sunlist
             values.
         sunlist: Path to sunlist. Use sun_matrix to generate sunlist.
         simulation_type:
+        num_processors: Number of processes for rcontrib to run on (Default: None).
+        output_format: Set to 'f' or 'd' to write the coefficients as binary floats
+            or doubles (Default: None, ASCII).
     Returns:
         octree and rcontrib commands ready to be executed.
     """
@@ -852,16 +935,20 @@ def sun_coeff_matrix_commands(output, point_file, scene_files, analemma, sunlist
     rctb_param = get_radiance_parameters_grid_based(0, 1).smtx
     rctb_param.mod_file = sunlist
     rctb_param.irradiance_calc = irradiance_calc
+    if output_format:
+        # points are ASCII
+        rctb_param.output_data_format = 'a' + output_format
 
     rctb = Rcontrib()
     rctb.octree_file = octree.output_file
     rctb.output_file = output
     rctb.points_file = point_file
     rctb.rcontrib_parameters = rctb_param
+    rctb.num_processors = num_processors
     return (octree, rctb)
 
 
-def final_matrix_addition(skymtx, skydirmtx, sunmtx, output):
+def final_matrix_addition(skymtx, skydirmtx, sunmtx, output, output_format=None):
     """Add final sky, direct sky and sun matrix."""
     # Instantiate matrices for subtraction and addition.
     final_matrix = Rmtxop()
@@ -882,11 +969,12 @@ def final_matrix_addition(skymtx, skydirmtx, sunmtx, output):
     # combine the matrices together. Sequence is extremely important
     final_matrix.rmtxop_matrices = [dc_matrix, dc_direct_matrix, sun_coeff_matrix]
     final_matrix.output_file = output
+    final_matrix.rmtxop_parameters.output_format = output_format
 
     return final_matrix
 
 
-def final_matrix_addition_radiation(skydifmtx, sunmtx, output):
+def final_matrix_addition_radiation(skydifmtx, sunmtx, output, output_format=None):
     """Add final diffuse sky and sun matrix."""
     # Instantiate matrices for subtraction and addition.
     final_matrix = Rmtxop()
@@ -902,14 +990,19 @@ def final_matrix_addition_radiation(skydifmtx, sunmtx, output):
     # combine the matrices together. Sequence is extremely important
     final_matrix.rmtxop_matrices = [dc_matrix, sun_coeff_matrix]
     final_matrix.output_file = output
+    final_matrix.rmtxop_parameters.output_format = output_format
 
     return final_matrix
 
 
-def rgb_matrix_file_to_ill(input, output, transpose=False):
-    """Convert rgb values in matrix to illuminance values."""
+def rgb_matrix_file_to_ill(input, output, transpose=False, output_format=None):
+    """Convert rgb values in matrix to illuminance values.
+
+    The values are written as ASCII unless output_format is set to 'f' or 'd' for
+    binary floats or doubles.
+    """
     finalmtx = Rmtxop(matrix_files=input, output_file=output)
-    finalmtx.rmtxop_parameters.output_format = 'a'
+    finalmtx.rmtxop_parameters.output_format = output_format or 'a'
     finalmtx.rmtxop_parameters.combine_values = (47.4, 119.9, 11.6)
     finalmtx.rmtxop_parameters.transpose_matrix = transpose
     return finalmtx
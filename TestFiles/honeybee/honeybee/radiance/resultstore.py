@@ -0,0 +1,379 @@
+# coding=utf-8
+"""Store hourly results for all the analysis points of a grid in arrays.
+
+ResultStore keeps the total and direct values for each state of each source as arrays
+of (points, hours) and each AnalysisPoint only keeps a view to its row of values.
+Values are either copied to float32 arrays which take 4 bytes for an hour of a point
+instead of a dictionary item and a list of Python objects, or are memory-mapped from
+binary result files and are only read from the disk when they are accessed. Values
+which are not loaded are NaN or None and are returned as None.
+
+NumPy is required to use ResultStore.
+"""
+from collections import OrderedDict
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    # IronPython or NumPy is not installed
+    np = None
+
+
+def mode_values(values, mode):
+    """Convert values from a result file based on the loading mode.
+
+    Args:
+        values: An array of values.
+        mode: 0 > truncate the values to integers. 1 > Any non-zero value will be 1.
+            2 > divide the values by mode number.
+    """
+    if mode == 0:
+        return np.trunc(values)
+    elif mode == 1:
+        # binary 0-1 (useful for solaraccess studies)
+        return (values > 0).astype(float)
+    else:
+        # divide values by mode (useful for daylight factor calculation)
+        return values / mode
+
+
+class MappedMatrix(object):
+    """A memory-mapped result matrix which converts the values on access.
+
+    Attributes:
+        matrix: A memory-mapped array of (points, hours).
+        mode: Loading mode for the values. See mode_values (default: 0).
+    """
+
+    __slots__ = ('_matrix', '_mode')
+
+    def __init__(self, matrix, mode=0):
+        self._matrix = matrix
+        self._mode = mode
+
+    @property
+    def shape(self):
+        """Shape of the matrix as (points, hours)."""
+        return self._matrix.shape
+
+    def __len__(self):
+        return len(self._matrix)
+
+    def __getitem__(self, key):
+        return mode_values(np.asarray(self._matrix[key], dtype=float), self._mode)
+
+
+class ResultStore(object):
+    """Total and direct values of analysis points for several sources and states.
+
+    Attributes:
+        point_count: Number of analysis points.
+        hoys: A collection of hours of the year for the values.
+    """
+
+    __slots__ = ('_point_count', '_hoys', '_columns', '_sources', '_values',
+                 '_is_directLoaded')
+
+    def __init__(self, point_count, hoys):
+        """Create an empty result store."""
+        if np is None:
+            raise ImportError('NumPy is required to store the results as arrays.')
+        self._point_count = point_count
+        self._hoys = tuple(hoys)
+        # minute of the year for each hour -> column in the arrays
+        self._columns = dict((int(h * 60), c) for c, h in enumerate(self._hoys))
+
+        # name of sources and their state with the same structure as AnalysisPoint.
+        # This dictionary is shared between the analysis points which use this store.
+        self._sources = OrderedDict()
+
+        # for each source there will be a list with [total, direct] for each state.
+        # Each item is an array of (points, hours) or None if it's not loaded.
+        self._values = []
+        self._is_directLoaded = False
+
+    @property
+    def point_count(self):
+        """Number of analysis points."""
+        return self._point_count
+
+    @property
+    def hoys(self):
+        """Hours of the year for the values."""
+        return self._hoys
+
+    @property
+    def sources(self):
+        """Sources and their states as an OrderedDict."""
+        return self._sources
+
+    @property
+    def has_direct_values(self):
+        """Check if direct values are loaded."""
+        return self._is_directLoaded
+
+    def create_data_structure(self, source, state):
+        """Create place holders for sources and states if needed.
+
+        Returns:
+            source id and state id as a tuple.
+        """
+        if source not in self._sources:
+            self._sources[source] = {
+                'id': len(self._sources),
+                'state': []
+            }
+            self._values.append([])
+
+        sid = self._sources[source]['id']
+
+        if state not in self._sources[source]['state']:
+            self._sources[source]['state'].append(state)
+            self._values[sid].append([None, None])
+
+        stateid = self._sources[source]['state'].index(state)
+
+        return sid, stateid
+
+    def set_values(self, values, source=None, state=None, is_direct=False, start=0):
+        """Copy values for several analysis points to the store.
+
+        Args:
+            values: An array of values (points x hours).
+            source: Name of the source of light (default: None).
+            state: State of the source if any (default: None).
+            is_direct: Set to True if the values are direct contribution of sunlight.
+            start: Index of the first point for values (default: 0).
+        """
+        sid, stateid = self.create_data_structure(source, state)
+        ind = 1 if is_direct else 0
+        matrix = self._values[sid][stateid][ind]
+        if not isinstance(matrix, np.ndarray):
+            matrix = np.full((self._point_count, len(self._hoys)), np.nan,
+                             dtype=np.float32)
+            self._values[sid][stateid][ind] = matrix
+        if is_direct:
+            self._is_directLoaded = True
+        matrix[start:start + len(values)] = values
+
+    def set_matrix(self, matrix, source=None, state=None, is_direct=False, mode=0):
+        """Use a memory-mapped result matrix for the values of all the points.
+
+        The values are not copied and are only read from the file when they are
+        accessed. The file must not be changed while it is used by the store.
+
+        Args:
+            matrix: A memory-mapped array of (points, hours).
+            source: Name of the source of light (default: None).
+            state: State of the source if any (default: None).
+            is_direct: Set to True if the values are direct contribution of sunlight.
+            mode: Loading mode for the values. See mode_values (default: 0).
+        """
+        if matrix.shape != (self._point_count, len(self._hoys)):
+            raise ValueError(
+                'Shape of the matrix {} must be (#points [{}], #hours [{}]).'.format(
+                    matrix.shape, self._point_count, len(self._hoys)))
+        sid, stateid = self.create_data_structure(source, state)
+        if is_direct:
+            self._is_directLoaded = True
+        self._values[sid][stateid][1 if is_direct else 0] = MappedMatrix(matrix, mode)
+
+    def values(self, source_id=0, state_id=0, is_direct=False, points=None,
+               hoys=None):
+        """Get an array of values for a subset of points and hours.
+
+        Only the values for the input points are read from memory-mapped matrices.
+
+        Args:
+            source_id: Id of source as an integer (default: 0).
+            state_id: Id of state as an integer (default: 0).
+            is_direct: Set to True to get the direct values (default: False).
+            points: A slice or a list of indices of analysis points (default: all).
+            hoys: A collection of hours of the year (default: self.hoys).
+
+        Returns:
+            An array of (points, hours).
+        """
+        matrix = self._values[source_id][state_id][1 if is_direct else 0]
+        if matrix is None:
+            raise ValueError(
+                '{} values are not available for source [{}], state [{}].'.format(
+                    'Direct' if is_direct else 'Total', source_id, state_id))
+        values = matrix[slice(None) if points is None else points]
+        if hoys is not None:
+            values = values[:, self._hour_columns(hoys)]
+        return values
+
+    def combined_values(self, blinds_state_ids=None, is_direct=False, points=None,
+                        hoys=None):
+        """Get combined values from all sources based on state ids.
+
+        For each source the hours are grouped by their state and the values for each
+        group of hours are selected from the array of that state at once.
+
+        Args:
+            blinds_state_ids: List of state ids for all the sources for each hour. If
+                you want a source to be removed set the state to -1. Default is the
+                first state for all the sources.
+            is_direct: Set to True to get the direct values. Sources with no direct
+                values are ignored (default: False).
+            points: A slice or a list of indices of analysis points (default: all).
+            hoys: A collection of hours of the year (default: self.hoys).
+
+        Returns:
+            An array of (points, hours).
+        """
+        columns = np.arange(len(self._hoys)) if hoys is None \
+            else self._hour_columns(hoys)
+        hour_count = len(columns)
+        source_count = len(self._values)
+        if blinds_state_ids is None:
+            state_ids = np.zeros((hour_count, source_count), dtype=int)
+        else:
+            state_ids = np.asarray(blinds_state_ids, dtype=int)
+            assert state_ids.shape == (hour_count, source_count), \
+                'There should be a state for each source for each hour. ' \
+                '#states{} != (#hours[{}], #sources[{}])'.format(
+                    state_ids.shape, hour_count, source_count)
+
+        points = slice(None) if points is None else points
+        point_count = np.arange(self._point_count)[points].size
+        ind = 1 if is_direct else 0
+        values = np.zeros((point_count, hour_count))
+        for sid, source_values in enumerate(self._values):
+            ids = state_ids[:, sid]
+            for stateid in np.unique(ids).tolist():
+                if stateid == -1:
+                    # source is removed
+                    continue
+                try:
+                    matrix = source_values[stateid][ind]
+                except IndexError:
+                    raise ValueError(
+                        'Invalid state id for source [{}]: {}'.format(sid, stateid))
+                if matrix is None:
+                    continue
+                state_values = np.asarray(matrix[points], dtype=float)
+                selected = ids == stateid
+                if selected.all():
+                    values += state_values[:, columns]
+                else:
+                    values[:, selected] += state_values[:, columns[selected]]
+        return values
+
+    def value_chunks(self, blinds_state_ids=None, is_direct=False, chunk_size=1000):
+        """Yield arrays of combined values of (points, hours) for chunks of points.
+
+        Args:
+            blinds_state_ids: List of state ids for all the sources for each hour. If
+                you want a source to be removed set the state to -1. Default is the
+                first state for all the sources.
+            is_direct: Set to True to get the direct values. Sources with no direct
+                values are ignored (default: False).
+            chunk_size: Maximum number of points in each array (default: 1000).
+        """
+        for start in xrange(0, self._point_count, chunk_size):
+            points = slice(start, min(start + chunk_size, self._point_count))
+            yield self.combined_values(blinds_state_ids, is_direct, points)
+
+    def _hour_columns(self, hoys):
+        """Get an array of the column for each hour of the year."""
+        try:
+            return np.array([self._columns[int(h * 60)] for h in hoys], dtype=int)
+        except KeyError as e:
+            raise ValueError('Hourly values are not available for {}.'.format(
+                e.args[0] / 60.0))
+
+    def point_values(self, index):
+        """Get a view to the values of an analysis point."""
+        return PointValues(self, index)
+
+    def __repr__(self):
+        return 'ResultStore::#{}::#{}'.format(self._point_count, len(self._hoys))
+
+
+class PointValues(object):
+    """Values of an analysis point in a ResultStore.
+
+    The view has the same structure as the values of an AnalysisPoint which is a list
+    of states for each source with a dictionary of (total, direct) values for each
+    minute of the year.
+    """
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    @property
+    def store(self):
+        """The ResultStore for these values."""
+        return self._store
+
+    @property
+    def index(self):
+        """Index of the analysis point in the store."""
+        return self._index
+
+    def to_list(self):
+        """Copy the values to lists of dictionaries for each state of each source."""
+        return [[dict(state.iteritems()) for state in source] for source in self]
+
+    def __len__(self):
+        return len(self._store._values)
+
+    def __getitem__(self, source_id):
+        store = self._store
+        return [StateValues(total, direct, self._index, store._columns)
+                for total, direct in store._values[source_id]]
+
+    def __iter__(self):
+        for source_id in xrange(len(self)):
+            yield self[source_id]
+
+
+class StateValues(object):
+    """A dictionary-like view to the (total, direct) values of a point for a state."""
+
+    __slots__ = ('_total', '_direct', '_index', '_columns')
+
+    def __init__(self, total, direct, index, columns):
+        self._total = total
+        self._direct = direct
+        self._index = index
+        self._columns = columns
+
+    def keys(self):
+        return self._columns.keys()
+
+    def iteritems(self):
+        total = _row(self._total, self._index)
+        direct = _row(self._direct, self._index)
+        for moy, c in self._columns.iteritems():
+            yield moy, (_value(total, c), _value(direct, c))
+
+    def __contains__(self, moy):
+        return moy in self._columns
+
+    def __getitem__(self, moy):
+        c = self._columns[moy]
+        return _value(self._total, (self._index, c)), \
+            _value(self._direct, (self._index, c))
+
+    def __len__(self):
+        return len(self._columns)
+
+
+def _row(matrix, index):
+    """Get a row of values from a matrix as a list or None if it's not loaded."""
+    return None if matrix is None else matrix[index].tolist()
+
+
+def _value(values, key):
+    """Get a value from an array or a list and replace NaN with None."""
+    if values is None:
+        return None
+    value = float(values[key])
+    return None if math.isnan(value) else value
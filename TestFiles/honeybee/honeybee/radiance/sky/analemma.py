@@ -136,10 +136,20 @@ class Analemma(RadianceSky):
         """Return list of hours for sun vectors."""
         return self._sun_up_hours
 
-    def execute(self, working_dir, reuse=True):
+    def execute(self, working_dir, reuse=False):
+        """Write analemma and sunlist files.
+
+        Args:
+            working_dir: Folder to write the files to.
+            reuse: Reuse the files if already existed in the folder. Only use it
+                if the files were written for the same sun up hours.
+        """
         fp = os.path.join(working_dir, self.analemma_file)  # analemma file (geo and mat)
         sfp = os.path.join(working_dir, self.sunlist_file)  # modifier list
 
+        if reuse and os.path.isfile(fp) and os.path.isfile(sfp):
+            return
+
         with open(fp, 'wb') as outf, open(sfp, 'wb') as outm:
             for hoy, vector in izip(self.sun_up_hours, self.sun_vectors):
                 # use minute of the year to name sun positions
@@ -192,10 +202,20 @@ class AnalemmaReversed(Analemma):
         """
         return 'analemma_reversed.rad'
 
-    def execute(self, working_dir, reuse=True):
+    def execute(self, working_dir, reuse=False):
+        """Write analemma and sunlist files.
+
+        Args:
+            working_dir: Folder to write the files to.
+            reuse: Reuse the files if already existed in the folder. Only use it
+                if the files were written for the same sun up hours.
+        """
         fp = os.path.join(working_dir, self.analemma_file)  # analemma file (geo and mat)
         sfp = os.path.join(working_dir, self.sunlist_file)  # modifier list
 
+        if reuse and os.path.isfile(fp) and os.path.isfile(sfp):
+            return
+
         with open(fp, 'wb') as outf, open(sfp, 'wb') as outm:
             for hoy, vector in izip(self.sun_up_hours, self.sun_vectors):
                 # use minute of the year to name sun positions
@@ -6,6 +6,7 @@ Use this class to create schecules.
 """
 from ladybug.analysisperiod import AnalysisPeriod
 import itertools
+import math
 
 
 class Schedule(object):
@@ -16,7 +17,9 @@ class Schedule(object):
         hoys: List of hours of the year for this values.
     """
 
-    __slots__ = ('_values', '_hoys', '_occupiedHours')
+    __slots__ = ('_values', '_hoys', '_occupiedHours', '_occupancy', '_masks')
+
+    _eight_am_to_six_pm = None  # schedules are immutable. create it once.
 
     def __init__(self, values, hoys=None):
         """Init Schedule."""
@@ -33,9 +36,17 @@ class Schedule(object):
             'Length of values [{}] must be equal to the length of the hours [{}].' \
             .format(len(self._values), len(self._hoys))
 
+        # occupancy for each hour of the year. 1 if the hour is occupied.
+        self._occupancy = bytearray(8760)
+        for h in self._occupiedHours:
+            self._occupancy[int(math.floor(h)) % 8760] = 1
+
+        # occupancy masks for collections of hours
+        self._masks = {}
+
     @classmethod
     def from_workday_hours(cls, occ_hours=None, off_hours=None, weekend=None,
-                           default_value=None):
+                           default_value=None, holidays=None):
         """Create a schedule from Ladybug's AnalysisPeriod.
 
         Args:
@@ -46,6 +57,7 @@ class Schedule(object):
             weekend: A list of numbers to indicate the weekend days. [0] None, [1-7] MON
                 to SUN. Default is 6, 7 (SAT, SUN).
             default_value: Default value for occupancy hours (Default: 1).
+            holidays: A list of days of the year (1-365) that building is unoccupied.
         """
         daily_hours = [0] * 24
         occ_hours = occ_hours or (8, 17)
@@ -61,24 +73,20 @@ class Schedule(object):
             for h in xrange(*off_hours):
                 daily_hours[h] = 0
 
-        # create annual schedule
-        values = [daily_hours[h % 24] for h in xrange(8760)]
-
-        # set the values to 0 for weekendHours
+        # create annual schedule one day at a time
         # assuming the year starts on a Monday
-        if weekend != [0]:
-            for d in xrange(365):
-                if (d + 1) % 8 in weekend:
-                    # set the hours for that day to 0
-                    for h in range(d * 24, (d + 1) * 24):
-                        values[h] = 0
+        off_days = cls._off_days(weekend, holidays)
+        off_day_hours = [0] * 24
+        values = []
+        for d in xrange(365):
+            values.extend(off_day_hours if d in off_days else daily_hours)
 
         hours = xrange(8760)
         return cls(values, hours)
 
     @classmethod
     def from_analysis_period(cls, occ_period=None, off_hours=None, weekend=None,
-                             default_value=None):
+                             default_value=None, holidays=None):
         """Create a schedule from Ladybug's AnalysisPeriod.
 
         Args:
@@ -89,8 +97,9 @@ class Schedule(object):
             weekend: A list of numbers to indicate the weekend days. [0] None, [1-7] MON
                 to SUN. Default is 6, 7 (SAT, SUN).
             default_value: Default value for occupancy hours (Default: 1).
+            holidays: A list of days of the year (1-365) that building is unoccupied.
         """
-        occ_period = occ_period or AnalysisPeriod(stHour=8, endHour=17)
+        occ_period = occ_period or AnalysisPeriod(st_hour=8, end_hour=17)
         off_hours = set(off_hours) if off_hours else set((12, 13))
         weekend = [0] if weekend == [0] else set(weekend) if weekend else set((6, 7))
         default_value = default_value or 1
@@ -102,14 +111,15 @@ class Schedule(object):
                 'occ_period should be an AnalysisPeriod not {}'.format(type(occ_period))
             )
         else:
-            # remove weekends
-            if weekend != [0]:
-                hours = tuple(h for h in hours if ((h % 24) + 1) % 8 not in weekend)
+            # remove weekends and holidays
+            off_days = cls._off_days(weekend, holidays)
+            if off_days:
+                hours = tuple(h for h in hours if int(h // 24) not in off_days)
             # remove off hours
             if off_hours != -1 and off_hours != [-1]:
-                hours = tuple(h for h in hours if h % 24 not in off_hours)
+                hours = tuple(h for h in hours if int(h) % 24 not in off_hours)
 
-            values = tuple(1 for h in hours)
+            values = tuple(default_value for h in hours)
             return cls(values, hours)
 
     @classmethod
@@ -118,7 +128,25 @@ class Schedule(object):
 
         This schedule includes 10 hours per day from 8am to 6pm.
         """
-        return cls.from_workday_hours((8, 18), [-1], [-1])
+        if cls._eight_am_to_six_pm is None:
+            cls._eight_am_to_six_pm = cls.from_workday_hours((8, 18), [-1], [-1])
+        return cls._eight_am_to_six_pm
+
+    @staticmethod
+    def _off_days(weekend, holidays=None):
+        """Return a set of unoccupied days of the year from 0 to 364.
+
+        The year is assumed to start on a Monday.
+        """
+        off_days = set(d - 1 for d in holidays) if holidays else set()
+        if weekend != [0]:
+            off_days.update(d for d in xrange(365) if d % 7 + 1 in weekend)
+        return off_days
+
+    @property
+    def isSchedule(self):
+        """Return True for Schedule."""
+        return True
 
     @property
     def values(self):
@@ -135,6 +163,48 @@ class Schedule(object):
         """Occupied hours of the year as a set."""
         return self._occupiedHours
 
+    def occupancy_mask(self, hoys):
+        """Get a tuple of booleans for occupied hours of the year.
+
+        Each hour is checked against the hour of the year that it falls in so the hours
+        which are shifted to the middle of the hour (e.g. 8.5) are occupied if the
+        schedule is occupied at that hour (e.g. 8). Masks are calculated once for each
+        collection of hours.
+
+        Args:
+            hoys: A collection of hours of the year (e.g. sky matrix hoys).
+        """
+        hoys = tuple(hoys)
+        try:
+            return self._masks[hoys]
+        except KeyError:
+            occupancy = self._occupancy
+            mask = tuple(occupancy[int(math.floor(h)) % 8760] == 1 for h in hoys)
+            self._masks[hoys] = mask
+            return mask
+
+    def _from_occupancy(self, occupancy):
+        """Create an occupied (1) and unoccupied (0) schedule from annual occupancy."""
+        return Schedule(occupancy, xrange(8760))
+
+    def union(self, other):
+        """Schedule which is occupied when either of the schedules are occupied."""
+        return self._from_occupancy(
+            a | b for a, b in itertools.izip(self._occupancy, other._occupancy))
+
+    def intersection(self, other):
+        """Schedule which is occupied when both of the schedules are occupied."""
+        return self._from_occupancy(
+            a & b for a, b in itertools.izip(self._occupancy, other._occupancy))
+
+    def difference(self, other):
+        """Schedule which is occupied when this schedule is occupied and other is not.
+
+        Use this method to remove holidays or other unoccupied periods.
+        """
+        return self._from_occupancy(
+            a & (1 - b) for a, b in itertools.izip(self._occupancy, other._occupancy))
+
     def write(self, file_path):
         """Write the schedule to a csv file."""
         raise NotImplementedError('Write method is not implemented yet!')
@@ -145,6 +215,15 @@ class Schedule(object):
     def __contains__(self, hour):
         return hour in self._occupiedHours
 
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
     def ToString(self):
         """Overwrite .NET ToString."""
         return self.__repr__()
@@ -154,6 +233,18 @@ class Schedule(object):
         return "Schedule[#%d]" % sum(1 if h else 0 for h in self.values)
 
 
+def occupancy_mask(hoys, occ_schedule):
+    """Get a tuple of booleans for occupied hours of the year.
+
+    Args:
+        hoys: A collection of hours of the year (e.g. sky matrix hoys).
+        occ_schedule: A Schedule or a collection of occupied hours.
+    """
+    if hasattr(occ_schedule, 'isSchedule'):
+        return occ_schedule.occupancy_mask(hoys)
+    return tuple(h in occ_schedule for h in hoys)
+
+
 if __name__ == '__main__':
     s = Schedule.from_workday_hours()
     print(s)
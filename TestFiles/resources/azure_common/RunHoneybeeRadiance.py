@@ -1,8 +1,14 @@
 # TODO - Update DF and Annual Radiance simulation parameters for detailed simulation
 
 import argparse
+import hashlib
 import json
+import os
+import shutil
 import sys
+import tempfile
+import threading
+import traceback
 
 sys.path.insert(0, 'ladybug')
 sys.path.insert(0, 'honeybee')
@@ -26,6 +32,108 @@ def load_json(path):
     with open(path) as data_file:
         return json.load(data_file)
 
+
+def start_recipe(recipe, bat_file):
+    """
+    Run a written recipe in the background
+    :type recipe: Honeybee recipe
+    :type bat_file: Path to the batch file the recipe was written to
+    :return: Thread running the recipe, to pass to finish_recipe
+    """
+    if "win" in sys.platform.lower() and "dar" not in sys.platform.lower():
+        command_file = bat_file
+    else:
+        command_file = bat_to_sh(bat_file)
+
+    def run():
+        try:
+            recipe.run(command_file, False)
+        except Exception as e:
+            # Keep the error for finish_recipe, as the thread would only print it
+            traceback.print_exc()
+            thread.error = e
+
+    thread = threading.Thread(target=run)
+    thread.error = None
+    thread.start()
+    return thread
+
+
+def finish_recipe(thread):
+    """
+    Wait for a recipe started by start_recipe to finish, raising the error it failed with
+    :type thread: Thread returned by start_recipe
+    """
+    thread.join()
+    if thread.error is not None:
+        raise thread.error
+
+
+def case_cache_key(surfaces_path, sky_matrix_path, quality):
+    """
+    Get a key identifying the files shared by every analysis grid of a case
+    :type surfaces_path: Path to the context opaque and transparent surfaces JSON file
+    :type sky_matrix_path: Path to the sky matrix JSON file
+    :type quality: Simulation quality
+    :return: SHA-256 hex digest of the surfaces, sky matrix and quality
+    """
+    sha256 = hashlib.sha256()
+    for path in [surfaces_path, sky_matrix_path]:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1048576), b""):
+                sha256.update(block)
+    sha256.update(quality.encode("utf-8"))
+    return sha256.hexdigest()
+
+
+def link_or_copy(source, destination):
+    """
+    Hard link a file to a new path, copying it where hard links are unavailable
+    :type source: Path to the file
+    :type destination: Path to link the file to
+    """
+    try:
+        os.link(source, destination)
+    except (AttributeError, OSError):
+        shutil.copy2(source, destination)
+
+
+def restore_cached_folder(cached_folder, folder):
+    """
+    Populate a folder with the files cached for it by an earlier run
+    :type cached_folder: Path to the cached copy of the folder
+    :type folder: Path to the folder to populate
+    :return: True if the cache held the folder
+    """
+    if not os.path.isdir(cached_folder):
+        return False
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    for name in os.listdir(cached_folder):
+        link_or_copy(os.path.join(cached_folder, name), os.path.join(folder, name))
+    return True
+
+
+def cache_folder(folder, cached_folder):
+    """
+    Publish the files in a folder to the cache, unless a concurrent run has already done so
+    :type folder: Path to the folder to cache
+    :type cached_folder: Path to the cached copy of the folder
+    """
+    cache_directory = os.path.dirname(cached_folder)
+    if not os.path.isdir(cache_directory):
+        try:
+            os.makedirs(cache_directory)
+        except OSError:
+            pass
+    staging_folder = tempfile.mkdtemp(dir=cache_directory)
+    for name in os.listdir(folder):
+        link_or_copy(os.path.join(folder, name), os.path.join(staging_folder, name))
+    try:
+        os.rename(staging_folder, cached_folder)
+    except OSError:
+        shutil.rmtree(staging_folder)
+
 # ************************************************** #
 # ***   Main execution                           *** #
 # ************************************************** #
@@ -36,6 +144,10 @@ if __name__ == "__main__":
     parser.add_argument("-sm", "--skyMatrix", help="Path to the sky matrix")
     parser.add_argument("-s", "--surfaces", help="Path to the context opaque and transparent surfaces")
     parser.add_argument("-q", "--quality", default="low", type=str, help="Simulation quality ['low', 'medium', 'high']")
+    parser.add_argument("-c", "--cache", default=None, type=str, help="Directory in which to share the sky files of a case between the analysis grids simulated on this machine")
+    parser.add_argument("-n", "--processes", default=None, type=int, help="Number of processes for rtrace/rfluxmtx/rcontrib to run on and to calculate the annual metrics of the analysis grids with")
+    parser.add_argument("-mf", "--matrixFormat", default=None, type=str, help="Write the annual matrices as binary floats ['f'] or doubles ['d'] rather than ASCII (needs NumPy to read the results)")
+    parser.add_argument("-mp", "--multiplyInProcess", action="store_true", help="Multiply the annual daylight coefficient and sky matrices with NumPy rather than dctimestep and rmtxop")
     args = parser.parse_args()
 
     # Set file paths
@@ -64,10 +176,11 @@ if __name__ == "__main__":
     surfaces = load_json(surfaces_path)
     print("Context geometry loaded from {0:}\n".format(surfaces_path))
 
-    # Load analysis grids
+    # Load analysis grids (a work unit may hold several grids, or parts of grids)
     analysis_grid = load_json(analysis_grid_path)
-    zone_name = analysis_grid["analysis_grids"][0]["name"]
-    print("Analysis grid_file for {0:} loaded from {1:}\n".format(zone_name, analysis_grid_path))
+    grid_names = [i["name"] for i in analysis_grid["analysis_grids"]]
+    zone_name = grid_names[0]
+    print("Analysis grid_file for {0:} loaded from {1:}\n".format(", ".join(grid_names), analysis_grid_path))
 
     # Set configurations
     annual_config = {"type": "gridbased", "id": "annual", "simulation_type": 0, "rad_parameters": {"gridbased_parameters": quality}}
@@ -76,53 +189,74 @@ if __name__ == "__main__":
     # Prepare Daylight Factor recipe from JSON origin string
     df_recipe_json = {k: v for d in [df_config, analysis_grid, surfaces] for k, v in d.items()}
     df_recipe = GridBased_DaylightFactor.from_json(df_recipe_json)
+    df_recipe.num_processors = args.processes
     print("Daylight Factor recipe prepared\n")
 
     df_bat_file = df_recipe.write(str(df_recipe.analysis_grids[0].name), "daylightfactor")
-    df_shell_file = bat_to_sh(df_bat_file)
     print("Daylight Factor recipe converted to Radiance case\n")
 
-    # Run Daylight Factor simulation
-    if "win" in sys.platform.lower() and "dar" not in sys.platform.lower():
-        df_recipe.run(df_bat_file, False)
-    else:
-        df_recipe.run(df_shell_file, False)
-
     # Prepare Annual recipe from JSON origin string
     annual_recipe_json = {k: v for d in [annual_config, analysis_grid, surfaces, sky_mtx] for k, v in d.items()}
     annual_recipe = GridBased_Annual.from_json(annual_recipe_json)
+    annual_recipe.num_processors = args.processes
+    annual_recipe.matrix_format = args.matrixFormat
+    annual_recipe.in_process_multiplication = args.multiplyInProcess
     print("Annual recipe prepared\n")
 
-    annual_bat_file = annual_recipe.write(str(annual_recipe.analysis_grids[0].name), "annual")
-    annual_shell_file = bat_to_sh(annual_bat_file)
-    print("Annual recipe converted to Radiance case\n")
+    # Reuse the sky matrices, sun matrix and analemma generated by an earlier run of the same case on this machine
+    annual_target_folder = str(annual_recipe.analysis_grids[0].name)
+    annual_sky_folder = os.path.join(annual_target_folder, "annual", annual_recipe.sub_folder, "sky")
+    if args.cache:
+        cached_sky_folder = os.path.join(args.cache, case_cache_key(surfaces_path, sky_matrix_path, args.quality), "annual_sky")
+        if restore_cached_folder(cached_sky_folder, annual_sky_folder):
+            print("Sky files reused from {0:}\n".format(cached_sky_folder))
 
-    # Run Annual simulation
-    if "win" in sys.platform.lower() and "dar" not in sys.platform.lower():
-        annual_recipe.run(annual_bat_file, False)
-    else:
-        annual_recipe.run(annual_shell_file, False)
-
-    # Obtain the x, y, z coordinates for the analysis points
-    x, y, z = [list(elem) for elem in list(zip(*[i["location"] for i in df_recipe.results()[0].to_json()["analysis_points"]]))]
-    print("Analysis point coordinates obtained")
+    annual_bat_file = annual_recipe.write(annual_target_folder, "annual")
+    print("Annual recipe converted to Radiance case\n")
 
-    # Obtain the Daylight Factor values corresponding with the analysis points
-    df = [i["values"][0][0].values()[0][0] for i in df_recipe.results()[0].to_json()["analysis_points"]]
-    print("Daylight Factor results obtained")
+    # Run the independent Daylight Factor and Annual simulations at the same time
+    df_run = start_recipe(df_recipe, df_bat_file)
+    annual_run = start_recipe(annual_recipe, annual_bat_file)
+    print("Daylight Factor and Annual simulations started\n")
 
     # Generate an occupancy schedule for the annual metrics calculation
     occupancy_schedule = Schedule.from_workday_hours(occ_hours=(9, 18), off_hours=(12,), weekend=(6, 7), default_value=1)
     print("Annual occupancy schedule defined\n")
 
-    # Obtain the annual metrics values corresponding with the analysis points
-    da, cda, udi, udi_less, udi_more = annual_recipe.results()[0].annual_metrics(300, (100, 2000), None, occupancy_schedule)
-    print("Daylight autonomy metrics calculated\n")
+    # Obtain the coordinates and Daylight Factor results for each analysis grid whilst the Annual simulation runs on,
+    # keeping the points of all the grids in a single set of columns
+    summary_results = {"name": [], "x": [], "y": [], "z": [], "df": [], "da": [], "cda": [], "udi_less": [],
+                       "udi": [], "udi_more": []}
+    finish_recipe(df_run)
+    for df_grid, df in df_recipe.daylight_factors():
+
+        # Obtain the x, y, z coordinates for the analysis points
+        x, y, z = [list(elem) for elem in zip(*df_grid.points)]
+        print("Analysis point coordinates and Daylight Factor results obtained for {0:}".format(df_grid.name))
+
+        for k, v in zip(["name", "x", "y", "z", "df"], [[df_grid.name] * len(x), x, y, z, df]):
+            summary_results[k].extend(v)
+    finish_recipe(annual_run)
+
+    # Share the sky files once they are complete, so later runs of the case skip generating them
+    if args.cache and not os.path.isdir(cached_sky_folder):
+        sky_files = [os.path.join(annual_sky_folder, i) for i in os.listdir(annual_sky_folder)]
+        if any(i.endswith(".smx") for i in sky_files) and all(os.path.getsize(i) > 0 for i in sky_files):
+            cache_folder(annual_sky_folder, cached_sky_folder)
+            print("Sky files cached in {0:}\n".format(cached_sky_folder))
+
+    # Obtain the annual metrics for each analysis grid, spread over as many processes as the simulation ran on
+    # but merged in the same order as their points
+    annual_metrics = annual_recipe.annual_metrics(300, (100, 2000), occupancy_schedule, processes=args.processes)
+    for annual_grid, (da, cda, udi, udi_less, udi_more) in annual_metrics:
+        print("Daylight autonomy metrics calculated for {0:}\n".format(annual_grid.name))
+
+        for k, v in zip(["da", "cda", "udi_less", "udi", "udi_more"], [da, cda, udi_less, udi, udi_more]):
+            summary_results[k].extend(v)
 
-    # Write the results to a single JSON file
-    summary_results = {"name": zone_name, "x": x, "y": y, "z": z, "df": df, "da": da,
-                       "cda": cda, "udi_less": udi_less,
-                       "udi": udi, "udi_more": udi_more}
+    # A single grid keeps its name as a single value, otherwise each point is labelled with the grid it belongs to
+    if len(grid_names) == 1:
+        summary_results["name"] = zone_name
 
     # Create a location for the results summary to be saved
     results_path = analysis_grid_path.replace(".json", "_result.json")